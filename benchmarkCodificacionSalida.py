@@ -0,0 +1,133 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este script compara las opciones de codificación de los archivos de salida
+(ver "codificacionSalida.py") sobre datos sintéticos con la forma de un año
+de precipitación diaria para Latinoamérica. Para cada opción se muestra el
+tamaño del archivo, el tiempo de escritura, y el tiempo de lectura de una
+serie de tiempo de un punto y de un mapa de una fecha.
+
+No requiere conexión a los servidores ESGF.
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import os
+import time
+import tempfile
+import numpy as np
+import xarray as xr
+from codificacionSalida import escribir_netcdf
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+#--VARIABLES DEFINIDAS POR EL USUARIO--
+
+# Tamaño de los datos sintéticos (tiempos, latitudes, longitudes)
+# (por defecto, un año de datos diarios en una grilla de 0.5° para Latinoamérica)
+tiempos=365
+latitudes=160
+longitudes=120
+
+# Opciones de codificación a comparar (None escribe sin codificación, como antes)
+opciones_a_comparar = {
+    'sin codificación': None,
+    'zlib 1 serie': {'compresion': 'zlib', 'nivel': 1, 'fragmentos': 'serie'},
+    'zlib 4 serie': {'compresion': 'zlib', 'nivel': 4, 'fragmentos': 'serie'},
+    'zlib 4 mapa': {'compresion': 'zlib', 'nivel': 4, 'fragmentos': 'mapa'},
+    'zlib 4 sin shuffle': {'compresion': 'zlib', 'nivel': 4, 'shuffle': False, 'fragmentos': 'serie'},
+    'zlib 4 int16': {'compresion': 'zlib', 'nivel': 4, 'fragmentos': 'serie', 'empaquetar': True},
+    'zstd 3 serie': {'compresion': 'zstd', 'nivel': 3, 'fragmentos': 'serie'},
+}
+
+# Cantidad de repeticiones de cada medición (se toma el menor tiempo)
+repeticiones=3
+
+#--FIN DE LAS VARIABLES DEFINIDAS POR EL USUARIO--
+
+
+def datos_sinteticos(tiempos, latitudes, longitudes, semilla=0):
+    '''
+    Se genera un arreglo con forma de precipitación diaria (muchos ceros y
+    valores positivos sesgados), en float64 como queda a veces al extraerlo.
+    '''
+    generador = np.random.default_rng(semilla)
+    lluvia = generador.gamma(0.6, 4.0, size=(tiempos, latitudes, longitudes))
+    lluvia[generador.random(lluvia.shape) < 0.4] = 0.0
+    return xr.DataArray(
+        lluvia / 86400.0,
+        dims=('time', 'lat', 'lon'),
+        coords={
+            'time': np.arange(tiempos, dtype='float64'),
+            'lat': np.linspace(-60, 20, latitudes),
+            'lon': np.linspace(270, 330, longitudes),
+        },
+        name='pr',
+        attrs={'units': 'kg m-2 s-1'})
+
+
+def medir(funcion, repeticiones):
+    '''
+    Se ejecuta la función varias veces y se devuelve el menor tiempo en segundos.
+    '''
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def comparar(da, opciones_a_comparar, repeticiones, carpeta):
+    '''
+    Se escribe y se lee "da" con cada opción de codificación, y se devuelve
+    una lista con los resultados de cada una.
+    '''
+    resultados = []
+    for nombre, opciones in opciones_a_comparar.items():
+        ruta = os.path.join(carpeta, nombre.replace(' ', '_') + '.nc')
+        try:
+            escritura = medir(lambda: escribir_netcdf(da, ruta, opciones), repeticiones)
+        except Exception as e:
+            print("La opción '"+nombre+"' no está disponible ("+type(e).__name__+": "+str(e)+")")
+            continue
+
+        def leer_serie():
+            with xr.open_dataset(ruta) as ds:
+                ds['pr'].isel(lat=da.sizes['lat'] // 2, lon=da.sizes['lon'] // 2).values
+
+        def leer_mapa():
+            with xr.open_dataset(ruta) as ds:
+                ds['pr'].isel(time=da.sizes['time'] // 2).values
+
+        resultados.append({
+            'opcion': nombre,
+            'megabytes': os.path.getsize(ruta) / 1e6,
+            'escritura_s': escritura,
+            'lectura_serie_s': medir(leer_serie, repeticiones),
+            'lectura_mapa_s': medir(leer_mapa, repeticiones),
+        })
+    return resultados
+
+
+if __name__ == '__main__':
+    da = datos_sinteticos(tiempos, latitudes, longitudes)
+    print("Datos sintéticos: "+str(tiempos)+" tiempos x "+str(latitudes)+" latitudes x "+str(longitudes)
+          +" longitudes ("+f"{da.nbytes / 1e6:.1f}"+" MB en memoria)")
+    with tempfile.TemporaryDirectory() as carpeta:
+        resultados = comparar(da, opciones_a_comparar, repeticiones, carpeta)
+    print(f"{'Opción':<22}{'MB':>9}{'Escritura s':>13}{'Serie s':>10}{'Mapa s':>10}")
+    for resultado in resultados:
+        print(f"{resultado['opcion']:<22}{resultado['megabytes']:>9.2f}{resultado['escritura_s']:>13.3f}"
+              f"{resultado['lectura_serie_s']:>10.4f}{resultado['lectura_mapa_s']:>10.4f}")
@@ -0,0 +1,394 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este script mide la velocidad de la descarga sin depender de los servidores
+del CMIP6, para saber si un cambio en el código hace las descargas más
+rápidas o más lentas. Se generan archivos sintéticos con la forma de los del
+CMIP6 (varios calendarios, tamaños de malla y archivos de varias décadas) y se
+sirven desde un nodo ESGF local (búsqueda, OPeNDAP y HTTP; ver
+"servidorESGFLocal.py"), con la latencia, el ancho de banda y los fallos que
+se definan en cada escenario.
+
+Cada escenario (temporalidad, zona pequeña o grande, uno o varios años) se
+descarga con "descargar_anyos_zonas" (la función que usan los scripts de
+descarga) en un proceso aparte y con un caché vacío, y se mide:
+- la duración y los años descargados por segundo,
+- los MB por segundo enviados por el servidor,
+- la memoria máxima (RSS) del proceso,
+- el tiempo de cada fase (ver "metricasDescarga.py").
+Se mide también el tiempo de arranque de "ejecutarDescargaCMIP6.py".
+
+Los resultados de cada ejecución se agregan como una línea JSON al archivo de
+resultados (por defecto en la subcarpeta "benchmark" del caché de la descarga,
+ver "cacheMetadatos.py") y se comparan con la ejecución anterior (o con la de otro archivo):
+si algún escenario empeora más que el umbral, se indica y el script termina
+con el código 1. Por ejemplo:
+  python benchmarkDescargaCMIP6.py
+  python benchmarkDescargaCMIP6.py --escenarios mon_zona_pequena_1anyo,dia_zona_grande_10anyos
+  python benchmarkDescargaCMIP6.py --comparar-con resultados_referencia.jsonl
+
+No requiere conexión a los servidores ESGF.
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from servidorESGFLocal import ServidorESGFLocal, generar_datos
+from cacheMetadatos import carpeta_cache
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+#--VARIABLES DEFINIDAS POR EL USUARIO--
+
+# Carpeta en la que se guardan los archivos sintéticos (se generan una sola
+# vez; se vuelven a generar si cambian los conjuntos de datos)
+carpeta_datos = os.path.join(tempfile.gettempdir(), 'datos_benchmark_descargaCMIP6')
+
+# Conjuntos de datos sintéticos que sirve el nodo local
+conjuntos_sinteticos = [
+    # Mensual, calendario de 365 días, malla de 1°, archivos de 20 años
+    {'modelo': 'BENCH-MON', 'escenario': 'ssp245', 'variable': 'tas', 'frecuencia': 'mon', 'calendario': 'noleap',
+     'resolucion': 1.0, 'anyoini': 2015, 'anyofin': 2054, 'anyos_por_archivo': 20},
+    # Diario, calendario de 360 días, malla de 2.5°, archivos de 5 años
+    {'modelo': 'BENCH-DAY', 'escenario': 'ssp245', 'variable': 'pr', 'frecuencia': 'day', 'calendario': '360_day',
+     'resolucion': 2.5, 'anyoini': 2015, 'anyofin': 2024, 'anyos_por_archivo': 5},
+    # Diario, calendario estándar (con años bisiestos), malla de 2°, un archivo de 4 años
+    {'modelo': 'BENCH-STD', 'escenario': 'ssp245', 'variable': 'tas', 'frecuencia': 'day', 'calendario': 'standard',
+     'resolucion': 2.0, 'anyoini': 2015, 'anyofin': 2018, 'anyos_por_archivo': 4},
+]
+
+# Zonas de los escenarios (lonmin, lonmax, latmin, latmax)
+zonas = {
+    'pequena': {'ECU': (-82, -75, -5, 2)},
+    'grande': {'LAT': (-120, -30, -60, 30)},
+}
+
+# Condiciones de red por defecto: latencia (segundos antes de cada respuesta),
+# ancho de banda de cada conexión (bytes por segundo, None sin límite) y
+# fracción de las peticiones de datos que fallan
+condiciones_red = {'latencia': 0.0, 'ancho_banda': None, 'fraccion_fallos': 0.0}
+
+# Semilla de los fallos simulados (con la misma semilla fallan siempre las
+# mismas peticiones de cada escenario)
+semilla_fallos = 1
+
+# Escenarios a medir: modelo, temporalidad, años, zona y, si se quiere, las
+# condiciones de red ('red') y las opciones de "descargar_anyos_zonas" ('opciones')
+escenarios = {
+    'mon_zona_pequena_1anyo': {'modelo': 'BENCH-MON', 'anyos': (2030, 2030), 'zona': 'pequena'},
+    'mon_zona_grande_1anyo': {'modelo': 'BENCH-MON', 'anyos': (2030, 2030), 'zona': 'grande'},
+    'mon_zona_grande_40anyos': {'modelo': 'BENCH-MON', 'anyos': (2015, 2054), 'zona': 'grande'},
+    'dia_zona_pequena_1anyo': {'modelo': 'BENCH-DAY', 'anyos': (2020, 2020), 'zona': 'pequena'},
+    'dia_zona_grande_1anyo': {'modelo': 'BENCH-DAY', 'anyos': (2020, 2020), 'zona': 'grande'},
+    'dia_zona_grande_10anyos': {'modelo': 'BENCH-DAY', 'anyos': (2015, 2024), 'zona': 'grande',
+                                'opciones': {'tiempos_por_bloque': 90}},
+    'dia_estandar_zona_grande_4anyos': {'modelo': 'BENCH-STD', 'anyos': (2015, 2018), 'zona': 'grande'},
+    'dia_zona_grande_http': {'modelo': 'BENCH-DAY', 'anyos': (2015, 2019), 'zona': 'grande',
+                             'opciones': {'acceso': 'http'}},
+    'mon_red_lenta_con_fallos': {'modelo': 'BENCH-MON', 'anyos': (2015, 2024), 'zona': 'pequena',
+                                 'red': {'latencia': 0.05, 'ancho_banda': 2e6, 'fraccion_fallos': 0.1}},
+}
+
+# Cantidad de repeticiones de cada escenario (se toma la más rápida) y de la
+# medición del tiempo de arranque
+repeticiones = 3
+repeticiones_arranque = 5
+
+# Archivo en el que se agregan los resultados de cada ejecución (si es None,
+# "resultados_benchmark_descarga.jsonl" en la subcarpeta "benchmark" del caché de
+# la descarga, que se busca al ejecutar el script), cambio
+# relativo a partir del cual se considera que un escenario empeoró, y
+# diferencia de duración (en segundos) por debajo de la cual no se considera
+# (las mediciones muy cortas varían mucho de una ejecución a otra)
+archivo_resultados = None
+umbral_regresion = 0.15
+diferencia_minima_s = 0.05
+
+#--FIN DE LAS VARIABLES DEFINIDAS POR EL USUARIO--
+
+
+# Mediciones que se comparan entre ejecuciones: 1 si es mejor que aumente, -1 si es mejor que baje
+mediciones_comparadas = {'segundos': -1, 'anyos_por_segundo': 1, 'mb_por_segundo': 1, 'rss_max_mb': -1}
+
+carpeta_codigo = Path(__file__).resolve().parent
+
+
+def memoria_maxima_mb():
+    '''
+    Se devuelve la memoria máxima (RSS) que ha usado el proceso, en MB, o None
+    si no se puede medir en este sistema. En Linux se toma de /proc, porque el
+    máximo de "resource" incluye la memoria que usaba el proceso padre al
+    lanzar este proceso.
+    '''
+    try:
+        with open('/proc/self/status', encoding='utf-8') as f:
+            for linea in f:
+                if linea.startswith('VmHWM:'):
+                    return int(linea.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # En Linux se da en kilobytes y en macOS en bytes
+    return maximo / 1024**2 if sys.platform == 'darwin' else maximo / 1024
+
+
+def ejecutar_escenario(parametros):
+    '''
+    (En el proceso hijo) Se descarga un escenario desde el nodo local y se
+    guardan sus mediciones en el archivo parametros['resultado'].
+    '''
+    import descargaCMIP6
+    from metricasDescarga import activar_metricas, leer_metricas
+
+    descargaCMIP6.nodos_esgf = [parametros['url_busqueda']]
+    activar_metricas(parametros['metricas'])
+    anyoini, anyofin = parametros['anyos']
+    inicio = time.perf_counter()
+    generados = descargaCMIP6.descargar_anyos_zonas(
+        parametros['modelo'], parametros['escenario'], parametros['variable'], parametros['frecuencia'],
+        anyoini, anyofin, {nombre: tuple(zona) for nombre, zona in parametros['zonas'].items()},
+        parametros['salida'], **parametros['opciones'])
+    segundos = time.perf_counter() - inicio
+
+    fases = {}
+    for registro in leer_metricas(parametros['metricas']):
+        fases[registro['fase']] = fases.get(registro['fase'], 0.0) + registro['segundos']
+    resultado = {
+        'segundos': segundos,
+        'archivos': len(generados),
+        'mb_salida': sum(os.path.getsize(ruta) for ruta in generados if os.path.isfile(ruta)) / 1e6,
+        'rss_max_mb': memoria_maxima_mb(),
+        'fases_s': {fase: round(total, 4) for fase, total in sorted(fases.items())},
+    }
+    with open(parametros['resultado'], 'w', encoding='utf-8') as f:
+        json.dump(resultado, f)
+
+
+def medir_escenario(nombre, escenario, servidor, carpeta):
+    '''
+    Se descarga un escenario en un proceso aparte, con las condiciones de red
+    del escenario y un caché vacío, y se devuelven sus mediciones.
+    '''
+    conjunto = next(conjunto for conjunto in conjuntos_sinteticos if conjunto['modelo'] == escenario['modelo'])
+    red = dict(condiciones_red, **escenario.get('red', {}))
+    servidor.latencia = red['latencia']
+    servidor.ancho_banda = red['ancho_banda']
+    servidor.fraccion_fallos = red['fraccion_fallos']
+    servidor.reiniciar_contadores()
+
+    carpeta = Path(carpeta) / nombre
+    (carpeta / 'salida').mkdir(parents=True)
+    parametros = {
+        'url_busqueda': servidor.url_busqueda,
+        'modelo': conjunto['modelo'],
+        'escenario': conjunto['escenario'],
+        'variable': conjunto['variable'],
+        'frecuencia': conjunto['frecuencia'],
+        'anyos': list(escenario['anyos']),
+        'zonas': zonas[escenario['zona']],
+        'opciones': escenario.get('opciones', {}),
+        'salida': str(carpeta / 'salida'),
+        'metricas': str(carpeta / 'metricas.jsonl'),
+        'resultado': str(carpeta / 'resultado.json'),
+    }
+    entorno = dict(os.environ, DESCARGACMIP6_CACHE=str(carpeta / 'cache'))
+    entorno.pop('DESCARGACMIP6_METRICAS', None)
+    proceso = subprocess.run([sys.executable, str(Path(__file__).resolve()), '--hijo', json.dumps(parametros)],
+                             cwd=str(carpeta_codigo), env=entorno, capture_output=True, text=True)
+    if proceso.returncode != 0:
+        print("El escenario "+nombre+" terminó con error:\n"+(proceso.stdout + proceso.stderr)[-2000:])
+        return {'error': 'código de salida '+str(proceso.returncode)}
+    with open(parametros['resultado'], encoding='utf-8') as f:
+        resultado = json.load(f)
+
+    anyos = escenario['anyos'][1] - escenario['anyos'][0] + 1
+    megabytes = servidor.contadores['bytes_enviados'] / 1e6
+    resultado.update({
+        'anyos': anyos,
+        'anyos_por_segundo': anyos / resultado['segundos'],
+        'mb_transferidos': megabytes,
+        'mb_por_segundo': megabytes / resultado['segundos'],
+        'peticiones': servidor.contadores['peticiones'],
+        'fallos_simulados': servidor.contadores['fallos_simulados'],
+        'red': red,
+    })
+    return resultado
+
+
+def medir_arranque(repeticiones):
+    '''
+    Se mide (la menor de varias veces) la duración de "ejecutarDescargaCMIP6.py
+    --medir-arranque", desde que se lanza el proceso hasta que termina.
+    '''
+    argumentos = [sys.executable, 'ejecutarDescargaCMIP6.py', '--modelo', 'BENCH-MON', '--escenario', 'ssp245',
+                  '--variable', 'tas', '--frecuencia', 'mon', '--anyos', '2015-2016', '--zona', 'ECU:-82,-75,-5,2',
+                  '--medir-arranque']
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        subprocess.run(argumentos, cwd=str(carpeta_codigo), capture_output=True, check=True)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def version_codigo():
+    '''
+    Se devuelve el commit de git del código medido (o None si no se puede saber).
+    '''
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(carpeta_codigo), capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def leer_resultados(ruta):
+    '''
+    Se leen las ejecuciones guardadas en un archivo de resultados (una por línea).
+    '''
+    ejecuciones = []
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    ejecuciones.append(json.loads(linea))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return ejecuciones
+
+
+def guardar_resultados(ruta, ejecucion):
+    Path(ruta).parent.mkdir(parents=True, exist_ok=True)
+    with open(ruta, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(ejecucion) + '\n')
+
+
+def comparar_ejecuciones(actual, anterior, umbral):
+    '''
+    Se compara cada medición de cada escenario con la de la ejecución
+    anterior. Se devuelve {escenario: {medición: cambio relativo}} y la lista
+    de regresiones (cambios en el sentido malo mayores que el umbral; los
+    cambios de velocidad no se cuentan si la duración cambió menos que
+    "diferencia_minima_s").
+    '''
+    cambios = {}
+    regresiones = []
+    pares = [(nombre, resultado, anterior['escenarios'].get(nombre)) for nombre, resultado in actual['escenarios'].items()]
+    pares.append(('arranque', {'segundos': actual.get('arranque_s')}, {'segundos': anterior.get('arranque_s')}))
+    for nombre, resultado, previo in pares:
+        if not previo or not resultado.get('segundos') or not previo.get('segundos'):
+            continue
+        diferencia = abs(resultado['segundos'] - previo['segundos'])
+        for medicion, sentido in mediciones_comparadas.items():
+            nuevo, viejo = resultado.get(medicion), previo.get(medicion)
+            if not nuevo or not viejo:
+                continue
+            cambio = (nuevo - viejo) / viejo
+            cambios.setdefault(nombre, {})[medicion] = cambio
+            if medicion != 'rss_max_mb' and diferencia < diferencia_minima_s:
+                continue
+            if -sentido * cambio > umbral:
+                regresiones.append(nombre+": "+medicion+" pasó de "+f"{viejo:.3f}"+" a "+f"{nuevo:.3f}"
+                                   +" ("+f"{100 * cambio:+.0f}"+"%)")
+    return cambios, regresiones
+
+
+def mostrar_resultados(ejecucion, cambios):
+    print(f"{'Escenario':<34}{'s':>9}{'años/s':>9}{'MB/s':>9}{'RSS MB':>9}{'Cambio s':>10}")
+    for nombre, resultado in ejecucion['escenarios'].items():
+        if 'error' in resultado:
+            print(f"{nombre:<34}{'error':>9}")
+            continue
+        cambio = cambios.get(nombre, {}).get('segundos')
+        print(f"{nombre:<34}{resultado['segundos']:>9.2f}{resultado['anyos_por_segundo']:>9.2f}"
+              f"{resultado['mb_por_segundo']:>9.1f}{(resultado['rss_max_mb'] or 0):>9.0f}"
+              + (f"{100 * cambio:>+9.0f}%" if cambio is not None else f"{'-':>10}"))
+    print("Arranque de ejecutarDescargaCMIP6.py: "+f"{ejecucion['arranque_s']:.3f}"+" s")
+
+
+def argumentos():
+    parser = argparse.ArgumentParser(description="Medición de la descarga con un nodo ESGF local y datos sintéticos.")
+    parser.add_argument('--escenarios', help="escenarios a medir, separados por comas (por defecto todos)")
+    parser.add_argument('--repeticiones', type=int, default=repeticiones)
+    parser.add_argument('--resultados',
+                        default=archivo_resultados or str(carpeta_cache() / 'benchmark' / 'resultados_benchmark_descarga.jsonl'),
+                        help="archivo JSONL en el que se agregan los resultados")
+    parser.add_argument('--comparar-con', dest='comparar_con',
+                        help="archivo JSONL con la ejecución de referencia (por defecto la anterior de --resultados)")
+    parser.add_argument('--umbral', type=float, default=umbral_regresion)
+    parser.add_argument('--datos', default=carpeta_datos, help="carpeta de los archivos sintéticos")
+    parser.add_argument('--no-guardar', dest='guardar', action='store_false')
+    parser.add_argument('--hijo', help=argparse.SUPPRESS)
+    return parser
+
+
+def principal(argv=None):
+    opciones = argumentos().parse_args(argv)
+    if opciones.hijo:
+        ejecutar_escenario(json.loads(opciones.hijo))
+        return 0
+
+    elegidos = opciones.escenarios.split(',') if opciones.escenarios else list(escenarios)
+    desconocidos = [nombre for nombre in elegidos if nombre not in escenarios]
+    if desconocidos:
+        raise SystemExit("Escenarios desconocidos: "+', '.join(desconocidos)+" (disponibles: "+', '.join(escenarios)+")")
+
+    generar_datos(opciones.datos, conjuntos_sinteticos)
+    ejecucion = {'fecha': datetime.now().isoformat(timespec='seconds'), 'commit': version_codigo(),
+                 'python': platform.python_version(), 'plataforma': platform.platform(), 'escenarios': {}}
+    with ServidorESGFLocal(opciones.datos, semilla=semilla_fallos) as servidor, tempfile.TemporaryDirectory() as carpeta:
+        for nombre in elegidos:
+            mediciones = []
+            for repeticion in range(opciones.repeticiones):
+                print("Escenario "+nombre+" ("+str(repeticion + 1)+"/"+str(opciones.repeticiones)+")")
+                mediciones.append(medir_escenario(nombre, escenarios[nombre], servidor,
+                                                  Path(carpeta) / str(repeticion)))
+            correctas = [medicion for medicion in mediciones if 'error' not in medicion]
+            ejecucion['escenarios'][nombre] = min(correctas, key=lambda medicion: medicion['segundos'],
+                                                  default=mediciones[0])
+    ejecucion['arranque_s'] = medir_arranque(repeticiones_arranque)
+
+    anteriores = leer_resultados(opciones.comparar_con or opciones.resultados)
+    cambios, regresiones = ({}, [])
+    if anteriores:
+        cambios, regresiones = comparar_ejecuciones(ejecucion, anteriores[-1], opciones.umbral)
+    mostrar_resultados(ejecucion, cambios)
+    if anteriores:
+        print("Comparación con la ejecución del "+anteriores[-1]['fecha']+" (commit "+str(anteriores[-1].get('commit'))+")")
+    for regresion in regresiones:
+        print("EMPEORÓ: "+regresion)
+    if opciones.guardar:
+        guardar_resultados(opciones.resultados, ejecucion)
+        print("Resultados agregados a "+opciones.resultados)
+    errores = [nombre for nombre, resultado in ejecucion['escenarios'].items() if 'error' in resultado]
+    return 1 if regresiones or errores else 0
+
+
+if __name__ == '__main__':
+    sys.exit(principal())
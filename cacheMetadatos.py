@@ -0,0 +1,155 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo guarda localmente los resultados de las búsquedas en ESGF
+(identificador y versión del conjunto de datos, y el listado de archivos con
+sus direcciones OPeNDAP y HTTP en cada nodo de datos y su rango de fechas). Como los conjuntos de
+datos del CMIP6 están versionados y cambian muy poco, esto evita repetir en
+cada ejecución el listado de archivos, que es el paso más lento y menos
+confiable de la descarga.
+
+Cada registro se identifica por (proyecto, modelo, escenario, variable,
+temporalidad, miembro del ensamble). Un registro se usa tal cual mientras
+esté vigente; cuando vence, se vuelve a consultar solo el conjunto de datos
+y, si su versión no cambió, se reutiliza el listado de archivos guardado.
+En el modo sin conexión se trabaja únicamente con lo que haya guardado.
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from dataclasses import dataclass, asdict, field
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+def carpeta_cache():
+    '''
+    Se devuelve la carpeta del caché de la descarga, que comparten los
+    registros de búsqueda, la salud de los nodos, los archivos descargados por
+    HTTP, las ventanas de recorte y los pesos de regrillado: la de la variable
+    de entorno DESCARGACMIP6_CACHE o, si no se define, "~/.cache/descargaCMIP6".
+    '''
+    return Path(os.environ.get('DESCARGACMIP6_CACHE', Path.home() / '.cache' / 'descargaCMIP6'))
+
+
+# Carpeta en la que se guardan los registros (si es None, la subcarpeta
+# "metadatos" del caché, que se busca en cada uso), tiempo de vigencia de cada
+# registro (en segundos) y si se trabaja sin conexión (solo con los registros guardados)
+carpeta_metadatos = None
+vigencia_metadatos = 30 * 24 * 3600
+sin_conexion = os.environ.get('DESCARGACMIP6_SIN_CONEXION', '') not in ('', '0')
+
+
+@dataclass
+class ArchivoESGF:
+    '''
+    Datos de un archivo publicado en ESGF. Tiene los mismos nombres de atributos
+    que los resultados de "pyesgf" que usa la descarga ("filename",
+    "opendap_url", "download_url", "checksum", ...), más el rango de fechas
+    del archivo ("inicio" y "fin", tal como aparecen en el nombre, y los años
+    correspondientes). En "replicas" se guardan las copias del mismo archivo
+    publicadas en otros nodos de datos, como diccionarios con sus direcciones
+    'opendap_url' y 'download_url' (ver "replicasESGF.py"), y en "anyos_tiempo"
+    la cantidad de tiempos de cada año en el archivo, [[año, cantidad], ...],
+    una vez que se conoce su coordenada de tiempo (ver "indiceArchivos.py").
+    '''
+    filename: str
+    opendap_url: str = None
+    download_url: str = None
+    checksum: str = None
+    checksum_type: str = None
+    size: int = None
+    inicio: str = None
+    fin: str = None
+    anyoini: int = None
+    anyofin: int = None
+    replicas: list = field(default_factory=list)
+    anyos_tiempo: list = None
+
+
+def clave_busqueda(project, source_id, experiment_id, variable, frequency, variant_label):
+    '''
+    Se arma la clave (y el nombre del archivo) de un registro.
+    '''
+    return '_'.join([project, source_id, experiment_id, variable, frequency, variant_label])
+
+
+def _ruta_registro(clave, carpeta=None):
+    return Path(carpeta or carpeta_metadatos or carpeta_cache() / 'metadatos') / (clave + '.json')
+
+
+def leer_registro(clave, carpeta=None):
+    '''
+    Se lee el registro guardado para la clave dada, con el listado de archivos
+    convertido en objetos "ArchivoESGF". Si no existe o está dañado se devuelve None.
+    '''
+    try:
+        with open(_ruta_registro(clave, carpeta), encoding='utf-8') as f:
+            registro = json.load(f)
+        registro['archivos'] = [ArchivoESGF(**archivo) for archivo in registro['archivos']]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return registro
+
+
+def guardar_registro(clave, dataset_id, version, archivos, carpeta=None, guardado=None):
+    '''
+    Se guarda el registro de una búsqueda (primero en un archivo temporal,
+    que luego se renombra, para no dejarlo a medio escribir).
+    '''
+    ruta = _ruta_registro(clave, carpeta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    registro = {
+        'dataset_id': dataset_id,
+        'version': version,
+        'guardado': time.time() if guardado is None else guardado,
+        'archivos': [asdict(archivo) for archivo in archivos],
+    }
+    temporal = ruta.with_name(ruta.name + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp')
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(registro, f, indent=1)
+    os.replace(temporal, ruta)
+
+
+def renovar_registro(clave, carpeta=None):
+    '''
+    Se marca como recién guardado un registro cuya versión se comprobó que no cambió.
+    '''
+    registro = leer_registro(clave, carpeta)
+    if registro is not None:
+        guardar_registro(clave, registro['dataset_id'], registro['version'], registro['archivos'], carpeta)
+
+
+def actualizar_archivos(clave, archivos, carpeta=None):
+    '''
+    Se guarda el listado de archivos de un registro con datos nuevos de los
+    archivos (por ejemplo, su coordenada de tiempo), sin cambiar su vigencia.
+    '''
+    registro = leer_registro(clave, carpeta)
+    if registro is None:
+        return
+    guardar_registro(clave, registro['dataset_id'], registro['version'], archivos, carpeta,
+                     guardado=registro.get('guardado'))
+
+
+def registro_vigente(registro, vigencia=None):
+    '''
+    Se revisa si un registro todavía no ha vencido.
+    '''
+    vigencia = vigencia_metadatos if vigencia is None else vigencia
+    return registro is not None and (time.time() - registro.get('guardado', 0)) <= vigencia
@@ -0,0 +1,172 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo define la codificación con la que se escriben los archivos NetCDF4
+de salida: compresión (zlib o zstd) y su nivel, filtro "shuffle", forma de los
+fragmentos (chunks) y empaquetado opcional en enteros de 16 bits con factor de
+escala y desplazamiento. Las mismas opciones (salvo el empaquetado) se usan
+para los almacenes Zarr de las salidas consolidadas (ver "salidaConsolidada.py").
+
+Los fragmentos se pueden ajustar según cómo se van a leer los datos después:
+  'serie': fragmentos con todo el tiempo y pocos puntos de grilla, para leer
+           rápido series de tiempo de un punto o de una zona pequeña
+  'mapa':  fragmentos de un solo tiempo con toda la grilla, para leer rápido
+           mapas de una fecha
+  o un diccionario {dimensión: tamaño} con la forma que se quiera.
+
+NOTA: la compresión 'zstd' requiere que la librería netCDF-C instalada tenga
+el complemento correspondiente (netCDF-C 4.9 o posterior)
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+from extraccionBloques import candado_netcdf
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+# Opciones de codificación por defecto de los archivos de salida
+opciones_por_defecto = {
+    'compresion': 'zlib',
+    'nivel': 4,
+    'shuffle': True,
+    'fragmentos': 'serie',
+    'empaquetar': False,
+}
+
+# Cantidad de puntos de grilla por lado de los fragmentos tipo 'serie'
+puntos_fragmento_serie = 16
+
+# Cantidad de tiempos que se leen a la vez para calcular los parámetros de empaquetado
+tiempos_bloque_empaquetado = 100
+
+
+def forma_fragmentos(da, fragmentos):
+    '''
+    Se calcula la forma de los fragmentos (en el orden de las dimensiones de
+    "da") según el tipo de acceso: 'serie', 'mapa' o un diccionario
+    {dimensión: tamaño}. Si "fragmentos" es None se devuelve None.
+    '''
+    if fragmentos is None:
+        return None
+    forma = []
+    for dim in da.dims:
+        tamanyo = da.sizes[dim]
+        if isinstance(fragmentos, dict):
+            valor = fragmentos.get(dim, tamanyo)
+        elif fragmentos == 'serie':
+            valor = tamanyo if dim == 'time' else puntos_fragmento_serie
+        elif fragmentos == 'mapa':
+            valor = 1 if dim == 'time' else tamanyo
+        else:
+            raise ValueError("Tipo de fragmentos no válido ("+str(fragmentos)+"): debe ser 'serie', 'mapa' o un diccionario")
+        forma.append(max(1, min(int(valor), tamanyo)))
+    return tuple(forma)
+
+
+def parametros_empaquetado(da):
+    '''
+    Se calculan el factor de escala y el desplazamiento para guardar los datos
+    de "da" como enteros de 16 bits, dejando el valor -32768 para los datos faltantes.
+    El mínimo y el máximo se calculan por bloques de "tiempos_bloque_empaquetado"
+    tiempos (de la primera dimensión), de modo que si los datos aún no están en
+    memoria no se cargan todos a la vez.
+    '''
+    import numpy as np
+
+    minimo, maximo = np.inf, -np.inf
+    dim = da.dims[0] if da.dims else None
+    total = da.sizes[dim] if dim is not None else 1
+    for inicio in range(0, total, tiempos_bloque_empaquetado):
+        bloque = da if dim is None else da.isel({dim: slice(inicio, inicio + tiempos_bloque_empaquetado)})
+        valores = np.asarray(bloque.values, dtype='float64')
+        valores = valores[np.isfinite(valores)]
+        if valores.size:
+            minimo = min(minimo, float(valores.min()))
+            maximo = max(maximo, float(valores.max()))
+    if not np.isfinite(minimo) or not np.isfinite(maximo):
+        minimo, maximo = 0.0, 0.0
+    desplazamiento = (maximo + minimo) / 2.0
+    escala = (maximo - minimo) / (2**16 - 2) if maximo > minimo else 1.0
+    return escala, desplazamiento
+
+
+def codificacion_salida(da, compresion='zlib', nivel=4, shuffle=True, fragmentos='serie', empaquetar=False):
+    '''
+    Se arma el diccionario "encoding" para escribir "da" con "to_netcdf"
+    (formato NETCDF4) según las opciones dadas. "compresion" puede ser
+    'zlib', 'zstd' o None (sin compresión).
+    Si se pide empaquetar, el factor de escala se calcula recorriendo los datos
+    por bloques (ver "parametros_empaquetado"); los datos de la descarga ya
+    están en memoria cuando se escriben, así que no se vuelven a pedir al servidor.
+    '''
+    codificacion = {}
+    if compresion is not None:
+        codificacion['compression'] = compresion
+        codificacion['complevel'] = int(nivel)
+        codificacion['shuffle'] = bool(shuffle)
+    forma = forma_fragmentos(da, fragmentos)
+    if forma is not None:
+        codificacion['chunksizes'] = forma
+    if empaquetar:
+        escala, desplazamiento = parametros_empaquetado(da)
+        codificacion['dtype'] = 'int16'
+        codificacion['scale_factor'] = escala
+        codificacion['add_offset'] = desplazamiento
+        codificacion['_FillValue'] = -32768
+    else:
+        codificacion['dtype'] = 'float32'
+    return {da.name: codificacion}
+
+
+def codificacion_zarr(da, compresion='zlib', nivel=4, shuffle=True, fragmentos='serie', empaquetar=False):
+    '''
+    Se arma el diccionario "encoding" para escribir "da" con "to_zarr" a partir
+    de las mismas opciones de los archivos NetCDF: la compresión ('zlib', 'zstd'
+    o None) se hace con el compresor Blosc, con el filtro "shuffle" si se pide.
+    Los datos no se empaquetan en enteros (ver "salidaConsolidada.py").
+    '''
+    import zarr
+
+    codificacion = {'dtype': 'float32'}
+    if compresion is not None and compresion not in ('zlib', 'zstd'):
+        raise ValueError("Compresión no válida ("+str(compresion)+"): debe ser 'zlib', 'zstd' o None")
+    if int(zarr.__version__.split('.')[0]) >= 3:
+        from zarr.codecs import BloscCodec
+        codificacion['compressors'] = None if compresion is None else [
+            BloscCodec(cname=compresion, clevel=int(nivel), shuffle='shuffle' if shuffle else 'noshuffle')]
+    else:
+        from numcodecs import Blosc
+        codificacion['compressor'] = None if compresion is None else Blosc(
+            cname=compresion, clevel=int(nivel), shuffle=Blosc.SHUFFLE if shuffle else Blosc.NOSHUFFLE)
+    forma = forma_fragmentos(da, fragmentos)
+    codificacion['chunks'] = forma if forma is not None else tuple(da.sizes[dim] for dim in da.dims)
+    return {da.name: codificacion}
+
+
+def escribir_netcdf(da, ruta, opciones=None, dims_ilimitadas=None):
+    '''
+    Se escribe "da" en un archivo NetCDF. Si no se dan opciones de codificación
+    se escribe tal cual (como en las versiones anteriores del script).
+    "dims_ilimitadas" es la lista de dimensiones a las que se les podrán
+    agregar datos después (ver "salidaConsolidada.py").
+    '''
+    if opciones is None:
+        with candado_netcdf:
+            da.to_netcdf(ruta, unlimited_dims=dims_ilimitadas)
+    else:
+        opciones = dict(opciones_por_defecto, **opciones)
+        codificacion = codificacion_salida(da, **opciones)
+        with candado_netcdf:
+            da.to_netcdf(ruta, format='NETCDF4', engine='netcdf4', encoding=codificacion,
+                         unlimited_dims=dims_ilimitadas)
@@ -0,0 +1,743 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Script desarrollado por Ing. MSc. Guillermo Eduardo Armenta - 2024
+Especialista en Climatología. Email: motsvanska@gmail.com
+
+Este módulo contiene la lógica de descarga de los datos del CMIP6 para una zona
+delimitada definida por el usuario, en forma de funciones que se pueden importar
+desde otros scripts. La descarga se hace por modelo, variable, temporalidad,
+escenario y un intervalo de años requerido.
+
+A diferencia de la versión anterior (en la que se ejecutaba un proceso aparte
+por cada año), aquí la consulta a los nodos ESGF y el listado de archivos
+se hacen una sola vez por ejecución, y cada archivo remoto se abre una sola vez
+para extraer de él todos los años buscados que contenga.
+
+NOTA: Este módulo es utilizado por los scripts "descargarVariosAnyosDatosModelosCMIP6-v1.py"
+y "scriptDescargaDatosModelosCMIP6-v2.py", por lo tanto, todos se deben tener
+en la misma carpeta
+'''
+
+# Librerías de Python necesarias para el funcionamiento del módulo
+# NOTA: Se deben tener instaladas previamente, siguiendo los pasos mencionados
+#       en la descripción de los scripts principales
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import os
+import functools
+from pathlib import Path
+from nodosESGF import seleccionar_nodo
+import cacheMetadatos
+from cacheMetadatos import (ArchivoESGF, clave_busqueda, leer_registro, guardar_registro, renovar_registro,
+                            registro_vigente, actualizar_archivos)
+from codificacionSalida import escribir_netcdf
+from manifiestoDescargas import clave_unidad, leer_manifiesto, registrar_archivo, registrar_consolidado, archivo_valido, ruta_temporal
+from salidaConsolidada import nombre_salida_consolidada, clave_consolidada, tiempos_en_salida, borrar_salida, recortar_salida, agregar_tiempos
+from extraccionBloques import extraer_por_bloques, candado_netcdf
+from metricasDescarga import medir
+from replicasESGF import LectorReplicas
+from descargaHTTP import elegir_acceso, obtener_archivo, soltar_archivo, validar_acceso
+from indiceArchivos import indice_archivos, planes_lectura, ultimo_tramo, resumen_tiempos, tramos_conocidos
+from recorteEspacial import recortar, clave_malla_archivo, LecturaPorPartes
+from productosDerivados import AcumuladorProductos, nombre_productos, validar_productos
+from regrillado import regrillar, validar_regrillado
+# ---FIN LIBRERÍAS NECESARIAS---
+# NOTA: numpy, xarray y pyesgf se importan solo dentro de las funciones que los
+#       necesitan, para que los scripts arranquen rápido (por ejemplo, cuando
+#       todos los archivos ya están descargados no se llegan a importar)
+
+
+# Se define la página de la cual se buscarán y descargarán los datos
+#https://esgf.github.io/nodes.html
+# NOTA: esta lista refleja los nodos que respondieron correctamente
+# en las pruebas más recientes (DKRZ, NCI y CEDA). La disponibilidad
+# de los nodos ESGF puede cambiar con el tiempo.
+nodos_esgf = [
+    'https://esgf-data.dkrz.de/esg-search',
+    'https://esgf.nci.org.au/esg-search',
+    'https://esgf.ceda.ac.uk/esg-search',
+]
+
+
+class ErrorDescargaCMIP6(Exception):
+    '''
+    Error que impide realizar la descarga (coordenadas o años no válidos,
+    o ningún nodo ESGF disponible). El mensaje se muestra tal cual al usuario.
+    '''
+
+
+def validar_parametros(lonmin, lonmax, latmin, latmax, anyoini=None, anyofin=None):
+    '''
+    Se validan las coordenadas de longitud y latitud (es decir, que la coordenada
+    oeste de longitud de la zona no sea mayor que la coordenada este ni la zona
+    más ancha que 360 grados, y que la coordenada de latitud sur no sea mayor que
+    la coordenada norte), y si se dan,
+    que el año inicial no sea mayor que el año final.
+    Si hay algún error se lanza "ErrorDescargaCMIP6" con el mensaje correspondiente.
+    '''
+    errores = []
+    if(lonmin>=lonmax):
+        errores.append("La coordenada de longitud oeste ("+str(lonmin)+") es mayor o igual que la coordenada de longitud este ("+str(lonmax)+")")
+    elif(lonmax-lonmin>360):
+        errores.append("La zona tiene más de 360 grados de longitud ("+str(lonmin)+" a "+str(lonmax)+")")
+    if(latmin>=latmax):
+        errores.append("La coordenada de latitud sur ("+str(latmin)+") es mayor o igual que la coordenada de latitud norte ("+str(latmax)+")")
+    if errores:
+        raise ErrorDescargaCMIP6("Error con las coordenadas de la zona:\n"+"\n".join(errores))
+    if( (anyoini is not None) and (anyofin is not None) ):
+        validar_anyos(anyoini, anyofin)
+
+
+def validar_anyos(anyoini, anyofin):
+    '''
+    Se valida que el año inicial no sea mayor que el año final. Si lo es se
+    lanza "ErrorDescargaCMIP6".
+    '''
+    if(anyoini>anyofin):
+        raise ErrorDescargaCMIP6("Error con el rango de años dado: El año inicial ("+str(anyoini)+") es mayor que el año final ("+str(anyofin)+")")
+
+
+def conectar_nodo(modelo, escenario, varclim, frecuencia):
+    '''
+    Se consultan al mismo tiempo los nodos ESGF de la lista "nodos_esgf" (ver
+    "nodosESGF.py") y se devuelve el contexto de búsqueda del más rápido que
+    responda correctamente.
+    '''
+    parametros = dict(
+        project='CMIP6',
+        source_id=modelo,
+        experiment_id=escenario,
+        variable=varclim,
+        frequency=frecuencia,
+        variant_label='r1i1p1f1')
+    with medir('seleccion_nodo') as metrica:
+        nodo, ctx = seleccionar_nodo(nodos_esgf, parametros)
+        metrica['nodo'] = nodo
+    if ctx is not None:
+        print("Conexión exitosa con: " + nodo)
+        return ctx
+
+    raise ErrorDescargaCMIP6(
+        "No fue posible conectar con ningún nodo ESGF de la lista.\n"
+        "Los servidores del CMIP6 suelen fallar en ocasiones; por favor intente más tarde (dar un día de espera al menos).")
+
+
+def listar_archivos(modelo, escenario, varclim, frecuencia):
+    '''
+    Se devuelve el listado de archivos disponibles (objetos "ArchivoESGF") para
+    el modelo, escenario, variable y temporalidad dados. Si hay un registro
+    vigente en el caché de metadatos (ver "cacheMetadatos.py") se usa sin
+    consultar a los nodos ESGF; si venció, se consulta el conjunto de datos y
+    solo se vuelve a listar los archivos si cambió su versión.
+    '''
+    clave = clave_busqueda('CMIP6', modelo, escenario, varclim, frecuencia, 'r1i1p1f1')
+    registro = leer_registro(clave)
+
+    if cacheMetadatos.sin_conexion:
+        if registro is None:
+            raise ErrorDescargaCMIP6("Modo sin conexión: no hay un listado de archivos guardado para "+clave)
+        print("Modo sin conexión: se usa el listado de archivos guardado de "+registro['dataset_id'])
+        return registro['archivos']
+
+    if registro_vigente(registro):
+        print("Se usa el listado de archivos guardado de "+registro['dataset_id'])
+        return registro['archivos']
+
+    ctx = conectar_nodo(modelo, escenario, varclim, frecuencia)
+    with medir('busqueda', clave=clave):
+        resultados = list(ctx.search())
+    if not resultados:
+        raise ErrorDescargaCMIP6("No se encontraron datos para "+clave)
+    result = resultados[0]
+    dataset_id = result.dataset_id.split('|')[0]
+    version = str(result.json.get('version', ''))
+
+    # El mismo conjunto de datos puede estar publicado en varios nodos de datos
+    # (con el mismo identificador y versión); se usan todas sus réplicas,
+    # empezando por la original
+    replicas = sorted((resultado for resultado in resultados if resultado.dataset_id.split('|')[0] == dataset_id),
+                      key=lambda resultado: bool(resultado.json.get('replica', False)))
+
+    if registro is not None and registro['dataset_id'] == dataset_id and registro['version'] == version:
+        if len(replicas) == 1 or any(archivo.replicas for archivo in registro['archivos']):
+            print("La versión del conjunto de datos no ha cambiado, se usa el listado de archivos guardado")
+            renovar_registro(clave)
+            return registro['archivos']
+
+    # Y se obtiene el listado de archivos disponibles en cada réplica
+    archivos = {}
+    with medir('listado', clave=clave, replicas=len(replicas)) as metrica:
+        for replica in replicas:
+            try:
+                for file in replica.file_context().search():
+                    if file.filename in archivos:
+                        archivos[file.filename].replicas.append({'opendap_url': file.opendap_url,
+                                                                 'download_url': file.download_url})
+                        continue
+                    inicio, fin = fechas_archivo(file.filename)
+                    archivos[file.filename] = ArchivoESGF(
+                        filename=file.filename,
+                        opendap_url=file.opendap_url,
+                        download_url=file.download_url,
+                        checksum=file.checksum,
+                        checksum_type=file.checksum_type,
+                        size=file.size,
+                        inicio=inicio,
+                        fin=fin,
+                        anyoini=int(inicio[:4]),
+                        anyofin=int(fin[:4]))
+            except Exception as e:
+                print("No se pudo listar los archivos de "+replica.dataset_id+" ("+type(e).__name__+": "+str(e)+")")
+        metrica['registros'] = len(archivos)
+    if not archivos:
+        raise ErrorDescargaCMIP6("No fue posible listar los archivos de "+dataset_id+" en ningún nodo de datos")
+    archivos = list(archivos.values())
+    guardar_registro(clave, dataset_id, version, archivos)
+    return archivos
+
+
+def fechas_archivo(archivo):
+    '''
+    Se obtienen la fecha inicial y final que tiene un archivo a partir de su nombre
+    (por ejemplo "..._201501-203412.nc" devuelve ("201501", "203412")).
+    '''
+    partsarchivo = archivo.split("_")
+    fechas00=partsarchivo[(len(partsarchivo)-1)]
+    fechas0=fechas00.split(".")
+    fechas=fechas0[0].split("-")
+    return fechas[0], fechas[1]
+
+
+def nombre_archivo_salida(modelo, escenario, varclim, frecuencia, anyo, nombrezona):
+    '''
+    Se define el nombre del archivo de salida de un año:
+    "[variable]_[temporalidad]_[escenario]_[modelo]_[año]_[zona].nc"
+    '''
+    return varclim+'_'+frecuencia+'_'+escenario+'_'+modelo+'_'+str(anyo)+'_'+nombrezona+'.nc'
+
+
+def recortar_zona(da, lonmin, lonmax, latmin, latmax, clave_malla=None):
+    '''
+    Se recortan los datos de "da" a la zona dada (las longitudes de la zona y
+    las de los modelos pueden estar en el formato -180 a 180 o 0 a 360; ver
+    "recorteEspacial.py"). Si la zona queda en dos ventanas de la malla se
+    devuelve un objeto "LecturaPorPartes", que se lee por bloques igual que un
+    DataArray.
+    '''
+    return recortar(da, (lonmin, lonmax, latmin, latmax), clave_malla)
+
+
+def zona_union(zonas):
+    '''
+    Se calcula la zona (lonmin, lonmax, latmin, latmax) que contiene a todas las zonas dadas.
+    Las longitudes de cada zona se llevan antes al formato de la primera (por
+    ejemplo, 350 a 355 pasa a -10 a -5 si la primera zona es de -20 a 0).
+    '''
+    limites = list(zonas.values())
+    referencia = limites[0][0]
+    desplazadas = []
+    for lonmin, lonmax, latmin, latmax in limites:
+        desplazamiento = 360 * round((lonmin - referencia) / 360)
+        desplazadas.append((lonmin - desplazamiento, lonmax - desplazamiento, latmin, latmax))
+    lonmin = min(zona[0] for zona in desplazadas)
+    lonmax = min(max(zona[1] for zona in desplazadas), lonmin + 360)
+    return (lonmin, lonmax, min(zona[2] for zona in desplazadas), max(zona[3] for zona in desplazadas))
+
+
+def descargar_anyos(modelo, escenario, varclim, frecuencia, anyoinibuscado, anyofinbuscado,
+                    lonmin, lonmax, latmin, latmax, nombrezona, rutasalidas, **opciones):
+    '''
+    Se descargan los datos de todos los años entre "anyoinibuscado" y "anyofinbuscado"
+    (incluidos) para una sola zona. Las opciones son las mismas de "descargar_anyos_zonas".
+    '''
+    return descargar_anyos_zonas(modelo, escenario, varclim, frecuencia, anyoinibuscado, anyofinbuscado,
+                                 {nombrezona: (lonmin, lonmax, latmin, latmax)}, rutasalidas, **opciones)
+
+
+def descargar_anyos_zonas(modelo, escenario, varclim, frecuencia, anyoinibuscado, anyofinbuscado,
+                          zonas, rutasalidas, limitador=None, reanudar=False, codificacion=None,
+                          consolidar=None, tiempos_por_bloque=None, acceso='opendap', productos=None,
+                          regrillado=None):
+    '''
+    Se descargan los datos de todos los años entre "anyoinibuscado" y "anyofinbuscado"
+    (incluidos) para las zonas dadas ("zonas" es un diccionario
+    {nombrezona: (lonmin, lonmax, latmin, latmax)}), generando un archivo NetCDF
+    por año y por zona en la carpeta "rutasalidas". La búsqueda en los nodos ESGF
+    se hace una sola vez, cada archivo remoto se abre una sola vez para extraer
+    todos los años que contiene, y de cada año se pide al servidor solo la zona
+    que contiene a todas las zonas dadas, de la cual se recorta cada zona en memoria.
+    Si se da un "limitador" (ver "descargaLotes.py"), la lectura de cada archivo
+    remoto espera a que su nodo de datos tenga cupo disponible. Si un archivo
+    falla en un nodo de datos, se continúa con otra de sus réplicas (ver
+    "replicasESGF.py"), y si no se puede abrir en ninguna, sus años quedan sin
+    descargar y se continúa con los demás archivos.
+    Cada archivo generado se registra en el manifiesto de descargas (ver
+    "manifiestoDescargas.py"); si "reanudar" es True, solo se descargan los años
+    cuyo archivo falta o está dañado. "codificacion" es un diccionario con las
+    opciones de compresión, fragmentos y empaquetado de los archivos de salida
+    (ver "codificacionSalida.py"); si es None se escriben sin codificación.
+    Si "consolidar" es 'zarr' o 'netcdf', en lugar de un archivo por año todo
+    el rango de años de cada zona se guarda en una sola salida, agregando cada
+    año a medida que se descarga (ver "salidaConsolidada.py"). Si se da
+    "tiempos_por_bloque", los datos de cada año se piden al servidor por bloques
+    de esa cantidad de tiempos, escribiendo cada bloque apenas llega (ver
+    "extraccionBloques.py").
+    "acceso" define cómo se leen los archivos remotos: 'opendap' (solo los datos
+    necesarios), 'http' (se descarga el archivo completo a un caché local y se
+    extrae de él) o 'auto' (se elige por archivo según la fracción que se
+    necesita de él; ver "descargaHTTP.py").
+    Si se da "productos" (por ejemplo ['climatologia_mensual', 'media_zona',
+    'suma_anual']), a medida que llegan los datos se calculan esos productos
+    derivados para cada zona y se guardan en un archivo por zona (ver
+    "productosDerivados.py").
+    Si se da "regrillado" (por ejemplo {'metodo': 'conservativo', 'resolucion': 1.0}),
+    los datos de cada zona se llevan a esa malla común antes de escribirlos y
+    de calcular los productos derivados (ver "regrillado.py").
+    La duración de cada fase se registra en el archivo de métricas, si está
+    activado (ver "metricasDescarga.py").
+    Se devuelve la lista de archivos generados en esta ejecución.
+    '''
+    anyoinibuscado = int(anyoinibuscado)
+    anyofinbuscado = int(anyofinbuscado)
+    if not zonas:
+        raise ErrorDescargaCMIP6("No se definió ninguna zona para descargar los datos")
+    for nombrezona, (lonmin, lonmax, latmin, latmax) in zonas.items():
+        try:
+            validar_parametros(lonmin, lonmax, latmin, latmax, anyoinibuscado, anyofinbuscado)
+        except ErrorDescargaCMIP6 as e:
+            raise ErrorDescargaCMIP6("Zona "+nombrezona+": "+str(e))
+    try:
+        validar_acceso(acceso)
+    except ValueError as e:
+        raise ErrorDescargaCMIP6(str(e))
+    if productos:
+        try:
+            productos = validar_productos(productos)
+        except ValueError as e:
+            raise ErrorDescargaCMIP6(str(e))
+    if regrillado is not None:
+        try:
+            regrillado = validar_regrillado(regrillado)
+        except ValueError as e:
+            raise ErrorDescargaCMIP6(str(e))
+
+    if(frecuencia=='day'):
+        restemp='diarios'
+    else:
+        restemp='mensuales'
+
+    # Se muestran en pantalla los parámetros establecidos para la búsqueda y descarga
+    print("Realizando la búsqueda y descarga de los datos "+restemp+" de "+varclim+",")
+    print("del modelo "+modelo+" del escenario "+escenario+", para los años "+str(anyoinibuscado)+" a "+str(anyofinbuscado)+",")
+    print("para la zona de "+", ".join(zonas) if len(zonas) == 1 else "para las zonas de "+", ".join(zonas))
+
+    todos = set(range(anyoinibuscado, anyofinbuscado+1))
+    pendientes = {nombrezona: set(todos) for nombrezona in zonas}
+    generados = []
+
+    # En las salidas consolidadas se lleva la cantidad de tiempos que tiene cada una,
+    # para no tener que abrirlas a contarlos después de agregar cada bloque
+    rutas_consolidadas = {}
+    tiempos_consolidados = {}
+    if consolidar is not None:
+        for nombrezona in zonas:
+            rutas_consolidadas[nombrezona] = Path(rutasalidas) / nombre_salida_consolidada(
+                modelo, escenario, varclim, frecuencia, anyoinibuscado, anyofinbuscado, nombrezona, consolidar)
+            tiempos_consolidados[rutas_consolidadas[nombrezona]] = 0
+
+    # Si se está reanudando una descarga, se omiten los años cuyo archivo ya está
+    # en el manifiesto y no está dañado (si ya están todos, no se consulta a ESGF)
+    if reanudar:
+        manifiesto = leer_manifiesto(rutasalidas)
+        for nombrezona in zonas:
+            if consolidar is None:
+                for anyo in sorted(todos):
+                    clave = clave_unidad(modelo, escenario, varclim, frecuencia, anyo, nombrezona)
+                    if archivo_valido(rutasalidas, manifiesto.get(clave)):
+                        pendientes[nombrezona].discard(anyo)
+            else:
+                # En la salida consolidada se omiten los años registrados, y si quedó un
+                # año a medias (la salida tiene más tiempos de los registrados) se recorta
+                ruta_consolidada = rutas_consolidadas[nombrezona]
+                registros = 0
+                for anyo in sorted(todos):
+                    registro = manifiesto.get(clave_consolidada(clave_unidad(modelo, escenario, varclim, frecuencia, anyo, nombrezona), ruta_consolidada))
+                    if registro is not None:
+                        pendientes[nombrezona].discard(anyo)
+                        registros = max(registros, registro['registros'])
+                tiempos = tiempos_en_salida(ruta_consolidada, consolidar)
+                if tiempos < registros:
+                    print("La salida "+ruta_consolidada.name+" tiene menos datos de los registrados, se descarga de nuevo")
+                    borrar_salida(ruta_consolidada)
+                    pendientes[nombrezona] = set(todos)
+                    tiempos = 0
+                elif tiempos > registros:
+                    recortar_salida(ruta_consolidada, consolidar, registros)
+                    tiempos = registros
+                tiempos_consolidados[ruta_consolidada] = tiempos
+            omitidos = len(todos) - len(pendientes[nombrezona])
+            if omitidos:
+                print("Zona "+nombrezona+": se omiten "+str(omitidos)+" años que ya estaban descargados")
+    elif consolidar is not None:
+        for ruta_consolidada in rutas_consolidadas.values():
+            borrar_salida(ruta_consolidada)
+
+    # Si se piden productos derivados, se acumulan por zona a medida que llegan los
+    # datos. Al reanudar se parte de los productos ya guardados, y los años que ya
+    # estaban descargados pero no están en los productos se toman de las salidas locales
+    acumuladores = {}
+    rutas_productos = {}
+    for nombrezona in (zonas if productos else []):
+        rutas_productos[nombrezona] = Path(rutasalidas) / nombre_productos(
+            modelo, escenario, varclim, frecuencia, anyoinibuscado, anyofinbuscado, nombrezona)
+        acumulador = AcumuladorProductos(productos, varclim, frecuencia)
+        if reanudar:
+            acumulador.cargar(rutas_productos[nombrezona])
+            faltantes = sorted(todos - pendientes[nombrezona] - acumulador.anyos)
+            for anyo in faltantes:
+                if consolidar is None:
+                    ruta = Path(rutasalidas) / nombre_archivo_salida(modelo, escenario, varclim, frecuencia, anyo, nombrezona)
+                else:
+                    ruta = rutas_consolidadas[nombrezona]
+                acumulador.agregar(_datos_guardados(ruta, consolidar, varclim, anyo))
+                acumulador.confirmar(anyo)
+            if faltantes:
+                print("Zona "+nombrezona+": se agregan a los productos "+str(len(faltantes))+" años ya descargados")
+        acumuladores[nombrezona] = acumulador
+
+    if reanudar and not any(pendientes.values()):
+        generados.extend(_guardar_productos(acumuladores, rutas_productos))
+        return generados
+
+    # Se arma el plan de lectura: qué archivos hay que abrir y qué años (y en qué
+    # posiciones del tiempo, si ya se conocen) se leen de cada uno. Los archivos se
+    # recorren en orden cronológico, para que en la salida consolidada los años se
+    # agreguen en orden
+    clave = clave_busqueda('CMIP6', modelo, escenario, varclim, frecuencia, 'r1i1p1f1')
+    files = listar_archivos(modelo, escenario, varclim, frecuencia)
+    planes = planes_lectura(indice_archivos(files), set().union(*pendientes.values()))
+    ultimos = ultimo_tramo(planes)
+    detenidas = set()
+    nuevos_tiempos = False
+
+    # Los años repartidos entre varios archivos se escriben por partes: se guardan
+    # aquí sus salidas entre un archivo y el siguiente
+    en_curso = {}
+
+    fallidos = set()
+
+    # Inicia la búsqueda como tal en el listado de archivos disponibles generados
+    # en la consulta a la página web. Para cada uno de los archivos del plan...
+    for posicion, (file, tramos) in enumerate(planes):
+        activas = [nombrezona for nombrezona in zonas if pendientes[nombrezona] and nombrezona not in detenidas]
+        if not activas:
+            break
+
+        # ...se revisa cuáles de sus años aún no se han descargado
+        anyosarch = [anyo for anyo, _, _ in tramos if anyo not in fallidos and (anyo in en_curso
+                     or any(anyo in pendientes[nombrezona] for nombrezona in activas))]
+        if not anyosarch:
+            continue
+
+        # El archivo se abre una sola vez (desde la réplica más rápida disponible, y si
+        # hay un límite de lecturas simultáneas por nodo de datos, esperando el turno)
+        # y de él se extraen todos los años buscados
+        zonasarch = zona_union({nombrezona: zonas[nombrezona] for nombrezona in activas})
+        try:
+            with medir('apertura', archivo=file.filename) as metrica:
+                lector = _abrir_archivo(file, anyosarch, zonasarch, acceso, limitador)
+                ds = lector.ds
+                metrica['nodo'] = lector.nodo
+        except Exception as e:
+            # Si no se pudo abrir el archivo, sus años no se descargan (ni los que
+            # iban por partes, ni el resto de ellos en el archivo siguiente) y se
+            # continúa con los demás archivos
+            print("--- ERROR al abrir el archivo "+file.filename+" ---")
+            print(str(e) if isinstance(e, ErrorDescargaCMIP6) else type(e).__name__ + ": " + str(e))
+            for anyo in anyosarch:
+                if anyo in en_curso:
+                    _descartar_anyo(anyo, en_curso, fallidos, acumuladores, consolidar, detenidas)
+                else:
+                    fallidos.add(anyo)
+            continue
+        try:
+            # Si no se conocían (o no coinciden) las posiciones de los años en el
+            # archivo, se toman de su coordenada de tiempo y se guardan para la próxima vez
+            if file.anyos_tiempo is None or sum(cantidad for _, cantidad in file.anyos_tiempo) != ds.sizes['time']:
+                file.anyos_tiempo = resumen_tiempos(ds.indexes["time"])
+                nuevos_tiempos = True
+            indices = {anyo: (tiempoini, tiempofin)
+                       for anyo, tiempoini, tiempofin in tramos_conocidos(file.anyos_tiempo, anyosarch)}
+            for anyo in anyosarch:
+                if lector.ds is None:
+                    # Fallaron todas las réplicas del archivo: los años que iban por partes
+                    # quedan incompletos
+                    for anyoincompleto in anyosarch:
+                        if anyoincompleto in en_curso:
+                            _descartar_anyo(anyoincompleto, en_curso, fallidos, acumuladores, consolidar, detenidas)
+                    break
+                if anyo in en_curso:
+                    zonasanyo, destinos, escritos = en_curso[anyo]
+                else:
+                    zonasanyo = [nombrezona for nombrezona in zonas
+                                 if anyo in pendientes[nombrezona] and nombrezona not in detenidas]
+                    if not zonasanyo:
+                        continue
+                    destinos = None
+                    escritos = 0
+                ultimo = ultimos[anyo] == posicion
+
+                if anyo in indices:
+                    # Se pide al servidor solo la zona que contiene a todas las zonas de este año
+                    # (si falla la réplica en uso, se pide lo mismo a la siguiente)
+                    tiempoini, tiempofin = indices[anyo]
+                    zonaanyo = zona_union({nombrezona: zonas[nombrezona] for nombrezona in zonasanyo})
+                    metricas = {'nodo': lector.nodo, 'archivo': file.filename, 'anyo': anyo}
+                    seleccionar = _seleccion_anyo(file, varclim, tiempoini, tiempofin, zonaanyo)
+                    reabrir = _reapertura(lector, seleccionar, metricas)
+
+                    # Para cada zona se define dónde se escribe: los archivos por año se escriben
+                    # con un nombre temporal y se renombran al terminar; en la salida consolidada
+                    # los datos se agregan al final. Si el año está repartido entre varios
+                    # archivos, cada tramo se agrega al final de la salida
+                    por_partes = escritos > 0 or not ultimo
+                    if destinos is None:
+                        destinos = {}
+                        for nombrezona in zonasanyo:
+                            if consolidar is None:
+                                final = Path(rutasalidas) / nombre_archivo_salida(modelo, escenario, varclim, frecuencia, anyo, nombrezona)
+                                destinos[nombrezona] = (final, ruta_temporal(final))
+                            else:
+                                destinos[nombrezona] = (rutas_consolidadas[nombrezona], rutas_consolidadas[nombrezona])
+                    escritores = [_escritor_zona(zonas[nombrezona], destinos[nombrezona][1], consolidar,
+                                                 codificacion, tiempos_por_bloque, por_partes,
+                                                 acumuladores.get(nombrezona), regrillado, tiempos_consolidados)
+                                  for nombrezona in zonasanyo]
+                    en_curso[anyo] = (zonasanyo, destinos, escritos)
+
+                    try:
+                        da = seleccionar(lector.ds)
+                        with medir('anyo', archivo=file.filename, anyo=anyo, zonas=len(zonasanyo),
+                                   registros=da.sizes['time']) as metrica:
+                            extraer_por_bloques(da, escritores, tiempos_por_bloque, metricas=metricas, reabrir=reabrir)
+                            metrica['nodo'] = lector.nodo
+                    except Exception as e:
+                        print(f"--- ERROR al descargar el año {anyo} ---")
+                        print(str(e) if isinstance(e, ErrorDescargaCMIP6) else type(e).__name__ + ": " + str(e))
+                        _descartar_anyo(anyo, en_curso, fallidos, acumuladores, consolidar, detenidas)
+                        continue
+                    escritos += tiempofin - tiempoini
+                    en_curso[anyo] = (zonasanyo, destinos, escritos)
+
+                if not ultimo:
+                    # El resto del año está en el siguiente archivo
+                    continue
+                if not escritos:
+                    print("El archivo "+file.filename+" no tiene datos del año "+str(anyo))
+                    en_curso.pop(anyo, None)
+                    continue
+                en_curso.pop(anyo)
+
+                # Una vez realizado el proceso de extracción de los datos del año buscado y de cada zona,
+                # se registra cada salida en el manifiesto de descargas y se muestra su nombre
+                for nombrezona in zonasanyo:
+                    final, temporal = destinos[nombrezona]
+                    claveanyo = clave_unidad(modelo, escenario, varclim, frecuencia, anyo, nombrezona)
+                    if consolidar is None:
+                        os.replace(temporal, final)
+                        registrar_archivo(rutasalidas, claveanyo, final)
+                        print('Se ha generado el archivo "'+str(final)+'" con los datos del año '+str(anyo))
+                    else:
+                        registrar_consolidado(rutasalidas, clave_consolidada(claveanyo, final), final,
+                                              tiempos_consolidados[final])
+                        print('Se han agregado los datos del año '+str(anyo)+' a "'+str(final)+'"')
+                    pendientes[nombrezona].discard(anyo)
+                    if nombrezona in acumuladores:
+                        acumuladores[nombrezona].confirmar(anyo)
+                    if str(final) not in generados:
+                        generados.append(str(final))
+        finally:
+            lector.cerrar()
+
+    # Los años que quedaron a medias (por ejemplo, si falló el archivo con su
+    # último tramo) se descartan
+    for anyo in list(en_curso):
+        _descartar_anyo(anyo, en_curso, fallidos, acumuladores, consolidar, detenidas)
+
+    if nuevos_tiempos:
+        actualizar_archivos(clave, files)
+
+    generados.extend(_guardar_productos(acumuladores, rutas_productos))
+
+    for nombrezona in zonas:
+        for anyo in sorted(pendientes[nombrezona]):
+            print("No se generó el archivo del año "+str(anyo)+" para la zona "+nombrezona)
+
+    return generados
+
+
+def _abrir_archivo(file, anyos, zona, acceso, limitador):
+    '''
+    Se abre un archivo remoto por OPeNDAP o descargándolo completo (ver
+    "descargaHTTP.py"), según el tipo de acceso, y se devuelve el
+    "LectorReplicas" con el archivo abierto. En el modo 'auto', si el acceso
+    elegido falla se intenta con el otro. Si no se puede abrir en ninguna de
+    sus réplicas se lanza "ErrorDescargaCMIP6".
+    '''
+    modos = [elegir_acceso(file, anyos, zona, acceso)]
+    if acceso == 'auto' and file.opendap_url and file.download_url:
+        modos.append('opendap' if modos[0] == 'http' else 'http')
+    for modo in modos:
+        lector = None
+        try:
+            if modo == 'http':
+                # El archivo del caché no se borra mientras esté abierto
+                ruta = obtener_archivo(file, limitador)
+                lector = LectorReplicas(ArchivoESGF(filename=file.filename, opendap_url=str(ruta)),
+                                        al_cerrar=functools.partial(soltar_archivo, ruta))
+            else:
+                lector = LectorReplicas(file, limitador)
+            lector.abrir()
+            return lector
+        except Exception as e:
+            if lector is not None:
+                lector.cerrar()
+            if modo == modos[-1]:
+                raise ErrorDescargaCMIP6("No se pudo abrir el archivo "+file.filename+" en ninguna de sus réplicas ("
+                                         +type(e).__name__+": "+str(e)+")") from e
+            print("No se pudo leer "+file.filename+" por "+modo.upper()+" ("+type(e).__name__+": "+str(e)
+                  +"), se intenta por "+modos[-1].upper())
+
+
+def _seleccion_anyo(file, varclim, tiempoini, tiempofin, zona):
+    '''
+    Se arma la función que, en el archivo abierto, selecciona los tiempos de un
+    año y recorta la zona dada (la que contiene a todas las zonas del año). Las
+    ventanas de la zona en la malla se calculan una sola vez por malla (ver
+    "recorteEspacial.py") y se reutilizan en todos los años y variables.
+    '''
+
+    def seleccionar(ds):
+        datos = ds[varclim]
+        return recortar_zona(datos.isel(time=slice(tiempoini, tiempofin)), *zona,
+                             clave_malla=clave_malla_archivo(file.filename, datos))
+
+    return seleccionar
+
+
+def _reapertura(lector, seleccionar, metricas):
+    '''
+    Se arma la función que, cuando falla la lectura de un bloque, cambia a la
+    siguiente réplica del archivo y vuelve a seleccionar en ella los datos del
+    año (ver "extraccionBloques.py"). Si no quedan réplicas se lanza
+    "ErrorDescargaCMIP6".
+    '''
+
+    def reabrir(error):
+        try:
+            ds = lector.cambiar_replica(error)
+        except Exception as e:
+            raise ErrorDescargaCMIP6("No se pudo leer el archivo "+lector.nombre+" en ninguna de sus réplicas ("
+                                     +type(e).__name__+": "+str(e)+")") from e
+        metricas['nodo'] = lector.nodo
+        return seleccionar(ds)
+
+    return reabrir
+
+
+def _descartar_anyo(anyo, en_curso, fallidos, acumuladores, consolidar, detenidas):
+    '''
+    Se descarta un año que no se pudo completar: se marca como fallido, se
+    quita de los productos derivados de sus zonas y se borran sus archivos
+    temporales. En la salida consolidada, para no dejar huecos, no se agregan
+    más años a sus zonas ("detenidas"); al reanudar se continúa desde este año.
+    '''
+    fallidos.add(anyo)
+    zonasanyo, destinos, _ = en_curso.pop(anyo)
+    for nombrezona in zonasanyo:
+        if nombrezona in acumuladores:
+            acumuladores[nombrezona].descartar(anyo)
+    if destinos is None:
+        return
+    if consolidar is None:
+        for final, temporal in destinos.values():
+            if temporal.exists():
+                temporal.unlink()
+    else:
+        detenidas.update(zonasanyo)
+
+
+def _guardar_productos(acumuladores, rutas_productos):
+    '''
+    Se guardan los productos derivados de cada zona y se devuelve la lista de
+    archivos guardados.
+    '''
+    guardados = []
+    for nombrezona, acumulador in acumuladores.items():
+        ruta = acumulador.guardar(rutas_productos[nombrezona])
+        if ruta is not None:
+            print('Se han guardado los productos derivados de la zona '+nombrezona+' en "'+str(ruta)+'"')
+            guardados.append(str(ruta))
+    return guardados
+
+
+def _escritor_zona(zona, ruta, consolidar, codificacion, tiempos_por_bloque, por_partes=False, acumulador=None,
+                   regrillado=None, tiempos_salidas=None):
+    '''
+    Se arma la función que recorta una zona de cada bloque leído y lo escribe
+    en "ruta": si el año se lee de una sola vez en un archivo por año, se escribe
+    el archivo completo; si no (o si el año se escribe "por_partes" porque está
+    repartido entre varios archivos), cada bloque se agrega al final de la salida.
+    Si se da "regrillado" (ver "regrillado.py"), cada bloque recortado se lleva
+    a la malla común, y si se da un "acumulador" (ver "productosDerivados.py"),
+    se agrega también a los productos derivados de la zona. En "tiempos_salidas"
+    ({ruta: cantidad de tiempos}) se lleva la cantidad de tiempos de las salidas
+    a las que se agregan los bloques (ver "agregar_tiempos").
+    '''
+    formato = consolidar or 'netcdf'
+
+    def escribir(bloque):
+        datos = recortar_zona(bloque, *zona)
+        if isinstance(datos, LecturaPorPartes):
+            datos = datos.load()
+        if regrillado is not None:
+            datos = regrillar(datos, zona, regrillado)
+        if acumulador is not None:
+            acumulador.agregar(datos)
+        if consolidar is None and not tiempos_por_bloque and not por_partes:
+            escribir_netcdf(datos, str(ruta), codificacion)
+        elif tiempos_salidas is not None and ruta in tiempos_salidas:
+            tiempos_salidas[ruta] = agregar_tiempos(datos, ruta, formato, codificacion, tiempos_salidas[ruta])
+        else:
+            agregar_tiempos(datos, ruta, formato, codificacion)
+
+    return escribir
+
+
+def _datos_guardados(ruta, consolidar, varclim, anyo):
+    '''
+    Se leen los datos de un año de una salida ya descargada (un archivo por
+    año, o la salida consolidada si "consolidar" es 'zarr' o 'netcdf').
+    '''
+    import xarray as xr
+
+    with candado_netcdf:
+        ds = xr.open_zarr(ruta) if consolidar == 'zarr' else xr.open_dataset(ruta)
+        with ds:
+            da = ds[varclim]
+            if consolidar is not None:
+                da = da.isel(time=(da['time'].dt.year == anyo).values)
+            return da.load()
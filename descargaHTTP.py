@@ -0,0 +1,391 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo permite descargar los archivos originales completos desde su
+dirección HTTP ("download_url", servicio HTTPServer de ESGF) en lugar de pedir
+solo la zona y los años por OPeNDAP, que suele ser el acceso más lento y menos
+confiable (y algunos nodos no lo ofrecen). El archivo se descarga por partes
+en paralelo (peticiones HTTP con "Range"), se verifica su suma de verificación
+publicada mientras se descarga, y se guarda en un caché local de tamaño
+limitado; la extracción de los años y las zonas se hace después sobre el
+archivo local. Así, otras descargas que usen el mismo archivo (otros años,
+zonas o ejecuciones) no requieren conexión.
+
+El caché borra primero los archivos usados hace más tiempo cuando se supera
+"limite_cache" (en bytes); cada vez que se usa un archivo se marca como recién
+usado, y los archivos que se están leyendo no se borran (ver
+"reservar_archivo"). La carpeta se puede cambiar con la variable de
+entorno DESCARGACMIP6_CACHE (los archivos quedan en la subcarpeta "archivos").
+
+El acceso se elige por archivo ('auto'): si el archivo ya está en el caché se
+usa siempre el local; si no, se descarga completo cuando la fracción que se
+necesita de él (años y zona) es al menos "fraccion_minima_http", y si no se
+usa OPeNDAP.
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import os
+import time
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from metricasDescarga import medir
+from extraccionBloques import espera_con_variacion
+from manifiestoDescargas import ruta_temporal
+from replicasESGF import direcciones_archivo, ordenar_replicas, nodo_url, registrar_error, registrar_latencia
+from cacheMetadatos import carpeta_cache
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+# Carpeta y tamaño máximo (en bytes) del caché de archivos descargados
+carpeta_archivos = carpeta_cache() / 'archivos'
+limite_cache = 50 * 10**9
+
+# Cantidad de partes que se descargan al mismo tiempo, tamaño de cada parte
+# (en bytes), reintentos de cada parte y tiempo límite de cada petición (en segundos)
+partes_paralelas = 4
+tamanyo_parte = 16 * 2**20
+reintentos_parte = 3
+tiempo_limite_http = 60
+
+# Tamaño de los pedazos (en bytes) en que se escriben en el disco las respuestas
+tamanyo_pedazo = 2**20
+
+# Fracción mínima del archivo (de 0 a 1) que se debe necesitar para descargarlo
+# completo en lugar de pedir solo los datos por OPeNDAP, en el modo 'auto'
+fraccion_minima_http = 0.3
+
+accesos = ('opendap', 'http', 'auto')
+
+_candado_cache = threading.Lock()
+_en_uso = {}
+
+
+class ErrorSumaVerificacion(Exception):
+    '''
+    La suma de verificación del archivo descargado no coincide con la publicada.
+    '''
+
+
+def ruta_en_cache(archivo, carpeta=None):
+    '''
+    Se define la ruta de un archivo en el caché. Si se conoce su suma de
+    verificación, ésta forma parte del nombre (así no se confunden dos
+    versiones de un archivo con el mismo nombre).
+    '''
+    prefijo = (archivo.checksum[:12] + '_') if getattr(archivo, 'checksum', None) else ''
+    return Path(carpeta or carpeta_archivos) / (prefijo + archivo.filename)
+
+
+def _marcar_uso(ruta, cambio):
+    ruta = Path(ruta).absolute()
+    usos = _en_uso.pop(ruta, 0) + cambio
+    if usos > 0:
+        _en_uso[ruta] = usos
+    try:
+        os.utime(ruta)
+    except OSError:
+        return False
+    return True
+
+
+def reservar_archivo(ruta):
+    '''
+    Se marca un archivo del caché como en uso (no se borra para hacer espacio
+    hasta que se llame a "soltar_archivo") y como recién usado. Se puede
+    reservar un archivo que aún no está (el que se va a descargar).
+    '''
+    with _candado_cache:
+        _marcar_uso(ruta, 1)
+
+
+def soltar_archivo(ruta):
+    '''
+    Se termina un uso de un archivo del caché (ver "reservar_archivo"); el
+    archivo queda marcado como recién usado.
+    '''
+    with _candado_cache:
+        _marcar_uso(ruta, -1)
+
+
+def archivo_en_cache(archivo, carpeta=None):
+    '''
+    Se devuelve la ruta del archivo si está en el caché, ya reservado (ver
+    "reservar_archivo"), o None si no está.
+    '''
+    ruta = ruta_en_cache(archivo, carpeta)
+    with _candado_cache:
+        if not _marcar_uso(ruta, 1):
+            _marcar_uso(ruta, -1)
+            return None
+    return ruta
+
+
+def liberar_espacio(bytes_nuevos, carpeta=None, limite=None):
+    '''
+    Se borran los archivos del caché usados hace más tiempo hasta que quepan
+    "bytes_nuevos" sin superar el límite del caché. Los archivos reservados
+    (que se están usando) no se borran.
+    '''
+    limite = limite_cache if limite is None else limite
+    carpeta = Path(carpeta or carpeta_archivos).absolute()
+    with _candado_cache:
+        archivos = []
+        for ruta in carpeta.glob('*'):
+            if ruta.name.startswith('.'):
+                continue
+            try:
+                estado = ruta.stat()
+            except OSError:
+                continue
+            archivos.append((estado.st_mtime, estado.st_size, ruta))
+        ocupado = sum(tamanyo for _, tamanyo, _ in archivos)
+        for _, tamanyo, ruta in sorted(archivos, key=lambda archivo: archivo[0]):
+            if ocupado + bytes_nuevos <= limite:
+                break
+            if ruta in _en_uso:
+                continue
+            print("Se borra del caché de archivos "+ruta.name+" ("+f"{tamanyo / 1e6:.0f}"+" MB)")
+            try:
+                ruta.unlink()
+            except OSError:
+                pass
+            ocupado -= tamanyo
+
+
+def _nueva_suma(tipo):
+    if not tipo:
+        return None
+    try:
+        return hashlib.new(tipo.lower().replace('-', ''))
+    except ValueError:
+        print("Tipo de suma de verificación desconocido ("+str(tipo)+"), no se verifica")
+        return None
+
+
+def _pedir(sesion, url, destino, inicio=None, fin=None, tipo_suma=None):
+    '''
+    Se pide una parte (o todo, si no se da el rango) de una dirección HTTP y se
+    escribe en "destino" a medida que llega (la parte, en su lugar del archivo),
+    reintentando con esperas crecientes. Si se da "tipo_suma" se calcula
+    también la suma de verificación de lo recibido. Se devuelve (bytes
+    recibidos, suma o None).
+    '''
+    cabeceras = {} if inicio is None else {'Range': 'bytes='+str(inicio)+'-'+str(fin)}
+    for intento in range(reintentos_parte + 1):
+        calculo = _nueva_suma(tipo_suma)
+        recibidos = 0
+        try:
+            with sesion.get(url, headers=cabeceras, timeout=tiempo_limite_http, stream=True) as respuesta:
+                respuesta.raise_for_status()
+                if inicio is not None and respuesta.status_code != 206:
+                    raise OSError("El servidor no respetó la petición por rango")
+                with open(destino, 'wb' if inicio is None else 'r+b') as f:
+                    if inicio is not None:
+                        f.seek(inicio)
+                    for pedazo in respuesta.iter_content(tamanyo_pedazo):
+                        f.write(pedazo)
+                        if calculo is not None:
+                            calculo.update(pedazo)
+                        recibidos += len(pedazo)
+            if inicio is not None and recibidos != fin - inicio + 1:
+                raise OSError("Se recibió una parte incompleta")
+            return recibidos, calculo
+        except Exception:
+            if intento == reintentos_parte:
+                raise
+            time.sleep(espera_con_variacion(intento))
+
+
+def _sumar_parte(f, calculo, inicio, cantidad):
+    '''
+    Se agrega a la suma de verificación una parte ya escrita del archivo "f".
+    '''
+    f.seek(inicio)
+    while cantidad > 0:
+        pedazo = f.read(min(tamanyo_pedazo, cantidad))
+        if not pedazo:
+            raise OSError("La parte descargada está incompleta en el disco")
+        calculo.update(pedazo)
+        cantidad -= len(pedazo)
+
+
+def tamanyo_remoto(sesion, url):
+    '''
+    Se consulta el tamaño de un archivo remoto y si el servidor acepta
+    peticiones por rango. Se devuelve (tamaño o None, acepta rangos).
+    '''
+    respuesta = sesion.head(url, allow_redirects=True, timeout=tiempo_limite_http)
+    respuesta.raise_for_status()
+    tamanyo = respuesta.headers.get('Content-Length')
+    rangos = respuesta.headers.get('Accept-Ranges', '').lower() == 'bytes'
+    return (int(tamanyo) if tamanyo else None), rangos
+
+
+def descargar_por_rangos(url, destino, tamanyo=None, tipo_suma=None, suma=None, sesion=None):
+    '''
+    Se descarga "url" en "destino" pidiendo partes de "tamanyo_parte" bytes, de
+    a "partes_paralelas" al mismo tiempo. Cada parte se escribe en su lugar del
+    archivo a medida que llega, y las partes se agregan en orden a la suma de
+    verificación apenas están completas (cuando aún están en la memoria del
+    sistema). Si el servidor no acepta peticiones por rango, el archivo se
+    descarga de una sola vez, calculando la suma mientras llega. Si la suma no
+    coincide con "suma" se borra el destino y se lanza un error. Se devuelve la
+    cantidad de bytes descargados.
+    '''
+    import requests
+
+    sesion = sesion or requests.Session()
+    tipo_suma = tipo_suma if suma else None
+    tamanyo_consultado, rangos = tamanyo_remoto(sesion, url)
+    tamanyo = tamanyo or tamanyo_consultado
+    try:
+        if not rangos or not tamanyo:
+            tamanyo, calculo = _pedir(sesion, url, destino, tipo_suma=tipo_suma)
+        else:
+            calculo = _nueva_suma(tipo_suma)
+            with open(destino, 'wb') as f:
+                f.truncate(tamanyo)
+            inicios = list(range(0, tamanyo, tamanyo_parte))
+            siguiente = 0          # próxima parte por pedir
+            por_sumar = 0          # próxima parte que se agrega a la suma
+            completas = set()
+            with open(destino, 'rb') as f, ThreadPoolExecutor(max_workers=partes_paralelas) as pool:
+                en_curso = {}
+                while por_sumar < len(inicios):
+                    # Se mantienen "partes_paralelas" partes en curso, sin adelantarse
+                    # demasiado a la suma (así se suman mientras siguen en memoria)
+                    while (siguiente < len(inicios) and len(en_curso) < partes_paralelas
+                           and siguiente - por_sumar < 2 * partes_paralelas):
+                        inicio = inicios[siguiente]
+                        fin = min(inicio + tamanyo_parte, tamanyo) - 1
+                        en_curso[pool.submit(_pedir, sesion, url, destino, inicio, fin)] = siguiente
+                        siguiente += 1
+                    listas, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                    for tarea in listas:
+                        parte = en_curso.pop(tarea)
+                        tarea.result()
+                        completas.add(parte)
+                    while por_sumar in completas:
+                        completas.discard(por_sumar)
+                        if calculo is not None:
+                            inicio = inicios[por_sumar]
+                            _sumar_parte(f, calculo, inicio, min(tamanyo_parte, tamanyo - inicio))
+                        por_sumar += 1
+        if calculo is not None and calculo.hexdigest().lower() != suma.lower():
+            raise ErrorSumaVerificacion("La suma de verificación de lo descargado desde "+url+" no coincide con la publicada")
+    except BaseException:
+        if Path(destino).exists():
+            Path(destino).unlink()
+        raise
+    return tamanyo
+
+
+def _descargar_de_replicas(archivo, ruta, limitador=None):
+    '''
+    Se descarga el archivo en "ruta" desde la más rápida de sus réplicas HTTP,
+    cambiando de réplica si una falla.
+    '''
+    error = None
+    for url in ordenar_replicas(direcciones_archivo(archivo, 'download_url')):
+        nodo = nodo_url(url)
+        if limitador is not None:
+            limitador.adquirir(nodo)
+        temporal = ruta_temporal(ruta)
+        inicio = time.perf_counter()
+        try:
+            print("Descargando el archivo completo "+archivo.filename+" desde "+nodo)
+            with medir('descarga_http', nodo=nodo, archivo=archivo.filename) as metrica:
+                metrica['bytes'] = descargar_por_rangos(url, temporal, archivo.size, archivo.checksum_type,
+                                                        archivo.checksum)
+            registrar_latencia(nodo, time.perf_counter() - inicio)
+            os.replace(temporal, ruta)
+            return
+        except Exception as e:
+            error = e
+            registrar_error(nodo)
+            print("Falló la descarga de "+archivo.filename+" desde "+nodo+" ("+type(e).__name__+": "+str(e)+")")
+        finally:
+            if limitador is not None:
+                limitador.liberar(nodo)
+    if error is None:
+        error = OSError("El archivo "+archivo.filename+" no tiene dirección HTTP")
+    raise error
+
+
+def obtener_archivo(archivo, limitador=None, carpeta=None):
+    '''
+    Se devuelve la ruta local del archivo completo: si está en el caché se usa
+    tal cual; si no, se descarga desde la más rápida de sus réplicas HTTP
+    (cambiando de réplica si una falla) y se guarda en el caché. El archivo
+    queda reservado (ver "reservar_archivo"): al terminar de leerlo se debe
+    llamar a "soltar_archivo".
+    '''
+    ruta = archivo_en_cache(archivo, carpeta)
+    if ruta is not None:
+        print("Se usa el archivo "+archivo.filename+" guardado en el caché")
+        return ruta
+
+    ruta = ruta_en_cache(archivo, carpeta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    reservar_archivo(ruta)
+    try:
+        if archivo.size:
+            liberar_espacio(int(archivo.size), carpeta)
+        if not archivo.checksum:
+            print("El archivo "+archivo.filename+" no tiene suma de verificación publicada, no se verifica")
+        _descargar_de_replicas(archivo, ruta, limitador)
+    except BaseException:
+        soltar_archivo(ruta)
+        raise
+    return ruta
+
+
+def fraccion_necesaria(archivo, anyos, zona):
+    '''
+    Se estima qué fracción del archivo se necesita: la de los años pedidos
+    entre los que tiene el archivo, por la del área de la zona
+    (lonmin, lonmax, latmin, latmax) sobre la grilla global.
+    '''
+    anyos_archivo = archivo.anyofin - archivo.anyoini + 1
+    lonmin, lonmax, latmin, latmax = zona
+    fraccion_tiempo = min(1.0, len(anyos) / anyos_archivo) if anyos_archivo > 0 else 1.0
+    fraccion_zona = min(1.0, (lonmax - lonmin) / 360.0) * min(1.0, (latmax - latmin) / 180.0)
+    return fraccion_tiempo * fraccion_zona
+
+
+def validar_acceso(acceso):
+    '''
+    Se revisa que el tipo de acceso pedido exista y se devuelve.
+    '''
+    if acceso not in accesos:
+        raise ValueError("Tipo de acceso no válido ("+str(acceso)+"): debe ser 'opendap', 'http' o 'auto'")
+    return acceso
+
+
+def elegir_acceso(archivo, anyos, zona, acceso='auto', carpeta=None):
+    '''
+    Se elige cómo leer un archivo: 'http' (archivo completo en el caché local)
+    u 'opendap' (solo los datos necesarios, desde el servidor).
+    '''
+    validar_acceso(acceso)
+    if acceso != 'auto':
+        return acceso
+    if not archivo.download_url:
+        return 'opendap'
+    if not archivo.opendap_url or ruta_en_cache(archivo, carpeta).exists():
+        return 'http'
+    return 'http' if fraccion_necesaria(archivo, anyos, zona) >= fraccion_minima_http else 'opendap'
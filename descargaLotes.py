@@ -0,0 +1,213 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo permite descargar en lote una matriz de modelos, escenarios,
+variables y temporalidades. La matriz se divide en unidades de trabajo
+(modelo, escenario, variable, temporalidad, rango de años) que se reparten
+entre varios hilos o procesos. Para no sobrecargar un mismo nodo de datos
+ESGF se limita la cantidad de lecturas simultáneas por nodo, y al final
+se muestra el rendimiento total de la descarga.
+
+NOTA: Este módulo utiliza el módulo "descargaCMIP6.py", por lo tanto,
+ambos se deben tener en la misma carpeta
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from descargaCMIP6 import descargar_anyos_zonas, ErrorDescargaCMIP6
+from salidaConsolidada import tamanyo_salida
+import metricasDescarga
+from metricasDescarga import registrar_metrica, reporte_metricas
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+class LimitadorNodos:
+    '''
+    Limita la cantidad de lecturas simultáneas a cada nodo de datos ESGF.
+    Quien pide un nodo que ya está en el límite espera (sin consumir CPU) a
+    que se libere una lectura de ese nodo. Los contadores y la condición
+    pueden ser objetos compartidos de un "multiprocessing.Manager", de modo
+    que el límite se respete también cuando la descarga se reparte entre
+    varios procesos.
+    '''
+
+    def __init__(self, limite, contadores=None, condicion=None):
+        self.limite = int(limite)
+        self.contadores = {} if contadores is None else contadores
+        self.condicion = threading.Condition() if condicion is None else condicion
+
+    def adquirir(self, nodo):
+        with self.condicion:
+            while self.contadores.get(nodo, 0) >= self.limite:
+                self.condicion.wait()
+            self.contadores[nodo] = self.contadores.get(nodo, 0) + 1
+
+    def liberar(self, nodo):
+        with self.condicion:
+            self.contadores[nodo] = max(self.contadores.get(nodo, 1) - 1, 0)
+            self.condicion.notify_all()
+
+
+def unidades_trabajo(modelos, escenarios, variables, frecuencias, anyos, anyos_por_unidad=None):
+    '''
+    Se arma la lista de unidades de trabajo (modelo, escenario, variable,
+    temporalidad, año inicial, año final) a partir de la matriz dada.
+    "anyos" puede ser una tupla (año inicial, año final) común a todos los
+    escenarios, o un diccionario {escenario: (año inicial, año final)}, ya que
+    los datos históricos van de 1850 a 2014 y los escenarios SSP de 2015 a 2100.
+    Si se da "anyos_por_unidad", el rango de años se divide en bloques de ese
+    tamaño para repartir mejor el trabajo.
+    '''
+    unidades = []
+    for modelo in modelos:
+        for escenario in escenarios:
+            if isinstance(anyos, dict):
+                if escenario not in anyos:
+                    continue
+                anyoini, anyofin = anyos[escenario]
+            else:
+                anyoini, anyofin = anyos
+            anyoini = int(anyoini)
+            anyofin = int(anyofin)
+            paso = int(anyos_por_unidad) if anyos_por_unidad else (anyofin - anyoini + 1)
+            for varclim in variables:
+                for frecuencia in frecuencias:
+                    for inicio in range(anyoini, anyofin + 1, paso):
+                        unidades.append((modelo, escenario, varclim, frecuencia,
+                                         inicio, min(inicio + paso - 1, anyofin)))
+    return unidades
+
+
+def _ejecutar_unidad(unidad, zonas, rutasalidas, limitador, reanudar, codificacion, consolidar,
+                     tiempos_por_bloque, acceso, productos, regrillado):
+    '''
+    Se descarga una unidad de trabajo y se devuelve un resumen de la misma
+    (archivos generados, bytes escritos, tiempo empleado y error, si lo hubo).
+    '''
+    modelo, escenario, varclim, frecuencia, anyoini, anyofin = unidad
+    inicio = time.perf_counter()
+    error = None
+    generados = []
+    try:
+        generados = descargar_anyos_zonas(modelo, escenario, varclim, frecuencia, anyoini, anyofin,
+                                          zonas, rutasalidas, limitador=limitador, reanudar=reanudar,
+                                          codificacion=codificacion, consolidar=consolidar,
+                                          tiempos_por_bloque=tiempos_por_bloque, acceso=acceso,
+                                          productos=productos, regrillado=regrillado)
+    except ErrorDescargaCMIP6 as e:
+        error = str(e)
+    except Exception as e:
+        error = type(e).__name__ + ": " + str(e)
+    bytes_escritos = sum(tamanyo_salida(archivo) for archivo in generados)
+    resultado = {
+        'unidad': unidad,
+        'archivos': generados,
+        'bytes': bytes_escritos,
+        'segundos': time.perf_counter() - inicio,
+        'error': error,
+    }
+    registrar_metrica('unidad', resultado['segundos'], unidad='_'.join(str(valor) for valor in unidad),
+                      archivos=len(generados), bytes=bytes_escritos, error=error)
+    return resultado
+
+
+def descargar_lote(unidades, zonas, rutasalidas,
+                   trabajadores=4, tipo_pool='hilos', limite_por_nodo=2, reanudar=False,
+                   codificacion=None, consolidar=None, tiempos_por_bloque=None, acceso='opendap',
+                   productos=None, regrillado=None):
+    '''
+    Se descargan las unidades de trabajo para las zonas dadas ("zonas" es un
+    diccionario {nombrezona: (lonmin, lonmax, latmin, latmax)}, y todas las zonas
+    se recortan de una misma lectura). Las unidades se reparten entre "trabajadores" hilos o procesos
+    ("tipo_pool" igual a 'hilos' o 'procesos'), permitiendo como máximo
+    "limite_por_nodo" lecturas simultáneas a un mismo nodo de datos ESGF.
+    Si "reanudar" es True, solo se descargan los archivos que faltan o están dañados.
+    "codificacion" son las opciones de los archivos de salida (ver "codificacionSalida.py"),
+    y "consolidar" ('zarr', 'netcdf' o None) si cada unidad se guarda en una sola
+    salida en lugar de un archivo por año (ver "salidaConsolidada.py").
+    "tiempos_por_bloque" es el tamaño de los bloques en que se lee cada año
+    (ver "extraccionBloques.py"; None para leer cada año de una vez), y "acceso"
+    ('opendap', 'http' o 'auto') cómo se leen los archivos remotos (ver "descargaHTTP.py").
+    "productos" es la lista de productos derivados que se calculan a medida que
+    se descarga cada unidad (ver "productosDerivados.py"; None para ninguno), y
+    "regrillado" las opciones de la malla común a la que se llevan los datos
+    (ver "regrillado.py"; None para conservar la malla de cada modelo).
+    Al final se muestra y se devuelve el resumen del rendimiento total, y si las
+    métricas están activadas (ver "metricasDescarga.py") el reporte por fase y por nodo.
+    '''
+    inicio = time.perf_counter()
+    inicio_lote = time.time()
+    resultados = []
+
+    gestor = None
+    if tipo_pool == 'procesos':
+        gestor = multiprocessing.Manager()
+        limitador = LimitadorNodos(limite_por_nodo, gestor.dict(), gestor.Condition())
+        pool = ProcessPoolExecutor(max_workers=trabajadores)
+    elif tipo_pool == 'hilos':
+        limitador = LimitadorNodos(limite_por_nodo)
+        pool = ThreadPoolExecutor(max_workers=trabajadores)
+    else:
+        raise ErrorDescargaCMIP6("Tipo de pool no válido ("+str(tipo_pool)+"): debe ser 'hilos' o 'procesos'")
+
+    try:
+        with pool:
+            tareas = [pool.submit(_ejecutar_unidad, unidad, zonas, rutasalidas, limitador, reanudar, codificacion,
+                                  consolidar, tiempos_por_bloque, acceso, productos, regrillado)
+                      for unidad in unidades]
+            for tarea in as_completed(tareas):
+                resultado = tarea.result()
+                resultados.append(resultado)
+                etiqueta = '_'.join(str(valor) for valor in resultado['unidad'])
+                if resultado['error']:
+                    print("--- ERROR en la unidad "+etiqueta+" ---")
+                    print(resultado['error'])
+                else:
+                    print("Unidad "+etiqueta+" terminada: "+str(len(resultado['archivos']))+" archivos en "
+                          +f"{resultado['segundos']:.1f}"+" s")
+    finally:
+        if gestor is not None:
+            gestor.shutdown()
+
+    resumen = resumen_lote(resultados, time.perf_counter() - inicio)
+    if metricasDescarga.archivo_metricas is not None:
+        resumen['metricas'] = reporte_metricas(desde=inicio_lote)
+    return resumen
+
+
+def resumen_lote(resultados, segundos):
+    '''
+    Se calcula y se muestra el rendimiento total del lote: unidades terminadas
+    y con error, archivos generados, MB escritos, MB/s y archivos por segundo.
+    '''
+    archivos = sum(len(resultado['archivos']) for resultado in resultados)
+    megabytes = sum(resultado['bytes'] for resultado in resultados) / 1e6
+    errores = sum(1 for resultado in resultados if resultado['error'])
+    resumen = {
+        'unidades': len(resultados),
+        'unidades_con_error': errores,
+        'archivos': archivos,
+        'megabytes': megabytes,
+        'segundos': segundos,
+        'mb_por_segundo': megabytes / segundos if segundos > 0 else 0.0,
+        'archivos_por_segundo': archivos / segundos if segundos > 0 else 0.0,
+    }
+    print("Resumen del lote: "+str(resumen['unidades'])+" unidades ("+str(errores)+" con error), "
+          +str(archivos)+" archivos, "+f"{megabytes:.1f}"+" MB en "+f"{segundos:.1f}"+" s ("
+          +f"{resumen['mb_por_segundo']:.2f}"+" MB/s, "+f"{resumen['archivos_por_segundo']:.2f}"+" archivos/s)")
+    return resumen
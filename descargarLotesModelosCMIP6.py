@@ -0,0 +1,178 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este script realiza la descarga en lote de los datos del CMIP6, para una o varias
+zonas delimitadas definidas por el usuario, para varios modelos, escenarios, variables
+y temporalidades a la vez. El trabajo se reparte entre varios hilos o procesos,
+limitando la cantidad de lecturas simultáneas a cada nodo de datos ESGF.
+
+NOTA: Este script utiliza los módulos "descargaLotes.py" y "descargaCMIP6.py",
+por lo tanto, todos se deben tener en la misma carpeta. Los pasos de instalación
+del entorno son los mismos del script "descargarVariosAnyosDatosModelosCMIP6-v1.py"
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+from pathlib import Path
+from descargaCMIP6 import validar_parametros, validar_anyos, ErrorDescargaCMIP6
+from descargaLotes import unidades_trabajo, descargar_lote
+from metricasDescarga import activar_metricas
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+#--VARIABLES DEFINIDAS POR EL USUARIO--
+
+# Se definen los modelos para los cuales se requieren los datos
+# Posibles valores: 'MPI-ESM1-2-HR', 'MRI-ESM2-0', 'CMCC-ESM2', 'GFDL-ESM4'
+modelos=['MPI-ESM1-2-HR', 'MRI-ESM2-0', 'CMCC-ESM2', 'GFDL-ESM4']
+
+# Se definen los escenarios y, para cada uno, el rango de años a descargar
+# (año inicial, año final). Los datos históricos van desde 1850 hasta 2014,
+# y los escenarios SSP futuros desde 2015 hasta 2100
+# Posibles escenarios: 'historical', 'ssp126', 'ssp245', 'ssp370', 'ssp585'
+anyos={
+    'historical': (1981, 2014),
+    'ssp126': (2015, 2100),
+    'ssp245': (2015, 2100),
+    'ssp370': (2015, 2100),
+    'ssp585': (2015, 2100),
+}
+
+# Se definen las variables climáticas a descargar
+# Posibles valores: 'tas', 'pr', 'tasmax', 'tasmin'
+variables=['tas', 'pr', 'tasmax', 'tasmin']
+
+# Se definen las resoluciones temporales de los datos a descargar
+# Posibles valores: 'day' (diaria), 'mon' (mensual)
+frecuencias=['day', 'mon']
+
+# Cantidad de años de cada unidad de trabajo (None para no dividir el rango de años)
+anyos_por_unidad=20
+
+# Cantidad de hilos o procesos que descargan al mismo tiempo, el tipo de
+# reparto ('hilos' o 'procesos') y la cantidad máxima de lecturas simultáneas
+# a un mismo nodo de datos ESGF
+trabajadores=8
+tipo_pool='hilos'
+limite_por_nodo=2
+
+# Se definen las zonas para las cuales se descargarán los datos, en la forma
+#   'nombrezona': (lonmin, lonmax, latmin, latmax)
+# (mismas indicaciones del script "descargarVariosAnyosDatosModelosCMIP6-v1.py").
+# Los datos se piden al servidor una sola vez para la zona que contiene a todas,
+# y de ella se recorta cada zona
+zonas={
+    'Colombia': (-79.5, -66.5, -4.5, 13.5),
+    'Peru': (-81.5, -68.5, -18.5, 0.5),
+    'Chile': (-76.0, -66.0, -56.0, -17.5),
+    'Latinoamerica': (-90, -30, -60, 20),
+}
+
+# Se define la carpeta en la que quedarán almacenados los archivos NetCDF a generar
+rutasalidas = Path("/mnt/ed616187-6f4d-404b-94f6-670ca5b49fbc/CIIFEN/1")
+
+# Si se define como True, se reanuda una descarga anterior: solo se descargan
+# los archivos que no están en el manifiesto de descargas de la carpeta de
+# salida, o que están dañados (ver "manifiestoDescargas.py")
+# Ejemplo: reanudar=True
+reanudar=False
+
+# Se define la codificación de los archivos NetCDF4 de salida (ver "codificacionSalida.py"):
+#   compresion: 'zlib', 'zstd' o None (sin compresión)
+#   nivel: nivel de compresión (1 a 9 para zlib)
+#   shuffle: True o False (filtro que suele mejorar la compresión)
+#   fragmentos: 'serie' (lectura rápida de series de tiempo), 'mapa' (lectura
+#               rápida de mapas de una fecha) o None
+#   empaquetar: True para guardar los datos como enteros de 16 bits con
+#               factor de escala y desplazamiento (archivos más pequeños)
+# Si se define codificacion=None, los archivos se escriben sin codificación
+# Ejemplo: codificacion={'compresion': 'zlib', 'nivel': 4, 'shuffle': True, 'fragmentos': 'serie', 'empaquetar': False}
+codificacion=None
+
+# Si se define como 'zarr' o 'netcdf', en lugar de un archivo por año se genera
+# una sola salida con todo el rango de años (un almacén Zarr o un archivo NetCDF),
+# a la que se le agrega cada año a medida que se descarga (ver "salidaConsolidada.py").
+# Si se define como None se genera un archivo por año
+consolidar=None
+
+# Cantidad de tiempos (días o meses) que se piden al servidor de una vez al extraer
+# cada año. Para datos diarios de zonas grandes o modelos de alta resolución
+# (como MPI-ESM1-2-HR) se recomienda usar bloques de 30 días, para no agotar la
+# memoria ni el tiempo de espera del servidor (ver "extraccionBloques.py").
+# Si se define como None, cada año se pide completo de una vez
+# Ejemplo: tiempos_por_bloque=30
+tiempos_por_bloque=None
+
+# Se define cómo se leen los archivos remotos (ver "descargaHTTP.py"):
+#   'opendap': se piden al servidor solo los años y la zona requeridos
+#   'http': se descarga cada archivo completo a un caché local y de él se extraen
+#           los datos (otros años, zonas o variables del mismo archivo ya no
+#           requieren conexión)
+#   'auto': se elige por archivo; se descarga completo si ya está en el caché o si
+#           se necesita una buena parte de él (por ejemplo, una zona grande)
+# Ejemplo: acceso='auto'
+acceso='opendap'
+
+# Productos derivados que se calculan a medida que se descargan los datos, sin
+# volver a leer los archivos (ver "productosDerivados.py"), guardados en un
+# archivo por zona:
+#   'climatologia_mensual': media y varianza de cada mes del año en cada punto
+#   'media_zona': serie de la media de la zona ponderada por el coseno de la latitud
+#   'suma_anual': total de cada año en cada punto (por ejemplo, la precipitación anual
+#                 en kg m-2 a partir de la tasa en kg m-2 s-1)
+# Si se define como None no se calcula ninguno
+productos=None
+
+# Malla común a la que se llevan los datos de cada zona antes de escribirlos,
+# para que las salidas de todos los modelos tengan la misma forma (ver "regrillado.py"):
+#   'metodo': 'bilineal' o 'conservativo'
+#   'resolucion': tamaño de las celdas en grados
+# por ejemplo regrillado={'metodo': 'conservativo', 'resolucion': 1.0}.
+# Si se define como None se conserva la malla de cada modelo
+regrillado=None
+
+# Archivo en el que se registra la duración de cada fase de la descarga (consulta
+# a los nodos, listado de archivos, apertura, lectura y escritura), con los bytes
+# leídos y el nodo usado, en formato JSON por líneas. Al final del lote se muestra
+# un reporte por fase y por nodo (ver "metricasDescarga.py").
+# Si se define como None no se registran las métricas
+archivo_metricas=rutasalidas / 'metricas_descarga.jsonl'
+
+#--FIN DE LAS VARIABLES DEFINIDAS POR EL USUARIO--
+
+
+#----NO MODIFICAR EL SCRIPT DE AQUÍ EN ADELANTE----
+
+if __name__ == '__main__':
+    try:
+        if not zonas:
+            raise ErrorDescargaCMIP6("No se definió ninguna zona para recortar")
+        for nombrezona, (lonmin, lonmax, latmin, latmax) in zonas.items():
+            validar_parametros(lonmin, lonmax, latmin, latmax)
+        for anyoini, anyofin in anyos.values():
+            validar_anyos(anyoini, anyofin)
+    except ErrorDescargaCMIP6 as e:
+        print(str(e))
+        exit(1)
+
+    activar_metricas(archivo_metricas)
+    unidades = unidades_trabajo(modelos, list(anyos), variables, frecuencias, anyos, anyos_por_unidad)
+    print("Se descargarán "+str(len(unidades))+" unidades de trabajo con "+str(trabajadores)+" "+tipo_pool)
+    descargar_lote(unidades, zonas, rutasalidas,
+                   trabajadores=trabajadores, tipo_pool=tipo_pool, limite_por_nodo=limite_por_nodo, reanudar=reanudar,
+                   codificacion=codificacion, consolidar=consolidar,
+                   tiempos_por_bloque=tiempos_por_bloque, acceso=acceso, productos=productos,
+                   regrillado=regrillado)
+
+#----FIN----
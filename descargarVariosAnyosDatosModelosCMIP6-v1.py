@@ -20,8 +20,8 @@ Este script realiza la descarga de los datos del CMIP6, para una zona delimitada
 definida por el usuario. La descarga se hace por modelo, variable, temporalidad 
 y escenario, para un intervalo de años requerido.
 
-NOTA: Este script invoca a otro llamado "scriptDescargaDatosModelosCMIP6-v2.py",
-por lo tanto, ambos scripts se deben tener en la misma carpeta
+NOTA: Este script utiliza el módulo "descargaCMIP6.py", por lo tanto,
+ambos se deben tener en la misma carpeta
 
 Para su uso, se deben realizar unos pasos de una sola vez (es decir, que se realizan
 solamente la primera vez que se vaya a utilizar el script, y luego no es necesario 
@@ -41,9 +41,10 @@ volver a hacerlos -a excepción del paso 2-). Los pasos son los siguientes:
 # descargar los datos que requiera. Se indican los posibles valores de éstos,
 # los cuales se deben escribir tal cual se muestran allí.
 # NOTAS IMPORTANTES:
-#   1. Este script invoca a otro llamado "scriptDescargaDatosModelosCMIP6-v2.py",
-#      por lo tanto, ambos scripts se deben tener en la misma carpeta para
-#      que funcione
+#   1. Este script utiliza el módulo "descargaCMIP6.py", por lo tanto,
+#      ambos se deben tener en la misma carpeta para que funcione. La consulta
+#      a los nodos ESGF y el listado de archivos se hacen una sola vez para todo
+#      el rango de años, y cada archivo remoto se abre una sola vez
 #   2. Esta versión del script funciona únicamente para descargar los datos
 #      de un intervalo de años de sólo un escenario, de sólo una variable, 
 #      de sólo una temporalidad -diaria o mensual- y de un sólo modelo
@@ -78,13 +79,11 @@ volver a hacerlos -a excepción del paso 2-). Los pasos son los siguientes:
 
 # ---NO MODIFICAR ESTAS LÍNEAS---
 from pathlib import Path
-import os
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cf
-import sys
-import subprocess
-from pathlib import Path
+import time
+import cacheMetadatos
+from descargaCMIP6 import descargar_anyos_zonas, validar_parametros, ErrorDescargaCMIP6
+from vistaPreviaZona import dibujar_zonas
+from metricasDescarga import activar_metricas, reporte_metricas
 # ---FIN LIBRERÍAS NECESARIAS---
 
 
@@ -126,8 +125,10 @@ anyofinbuscado=2060
 #               (para el nombre del archivo a descargar)
 # NOTA: Las coordenadas deben ser geográficas (longitud, latitud),
 #       y éstas deben ser en decimales (no en grados, minutos y segundos).
-#       Y para las coordenadas de longitud, éstas deben estar en el formato
-#       -180 a 180 (es decir, las coordenadas oestes son en valores negativos)
+#       Las coordenadas de longitud pueden estar en el formato -180 a 180
+#       (es decir, las coordenadas oestes son en valores negativos) o 0 a 360,
+#       y para una zona que cruza el antimeridiano la longitud este puede
+#       pasar de 180 (por ejemplo, lonmin=170 y lonmax=190)
 #
 # (Este ejemplo es para Sur y Centroamérica y el Caribe)
 lonmin=-90
@@ -136,10 +137,97 @@ latmin=-60
 latmax=20
 nombrezona='Latinoamerica'
 
+# Si se requieren los mismos datos para otras zonas, éstas se definen aquí en la
+# forma 'nombrezona': (lonmin, lonmax, latmin, latmax). Los datos se piden al
+# servidor una sola vez para la zona que contiene a todas, y de ella se recorta
+# cada zona (se genera un archivo por año para cada zona)
+# Ejemplo: zonas_adicionales={'Colombia': (-79.5, -66.5, -4.5, 13.5), 'Peru': (-81.5, -68.5, -18.5, 0.5)}
+zonas_adicionales={}
+
 # Se define la carpeta en la que quedará almacenado el archivo NetCDF a generar
 # (se coloca la ruta completa)
 rutasalidas = Path("/mnt/ed616187-6f4d-404b-94f6-670ca5b49fbc/CIIFEN/1")
 
+# Si se define como True, no se consulta a los nodos ESGF y se trabaja únicamente
+# con el listado de archivos guardado en ejecuciones anteriores (ver "cacheMetadatos.py")
+sin_conexion=False
+
+# Si se define como True, se reanuda una descarga anterior: solo se descargan
+# los archivos que no están en el manifiesto de descargas de la carpeta de
+# salida, o que están dañados (ver "manifiestoDescargas.py")
+# Ejemplo: reanudar=True
+reanudar=False
+
+# Se define la codificación de los archivos NetCDF4 de salida (ver "codificacionSalida.py"):
+#   compresion: 'zlib', 'zstd' o None (sin compresión)
+#   nivel: nivel de compresión (1 a 9 para zlib)
+#   shuffle: True o False (filtro que suele mejorar la compresión)
+#   fragmentos: 'serie' (lectura rápida de series de tiempo), 'mapa' (lectura
+#               rápida de mapas de una fecha) o None
+#   empaquetar: True para guardar los datos como enteros de 16 bits con
+#               factor de escala y desplazamiento (archivos más pequeños)
+# Si se define codificacion=None, los archivos se escriben sin codificación
+# Ejemplo: codificacion={'compresion': 'zlib', 'nivel': 4, 'shuffle': True, 'fragmentos': 'serie', 'empaquetar': False}
+codificacion=None
+
+# Si se define como 'zarr' o 'netcdf', en lugar de un archivo por año se genera
+# una sola salida con todo el rango de años (un almacén Zarr o un archivo NetCDF),
+# a la que se le agrega cada año a medida que se descarga (ver "salidaConsolidada.py").
+# Si se define como None se genera un archivo por año
+consolidar=None
+
+# Cantidad de tiempos (días o meses) que se piden al servidor de una vez al extraer
+# cada año. Para datos diarios de zonas grandes o modelos de alta resolución
+# (como MPI-ESM1-2-HR) se recomienda usar bloques de 30 días, para no agotar la
+# memoria ni el tiempo de espera del servidor (ver "extraccionBloques.py").
+# Si se define como None, cada año se pide completo de una vez
+# Ejemplo: tiempos_por_bloque=30
+tiempos_por_bloque=None
+
+# Se define cómo se leen los archivos remotos (ver "descargaHTTP.py"):
+#   'opendap': se piden al servidor solo los años y la zona requeridos
+#   'http': se descarga cada archivo completo a un caché local y de él se extraen
+#           los datos (otros años, zonas o variables del mismo archivo ya no
+#           requieren conexión)
+#   'auto': se elige por archivo; se descarga completo si ya está en el caché o si
+#           se necesita una buena parte de él (por ejemplo, una zona grande)
+# Ejemplo: acceso='auto'
+acceso='opendap'
+
+# Productos derivados que se calculan a medida que se descargan los datos, sin
+# volver a leer los archivos (ver "productosDerivados.py"), guardados en un
+# archivo por zona:
+#   'climatologia_mensual': media y varianza de cada mes del año en cada punto
+#   'media_zona': serie de la media de la zona ponderada por el coseno de la latitud
+#   'suma_anual': total de cada año en cada punto (por ejemplo, la precipitación anual
+#                 en kg m-2 a partir de la tasa en kg m-2 s-1)
+# Si se define como None no se calcula ninguno
+productos=None
+
+# Malla común a la que se llevan los datos de cada zona antes de escribirlos,
+# para que las salidas de todos los modelos tengan la misma forma (ver "regrillado.py"):
+#   'metodo': 'bilineal' o 'conservativo'
+#   'resolucion': tamaño de las celdas en grados
+# por ejemplo regrillado={'metodo': 'conservativo', 'resolucion': 1.0}.
+# Si se define como None se conserva la malla de cada modelo
+regrillado=None
+
+# Si se define como True, antes de la descarga se muestra el mapa de la zona en
+# una ventana (el proceso sigue al cerrarla). Si no hay pantalla (por ejemplo,
+# al correr desde cron o en un servidor) no se muestra y se continúa
+mostrar_mapa=True
+
+# Si se define una ruta (por ejemplo Path("zona.png")), el mapa de la zona se
+# guarda en ese archivo PNG. Si se define como None no se guarda
+# NOTA: para correr sin variables en el script, con un archivo de configuración,
+#       ver "ejecutarDescargaCMIP6.py"
+vista_previa_png=None
+
+# Archivo en el que se registra la duración de cada fase de la descarga, en
+# formato JSON por líneas; al final se muestra un reporte por fase y por nodo
+# (ver "metricasDescarga.py"). Si se define como None no se registran
+archivo_metricas=None
+
 #--FIN DE LAS VARIABLES DEFINIDAS POR EL USUARIO--
 
 
@@ -148,88 +236,42 @@ rutasalidas = Path("/mnt/ed616187-6f4d-404b-94f6-670ca5b49fbc/CIIFEN/1")
 ## Agregar lo de la validación de las coordenadas!
 
 # Primero se validan las coordenadas de longitud y latitud
-# (es decir, que la coordenada oeste de longitud de la zona 
-# no sea mayor que la coordenada este, y que la coordenada 
-# de latitud sur no sea mayor que la coordenada norte)
-
-if( (lonmin>=lonmax) or (latmin>=latmax) ):
-    print("Error con las coordenadas de la zona:")
-    if(lonmin>=lonmax):
-        print("La coordenada de longitud oeste ("+str(lonmin)+") es mayor o igual que la coordenada de longitud este ("+str(lonmax)+")")
-    if(latmin>=latmax):
-        print("La coordenada de latitud sur ("+str(latmin)+") es mayor o igual que la coordenada de latitud norte ("+str(latmax)+")")
+# (es decir, que la coordenada oeste de longitud de la zona
+# no sea mayor que la coordenada este, que la coordenada
+# de latitud sur no sea mayor que la coordenada norte, y que
+# el año inicial no sea mayor que el año final)
+zonas = {nombrezona: (lonmin, lonmax, latmin, latmax)}
+zonas.update(zonas_adicionales)
+try:
+    for nombre, limites in zonas.items():
+        validar_parametros(*limites, anyoinibuscado, anyofinbuscado)
+except ErrorDescargaCMIP6 as e:
+    print("Zona "+nombre+":")
+    print(str(e))
     exit(1)
-else:
-    if( (anyoinibuscado>anyofinbuscado) ):
-        print("Error con el rango de años dado: El año inicial ("+str(anyoinibuscado)+") es mayor que el año final ("+str(anyofinbuscado)+")")
-        exit(1)
-    else:    
-        # --Estas líneas son para colocar la letra en el plot de las coordenadas 
-        # de la zona para la cual se descargarán los datos--
-        if(lonmin==0):
-            zonalonmin=''
-        else:
-            if(lonmin<0):
-                zonalonmin='W'
-            else:
-                zonalonmin='E'
-
-        if(lonmax==0):
-            zonalonmax=''
-        else:
-            if(lonmax<0):
-                zonalonmax='W'
-            else:
-                zonalonmax='E'
-
-        if(latmin==0):
-            zonalatmin=''
-        else:
-            if(latmin<0):
-                zonalatmin='S'
-            else:
-                zonalatmin='N'
-
-        if(latmax==0):
-            zonalatmax=''
-        else:
-            if(latmax<0):
-                zonalatmax='S'
-            else:
-                zonalatmax='N'
-        #--
-
-        # Se crea el plot de la zona para la cual se descargarán los datos
-        ax = plt.axes(projection=ccrs.Mercator())
-        ax.set_extent([lonmin, lonmax, latmin, latmax])
-        ax.gridlines(draw_labels=True, dms=True, x_inline=False, y_inline=False)
-        ax.add_feature(cf.COASTLINE)
-        ax.add_feature(cf.LAND)
-        ax.add_feature(cf.BORDERS)
-        plt.title('Nombre Zona: '+nombrezona+' (Longitud: '+str(abs(lonmin))+zonalonmin+' a '+str(abs(lonmax))+zonalonmax+', Latitud: '+str(abs(latmin))+zonalatmin+' a '+str(abs(latmax))+zonalatmax+')\n')
-        plt.annotate('(Para continuar el proceso cierre esta ventana)', (0,0), (-20, -20), xycoords='axes fraction', textcoords='offset points', va='top')
-        plt.show()
-        
-        try:
-            script_dir = Path(__file__).resolve().parent
-        except NameError:
-            script_dir = Path.cwd()
-        
-        script_v2 = script_dir / "scriptDescargaDatosModelosCMIP6-v2.py"
-        
-        for anyo in range(int(anyoinibuscado),(int(anyofinbuscado)+1)):
-            try:
-                resultado = subprocess.run([
-                    sys.executable, str(script_v2),
-                    modelo, escenario, varclim, frecuencia, str(anyo),
-                    str(lonmin), str(lonmax), str(latmin), str(latmax),
-                    nombrezona, str(rutasalidas)
-                ], check=True, capture_output=True, text=True)
-        
-                print(resultado.stdout)
-        
-            except subprocess.CalledProcessError as e:
-                print(f"--- ERROR al descargar el año {anyo} ---")
-                print(e.stdout)
-                print(e.stderr)
+
+# Se muestra el mapa de la zona para la cual se descargarán los datos, y/o se
+# guarda en un archivo PNG (si hay zonas adicionales, se dibuja el contorno de cada una)
+if mostrar_mapa or vista_previa_png is not None:
+    dibujar_zonas(zonas, archivo_png=vista_previa_png, mostrar=mostrar_mapa)
+
+cacheMetadatos.sin_conexion = sin_conexion
+activar_metricas(archivo_metricas)
+inicio_descarga = time.time()
+
+# Se descargan todos los años del rango en este mismo proceso
+# (una sola búsqueda en los nodos ESGF y una sola apertura por archivo remoto)
+try:
+    descargar_anyos_zonas(modelo, escenario, varclim, frecuencia, anyoinibuscado, anyofinbuscado,
+                          zonas, rutasalidas, reanudar=reanudar, codificacion=codificacion,
+                          consolidar=consolidar, tiempos_por_bloque=tiempos_por_bloque,
+                          acceso=acceso, productos=productos,
+                          regrillado=regrillado)
+except ErrorDescargaCMIP6 as e:
+    print(str(e))
+    exit(1)
+finally:
+    if archivo_metricas is not None:
+        reporte_metricas(desde=inicio_descarga)
+
 #----FIN----
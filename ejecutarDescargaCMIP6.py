@@ -0,0 +1,254 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este script permite descargar los datos del CMIP6 sin modificar variables
+dentro del código: los parámetros se leen de un archivo de configuración
+(TOML o YAML) y/o de la línea de comandos, y no se abre ninguna ventana, de
+modo que se puede correr desde cron o en un servidor de cálculo. El mapa de
+la zona se puede guardar en un archivo PNG con la opción --vista-previa.
+
+Ejemplos de uso:
+  python ejecutarDescargaCMIP6.py --config configuracionEjemplo.toml
+  python ejecutarDescargaCMIP6.py --modelo MPI-ESM1-2-HR --escenario ssp370 --variable tas,pr
+      --frecuencia mon --anyos 2041-2060 --zona Colombia:-79.5,-66.5,-4.5,13.5 --salida /datos/CMIP6
+  python ejecutarDescargaCMIP6.py --config configuracionEjemplo.toml --medir-arranque
+
+Los valores dados en la línea de comandos reemplazan a los del archivo de
+configuración. Los nombres de los parámetros del archivo de configuración son
+los mismos de las variables definidas por el usuario en
+"descargarLotesModelosCMIP6.py" (ver "configuracionEjemplo.toml").
+
+NOTA: los archivos YAML requieren la librería PyYAML, y los TOML en Python
+anterior a 3.11 requieren la librería tomli.
+
+Para que el arranque sea rápido (por ejemplo, al correr muchos trabajos cortos)
+las librerías pesadas (xarray, pyesgf, matplotlib, cartopy) se importan solo
+cuando se necesitan. Con --medir-arranque se muestra cuánto tarda el script
+desde que inicia hasta que está listo para descargar, y no se descarga nada.
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import time
+_inicio_proceso = time.perf_counter()
+import os
+import sys
+import argparse
+from pathlib import Path
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+# Valores por defecto de los parámetros que no se den en la configuración
+parametros_por_defecto = {
+    'modelos': [],
+    'escenarios': [],
+    'variables': [],
+    'frecuencias': [],
+    'anyos': None,
+    'anyos_por_unidad': None,
+    'zonas': {},
+    'rutasalidas': '.',
+    'trabajadores': 4,
+    'tipo_pool': 'hilos',
+    'limite_por_nodo': 2,
+    'reanudar': False,
+    'sin_conexion': False,
+    'codificacion': None,
+    'consolidar': None,
+    'tiempos_por_bloque': None,
+    'acceso': 'opendap',
+    'productos': None,
+    'regrillado': None,
+    'vista_previa_png': None,
+    'metricas': None,
+}
+
+
+def leer_configuracion(ruta):
+    '''
+    Se lee un archivo de configuración TOML (.toml) o YAML (.yaml, .yml) y se
+    devuelve un diccionario con los parámetros.
+    '''
+    ruta = Path(ruta)
+    if ruta.suffix.lower() in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise SystemExit("Para leer archivos YAML se requiere la librería PyYAML (conda install -c conda-forge pyyaml)")
+        with open(ruta, encoding='utf-8') as f:
+            return yaml.safe_load(f) or {}
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise SystemExit("Para leer archivos TOML en Python anterior a 3.11 se requiere la librería tomli")
+    with open(ruta, 'rb') as f:
+        return tomllib.load(f)
+
+
+def _lista(texto):
+    return [valor.strip() for valor in texto.split(',') if valor.strip()]
+
+
+def _rango_anyos(texto):
+    anyoini, _, anyofin = texto.partition('-')
+    return [int(anyoini), int(anyofin or anyoini)]
+
+
+def _zona(texto):
+    nombre, _, limites = texto.partition(':')
+    valores = [float(valor) for valor in limites.split(',')]
+    if not nombre or len(valores) != 4:
+        raise argparse.ArgumentTypeError("La zona debe ser de la forma nombre:lonmin,lonmax,latmin,latmax")
+    return nombre, valores
+
+
+def _regrillado(texto):
+    metodo, _, resolucion = texto.partition(':')
+    try:
+        return {'metodo': metodo, 'resolucion': float(resolucion)}
+    except ValueError:
+        raise argparse.ArgumentTypeError("El regrillado debe ser de la forma metodo:resolucion (por ejemplo conservativo:1.0)")
+
+
+def argumentos():
+    '''
+    Se definen los argumentos de la línea de comandos.
+    '''
+    parser = argparse.ArgumentParser(description="Descarga de datos del CMIP6 desde los nodos ESGF, sin ventanas.")
+    parser.add_argument('--config', help="archivo de configuración TOML o YAML")
+    parser.add_argument('--modelo', dest='modelos', type=_lista, help="modelos separados por comas")
+    parser.add_argument('--escenario', dest='escenarios', type=_lista, help="escenarios separados por comas")
+    parser.add_argument('--variable', dest='variables', type=_lista, help="variables separadas por comas")
+    parser.add_argument('--frecuencia', dest='frecuencias', type=_lista, help="temporalidades separadas por comas (day, mon)")
+    parser.add_argument('--anyos', type=_rango_anyos, help="rango de años, por ejemplo 2041-2060")
+    parser.add_argument('--anyos-por-unidad', dest='anyos_por_unidad', type=int)
+    parser.add_argument('--zona', dest='zonas', type=_zona, action='append',
+                        help="zona de la forma nombre:lonmin,lonmax,latmin,latmax (se puede repetir)")
+    parser.add_argument('--salida', dest='rutasalidas', help="carpeta de salida")
+    parser.add_argument('--trabajadores', type=int)
+    parser.add_argument('--tipo-pool', dest='tipo_pool', choices=['hilos', 'procesos'])
+    parser.add_argument('--limite-por-nodo', dest='limite_por_nodo', type=int)
+    parser.add_argument('--reanudar', dest='reanudar', action='store_true', default=None)
+    parser.add_argument('--no-reanudar', dest='reanudar', action='store_false')
+    parser.add_argument('--sin-conexion', dest='sin_conexion', action='store_true', default=None,
+                        help="usar solo el listado de archivos guardado (ver cacheMetadatos.py)")
+    parser.add_argument('--consolidar', choices=['zarr', 'netcdf'])
+    parser.add_argument('--bloque', dest='tiempos_por_bloque', type=int, help="tiempos por bloque al extraer cada año")
+    parser.add_argument('--acceso', choices=['opendap', 'http', 'auto'],
+                        help="cómo se leen los archivos remotos (ver descargaHTTP.py)")
+    parser.add_argument('--productos', type=_lista,
+                        help="productos derivados separados por comas (ver productosDerivados.py)")
+    parser.add_argument('--regrillado', type=_regrillado,
+                        help="malla común de la forma metodo:resolucion, con metodo bilineal o conservativo (ver regrillado.py)")
+    parser.add_argument('--vista-previa', dest='vista_previa_png', help="archivo PNG en el que guardar el mapa de las zonas")
+    parser.add_argument('--metricas', help="archivo JSONL en el que registrar la duración de cada fase (ver metricasDescarga.py)")
+    parser.add_argument('--medir-arranque', action='store_true',
+                        help="solo medir el tiempo de arranque (no se descarga nada)")
+    return parser
+
+
+def parametros_ejecucion(opciones):
+    '''
+    Se combinan los valores por defecto, los del archivo de configuración y los
+    de la línea de comandos (en ese orden de prioridad creciente).
+    '''
+    parametros = dict(parametros_por_defecto)
+    if opciones.config:
+        parametros.update(leer_configuracion(opciones.config))
+    for nombre in parametros_por_defecto:
+        valor = getattr(opciones, nombre, None)
+        if valor is not None:
+            parametros[nombre] = dict(valor) if nombre == 'zonas' else valor
+    # En TOML no se puede escribir None, por eso "codificacion = false" indica
+    # que los archivos se escriben sin codificación
+    if parametros['codificacion'] is False:
+        parametros['codificacion'] = None
+    parametros['zonas'] = {nombre: tuple(limites) for nombre, limites in parametros['zonas'].items()}
+    return parametros
+
+
+def validar_ejecucion(parametros):
+    '''
+    Se revisa que estén todos los parámetros necesarios y que las zonas y los
+    años sean válidos.
+    '''
+    from descargaCMIP6 import validar_parametros
+
+    faltantes = [nombre for nombre in ('modelos', 'escenarios', 'variables', 'frecuencias', 'anyos', 'zonas')
+                 if not parametros[nombre]]
+    if faltantes:
+        raise SystemExit("Faltan los parámetros: "+', '.join(faltantes)+" (ver --help)")
+    anyos = parametros['anyos']
+    rangos = anyos.values() if isinstance(anyos, dict) else [anyos]
+    for nombre, limites in parametros['zonas'].items():
+        validar_parametros(*limites)
+        for anyoini, anyofin in rangos:
+            validar_parametros(*limites, int(anyoini), int(anyofin))
+
+
+def principal(argv=None):
+    opciones = argumentos().parse_args(argv)
+    parametros = parametros_ejecucion(opciones)
+
+    # La opción se pasa también por variable de entorno para que la vean los
+    # procesos de trabajo cuando se usa tipo_pool='procesos'
+    if parametros['sin_conexion']:
+        os.environ['DESCARGACMIP6_SIN_CONEXION'] = '1'
+
+    from descargaCMIP6 import ErrorDescargaCMIP6
+    import cacheMetadatos
+    import metricasDescarga
+    from descargaLotes import unidades_trabajo, descargar_lote
+
+    cacheMetadatos.sin_conexion = bool(parametros['sin_conexion'])
+    if parametros['metricas'] is not None:
+        metricasDescarga.activar_metricas(parametros['metricas'])
+    try:
+        validar_ejecucion(parametros)
+    except ErrorDescargaCMIP6 as e:
+        print(str(e))
+        return 1
+
+    if parametros['vista_previa_png'] is not None:
+        from vistaPreviaZona import dibujar_zonas
+        dibujar_zonas(parametros['zonas'], archivo_png=parametros['vista_previa_png'], mostrar=False)
+
+    anyos = parametros['anyos']
+    if not isinstance(anyos, dict):
+        anyos = tuple(anyos)
+    unidades = unidades_trabajo(parametros['modelos'], parametros['escenarios'], parametros['variables'],
+                                parametros['frecuencias'], anyos, parametros['anyos_por_unidad'])
+
+    arranque = time.perf_counter() - _inicio_proceso
+    print("Arranque: "+f"{arranque:.3f}"+" s hasta estar listo para descargar")
+    if opciones.medir_arranque:
+        print("Se descargarían "+str(len(unidades))+" unidades de trabajo")
+        return 0
+
+    print("Se descargarán "+str(len(unidades))+" unidades de trabajo con "+str(parametros['trabajadores'])+" "
+          +parametros['tipo_pool'])
+    resumen = descargar_lote(unidades, parametros['zonas'], Path(parametros['rutasalidas']),
+                             trabajadores=parametros['trabajadores'], tipo_pool=parametros['tipo_pool'],
+                             limite_por_nodo=parametros['limite_por_nodo'], reanudar=parametros['reanudar'],
+                             codificacion=parametros['codificacion'], consolidar=parametros['consolidar'],
+                             tiempos_por_bloque=parametros['tiempos_por_bloque'], acceso=parametros['acceso'],
+                             productos=parametros['productos'], regrillado=parametros['regrillado'])
+    return 1 if resumen['unidades_con_error'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(principal())
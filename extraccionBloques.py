@@ -0,0 +1,111 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo permite extraer los datos de un año por bloques de tiempo (por
+ejemplo de 30 días) en lugar de pedirlos todos de una vez al servidor OPeNDAP.
+Cada bloque se escribe en la salida apenas llega, de modo que en memoria solo
+se tiene un bloque a la vez, y si la lectura de un bloque falla se reintenta
+solo ese bloque y no todo el año. Cada bloque leído se puede entregar a varias
+salidas (por ejemplo, a varias zonas recortadas de la misma lectura).
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import time
+import random
+import threading
+from metricasDescarga import medir
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+# Cantidad de reintentos de la lectura de un bloque, espera inicial entre
+# reintentos (en segundos; se duplica en cada reintento) y espera máxima
+reintentos_bloque = 3
+espera_reintento = 2.0
+espera_maxima = 60.0
+
+# La librería netCDF (y la HDF5 que usa) no admite llamadas simultáneas desde
+# varios hilos, y xarray no toma sus candados en todas las suyas (por ejemplo,
+# al abrir un archivo o al crear sus variables). En una descarga en lote con
+# hilos (ver "descargaLotes.py") toda apertura, lectura, escritura o cierre de
+# un archivo NetCDF se hace con este candado
+candado_netcdf = threading.RLock()
+
+
+def espera_con_variacion(intento, espera=None):
+    '''
+    Se calcula la espera antes del reintento número "intento" (desde 0): se
+    duplica en cada reintento hasta "espera_maxima", y se toma al azar entre la
+    mitad y el total, para que varios hilos o procesos que fallaron al mismo
+    tiempo no vuelvan a consultar al servidor todos a la vez.
+    '''
+    espera = espera_reintento if espera is None else espera
+    return min(espera_maxima, espera * 2**intento) * random.uniform(0.5, 1.0)
+
+
+def leer_bloque(da, reintentos=None, espera=None, metricas=None):
+    '''
+    Se leen del servidor los datos de "da" (un bloque de tiempos) y se devuelven
+    cargados en memoria. Si la lectura falla se reintenta hasta "reintentos"
+    veces, esperando cada vez el doble (con una variación al azar). La lectura se registra en las métricas
+    (ver "metricasDescarga.py") junto con los datos de "metricas" (por ejemplo,
+    el nodo de datos).
+    '''
+    reintentos = reintentos_bloque if reintentos is None else reintentos
+    espera = espera_reintento if espera is None else espera
+    with medir('lectura', **(metricas or {})) as metrica:
+        for intento in range(reintentos + 1):
+            metrica['reintentos'] = intento
+            try:
+                with candado_netcdf:
+                    bloque = da.load()
+                metrica['bytes'] = int(bloque.nbytes)
+                metrica['registros'] = int(bloque.sizes.get('time', 0))
+                return bloque
+            except Exception as e:
+                if intento == reintentos:
+                    raise
+                pausa = espera_con_variacion(intento, espera)
+                print("Falló la lectura de un bloque ("+type(e).__name__+": "+str(e)+"), se reintenta en "
+                      +f"{pausa:.1f}"+" s")
+                time.sleep(pausa)
+
+
+def extraer_por_bloques(da, escritores, tiempos_por_bloque=None, metricas=None, reabrir=None):
+    '''
+    Se leen los datos de "da" por bloques de "tiempos_por_bloque" tiempos (o todos
+    de una vez si es None) y cada bloque, apenas se lee, se entrega a cada una de
+    las funciones de "escritores" (por ejemplo, una por cada zona a recortar),
+    de modo que cada bloque se pide al servidor una sola vez. "metricas" son los
+    datos que acompañan las métricas de cada lectura y escritura.
+    Si se da "reabrir", cuando un bloque no se puede leer después de todos los
+    reintentos se llama a "reabrir(error)", que debe devolver los mismos datos
+    desde otra réplica del archivo (o lanzar el error si no quedan réplicas), y
+    se continúa desde ese mismo bloque (ver "replicasESGF.py").
+    '''
+    tiempos = da.sizes['time']
+    paso = int(tiempos_por_bloque) if tiempos_por_bloque else max(tiempos, 1)
+    for inicio in range(0, tiempos, paso):
+        while True:
+            try:
+                bloque = leer_bloque(da.isel(time=slice(inicio, inicio + paso)), metricas=metricas)
+                break
+            except Exception as e:
+                if reabrir is None:
+                    raise
+                da = reabrir(e)
+        for escribir in escritores:
+            with medir('escritura', registros=int(bloque.sizes['time']), **(metricas or {})):
+                escribir(bloque)
+        del bloque
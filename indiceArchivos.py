@@ -0,0 +1,124 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo arma, a partir del listado de archivos de un conjunto de datos,
+el plan de lectura de los años buscados: qué archivos hay que abrir y, de cada
+uno, qué años y en qué posiciones de la dimensión del tiempo. El índice se
+arma una sola vez por conjunto de datos con el rango de años de cada archivo
+(tomado de su nombre) y, si ya se conoce, la cantidad de tiempos de cada año
+en el archivo (tomada de su coordenada de tiempo la primera vez que se abre, y
+guardada en el caché de metadatos; ver "cacheMetadatos.py").
+
+Con la coordenada de tiempo conocida, un archivo que según su nombre tiene un
+año pero que en realidad no tiene datos de él no se abre. Un año puede quedar
+repartido entre dos archivos (por ejemplo, si un archivo termina a mitad de
+año); en ese caso el plan tiene un tramo del año en cada archivo y la descarga
+los une en la misma salida.
+'''
+
+
+def indice_archivos(archivos):
+    '''
+    Se arma el índice de los archivos de un conjunto de datos: la lista de
+    archivos en orden cronológico y los arreglos con su año inicial y final.
+    '''
+    import numpy as np
+
+    archivos = sorted(archivos, key=lambda archivo: (archivo.anyoini, archivo.inicio or '', archivo.filename))
+    return {
+        'archivos': archivos,
+        'anyoini': np.array([archivo.anyoini for archivo in archivos], dtype=int),
+        'anyofin': np.array([archivo.anyofin for archivo in archivos], dtype=int),
+    }
+
+
+def resumen_tiempos(tiempos):
+    '''
+    Se resume la coordenada de tiempo ya decodificada de un archivo como la
+    lista [[año, cantidad de tiempos], ...] (en el orden del archivo), que es
+    lo que se guarda en el caché de metadatos.
+    '''
+    import numpy as np
+
+    anyostiempo = np.asarray(tiempos.year)
+    if anyostiempo.size == 0:
+        return []
+    cortes = np.flatnonzero(np.diff(anyostiempo)) + 1
+    inicios = np.concatenate(([0], cortes))
+    cantidades = np.diff(np.concatenate((inicios, [anyostiempo.size])))
+    return [[int(anyostiempo[inicio]), int(cantidad)] for inicio, cantidad in zip(inicios, cantidades)]
+
+
+def tramos_conocidos(anyos_tiempo, anyos):
+    '''
+    Se calculan, con el resumen de la coordenada de tiempo de un archivo
+    (ver "resumen_tiempos"), la posición inicial y final de cada uno de los
+    años buscados. Se devuelve la lista [(año, tiempoini, tiempofin), ...] solo
+    con los años que tienen datos en el archivo.
+    '''
+    import numpy as np
+
+    if not anyos_tiempo:
+        return []
+    resumen = np.asarray(anyos_tiempo, dtype=int)
+    anyostiempo, cantidades = resumen[:, 0], resumen[:, 1]
+    fines = np.cumsum(cantidades)
+    inicios = fines - cantidades
+    posiciones = np.searchsorted(anyostiempo, anyos)
+    posiciones = np.minimum(posiciones, anyostiempo.size - 1)
+    encontrados = anyostiempo[posiciones] == anyos
+    return [(int(anyo), int(inicios[posicion]), int(fines[posicion]))
+            for anyo, posicion in zip(np.asarray(anyos)[encontrados], posiciones[encontrados])]
+
+
+def planes_lectura(indice, anyos):
+    '''
+    Se arma el plan de lectura de los años buscados: la lista, en orden
+    cronológico, de (archivo, [(año, tiempoini, tiempofin), ...]) solo con los
+    archivos que hay que abrir. Los archivos de cada año se encuentran en una
+    sola pasada (búsqueda binaria de los rangos de años de todos los archivos
+    sobre los años buscados). Si no se conoce la coordenada de tiempo de un
+    archivo, sus posiciones quedan en None y se calculan al abrirlo.
+    '''
+    import numpy as np
+
+    anyos = np.unique(np.asarray(list(anyos), dtype=int))
+    primeros = np.searchsorted(anyos, indice['anyoini'], side='left')
+    ultimos = np.searchsorted(anyos, indice['anyofin'], side='right')
+    planes = []
+    for posicion in np.flatnonzero(ultimos > primeros):
+        archivo = indice['archivos'][posicion]
+        anyosarch = anyos[primeros[posicion]:ultimos[posicion]]
+        anyos_tiempo = getattr(archivo, 'anyos_tiempo', None)
+        if anyos_tiempo is None:
+            tramos = [(int(anyo), None, None) for anyo in anyosarch]
+        else:
+            tramos = tramos_conocidos(anyos_tiempo, anyosarch)
+        if tramos:
+            planes.append((archivo, tramos))
+    return planes
+
+
+def ultimo_tramo(planes):
+    '''
+    Se devuelve {año: posición en "planes" del último archivo que tiene datos
+    de ese año}, para saber cuándo se terminó de leer un año repartido entre
+    varios archivos.
+    '''
+    ultimos = {}
+    for posicion, (_, tramos) in enumerate(planes):
+        for anyo, _, _ in tramos:
+            ultimos[anyo] = posicion
+    return ultimos
@@ -0,0 +1,156 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo lleva el manifiesto de las descargas terminadas. Por cada archivo
+generado (modelo, escenario, variable, temporalidad, año y zona) se agrega
+una línea al archivo "manifiesto_descargas.jsonl" de la carpeta de salida,
+con el tamaño y la suma de verificación (SHA-256) del archivo.
+
+Los archivos se escriben primero con un nombre temporal y solo al terminar se
+renombran con su nombre final, de modo que si la descarga se interrumpe no
+queda un archivo a medias con el nombre definitivo. Al reanudar una descarga
+se revisan los archivos del manifiesto y solo se vuelven a descargar los que
+faltan o están dañados.
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+nombre_manifiesto = 'manifiesto_descargas.jsonl'
+
+_candado = threading.Lock()
+
+
+def clave_unidad(modelo, escenario, varclim, frecuencia, anyo, nombrezona):
+    '''
+    Se arma la clave con la que se identifica un archivo en el manifiesto.
+    '''
+    return '_'.join([varclim, frecuencia, escenario, modelo, str(anyo), nombrezona])
+
+
+def suma_archivo(ruta, bloque=1 << 20):
+    '''
+    Se calcula la suma de verificación SHA-256 de un archivo.
+    '''
+    suma = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for parte in iter(lambda: f.read(bloque), b''):
+            suma.update(parte)
+    return suma.hexdigest()
+
+
+def leer_manifiesto(rutasalidas):
+    '''
+    Se lee el manifiesto de la carpeta de salida y se devuelve un diccionario
+    {clave: registro}. Si una clave aparece varias veces se toma la última;
+    las líneas dañadas (por ejemplo, por una interrupción) se ignoran.
+    '''
+    registros = {}
+    try:
+        with open(Path(rutasalidas) / nombre_manifiesto, encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                    registros[registro['clave']] = registro
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except OSError:
+        pass
+    return registros
+
+
+def registrar_archivo(rutasalidas, clave, ruta):
+    '''
+    Se agrega al manifiesto el registro de un archivo terminado.
+    '''
+    registro = {
+        'clave': clave,
+        'archivo': Path(ruta).name,
+        'bytes': os.path.getsize(ruta),
+        'sha256': suma_archivo(ruta),
+        'terminado': time.time(),
+    }
+    with _candado:
+        with open(Path(rutasalidas) / nombre_manifiesto, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(registro) + '\n')
+    return registro
+
+
+def registrar_consolidado(rutasalidas, clave, ruta, registros):
+    '''
+    Se agrega al manifiesto el registro de un año agregado a una salida
+    consolidada, con la cantidad de tiempos que tenía la salida al terminar
+    (ver "salidaConsolidada.py").
+    '''
+    registro = {
+        'clave': clave,
+        'archivo': Path(ruta).name,
+        'registros': int(registros),
+        'terminado': time.time(),
+    }
+    with _candado:
+        with open(Path(rutasalidas) / nombre_manifiesto, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(registro) + '\n')
+    return registro
+
+
+def archivo_valido(rutasalidas, registro, verificar_suma=True):
+    '''
+    Se revisa que el archivo de un registro del manifiesto exista, tenga el
+    tamaño registrado y (si se pide) la misma suma de verificación.
+    '''
+    if registro is None:
+        return False
+    ruta = Path(rutasalidas) / registro['archivo']
+    try:
+        if os.path.getsize(ruta) != registro['bytes']:
+            return False
+    except OSError:
+        return False
+    return (not verificar_suma) or suma_archivo(ruta) == registro['sha256']
+
+
+def ruta_temporal(ruta):
+    '''
+    Se define el nombre temporal (oculto y único por proceso e hilo) con el que
+    se escribe un archivo antes de renombrarlo con su nombre final.
+    '''
+    ruta = Path(ruta)
+    return ruta.with_name('.' + ruta.name + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp')
+
+
+def escribir_atomico(ruta, escribir):
+    '''
+    Se genera un archivo llamando a "escribir(ruta_temporal)" y, si termina
+    sin errores, se renombra con su nombre final. Si hay un error se borra el
+    archivo temporal.
+    '''
+    ruta = Path(ruta)
+    temporal = ruta_temporal(ruta)
+    try:
+        escribir(str(temporal))
+        os.replace(temporal, ruta)
+    except BaseException:
+        if temporal.exists():
+            temporal.unlink()
+        raise
+    return ruta
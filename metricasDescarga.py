@@ -0,0 +1,192 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo registra el tiempo que toma cada fase de la descarga, para saber
+en qué se fue el tiempo cuando una ejecución es lenta. Cada fase medida
+agrega una línea JSON al archivo de métricas con su duración y, según la fase,
+el nodo usado, los bytes transferidos, los registros (tiempos) leídos, los
+reintentos y el error, si lo hubo. Las fases son:
+  'sondeo_nodo':    consulta de prueba a un nodo de búsqueda ESGF
+  'seleccion_nodo': elección del nodo de búsqueda (incluye los sondeos)
+  'busqueda':       búsqueda del conjunto de datos ("ctx.search()")
+  'listado':        listado de los archivos del conjunto de datos
+  'apertura':       apertura de un archivo remoto ("xr.open_dataset")
+  'lectura':        lectura de un bloque de datos del servidor
+  'descarga_http':  descarga de un archivo completo por HTTP (ver "descargaHTTP.py")
+  'escritura':      escritura de un bloque en una salida (una zona)
+  'anyo':           extracción completa de un año (todas sus zonas)
+  'unidad':         una unidad de trabajo de un lote (ver "descargaLotes.py")
+
+Las métricas solo se registran si se define el archivo de métricas (con
+"activar_metricas" o con la variable de entorno DESCARGACMIP6_METRICAS). Al
+final de un lote se muestra un reporte con la mediana (p50) y el percentil 95
+(p95) de cada fase y los MB/s obtenidos de cada nodo de datos (en las lecturas
+por OPeNDAP y en las descargas por HTTP). El reporte de
+un archivo de métricas también se puede ver después con:
+  python metricasDescarga.py metricas_descarga.jsonl
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+# Archivo en el que se registran las métricas (None para no registrarlas)
+archivo_metricas = os.environ.get('DESCARGACMIP6_METRICAS') or None
+
+# Fases en las que se transfieren datos desde los nodos de datos
+fases_transferencia = ('lectura', 'descarga_http')
+
+_candado = threading.Lock()
+
+
+def activar_metricas(ruta):
+    '''
+    Se define el archivo de métricas (o se desactivan las métricas si "ruta"
+    es None). Se define también la variable de entorno, para que los procesos
+    de trabajo de un lote registren sus métricas en el mismo archivo.
+    '''
+    global archivo_metricas
+    archivo_metricas = None if ruta is None else str(ruta)
+    if archivo_metricas is None:
+        os.environ.pop('DESCARGACMIP6_METRICAS', None)
+    else:
+        os.environ['DESCARGACMIP6_METRICAS'] = archivo_metricas
+
+
+def registrar_metrica(fase, segundos, **datos):
+    '''
+    Se agrega una línea al archivo de métricas con la fase, su duración y los
+    datos adicionales dados. Si las métricas no están activadas no se hace nada.
+    '''
+    if archivo_metricas is None:
+        return
+    registro = {'fase': fase, 'segundos': round(segundos, 6), 'fin': time.time(), 'pid': os.getpid()}
+    registro.update(datos)
+    linea = json.dumps(registro, default=str) + '\n'
+    with _candado:
+        with open(archivo_metricas, 'a', encoding='utf-8') as f:
+            f.write(linea)
+
+
+@contextmanager
+def medir(fase, **datos):
+    '''
+    Se mide la duración del bloque "with" y se registra como la fase dada. El
+    diccionario que se entrega permite agregar datos que se conocen dentro del
+    bloque (por ejemplo, los bytes leídos). Si hay un error se registra y se
+    vuelve a lanzar.
+    '''
+    inicio = time.perf_counter()
+    try:
+        yield datos
+    except BaseException as e:
+        datos['error'] = type(e).__name__ + ": " + str(e)
+        raise
+    finally:
+        registrar_metrica(fase, time.perf_counter() - inicio, **datos)
+
+
+def leer_metricas(ruta=None, desde=None):
+    '''
+    Se leen los registros del archivo de métricas (las líneas dañadas se
+    ignoran). Si se da "desde" (segundos desde la época) solo se devuelven los
+    registros terminados desde ese momento.
+    '''
+    ruta = archivo_metricas if ruta is None else ruta
+    registros = []
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    continue
+                if desde is None or registro.get('fin', 0) >= desde:
+                    registros.append(registro)
+    except (OSError, TypeError):
+        pass
+    return registros
+
+
+def percentil(valores, p):
+    '''
+    Se calcula el percentil "p" (0 a 100) de una lista de valores, interpolando
+    entre los dos valores más cercanos.
+    '''
+    valores = sorted(valores)
+    if not valores:
+        return 0.0
+    posicion = (len(valores) - 1) * p / 100.0
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(valores) - 1)
+    return valores[inferior] + (valores[superior] - valores[inferior]) * (posicion - inferior)
+
+
+def reporte_metricas(ruta=None, desde=None):
+    '''
+    Se calcula y se muestra el reporte de las métricas: por cada fase, la
+    cantidad de mediciones, errores y reintentos, y la mediana (p50), el
+    percentil 95 (p95) y el total de su duración; y por cada nodo de datos los
+    MB transferidos y los MB/s obtenidos en las lecturas y descargas.
+    '''
+    registros = leer_metricas(ruta, desde)
+    fases = {}
+    nodos = {}
+    for registro in registros:
+        fase = fases.setdefault(registro['fase'], {'segundos': [], 'errores': 0, 'reintentos': 0})
+        fase['segundos'].append(registro['segundos'])
+        fase['errores'] += 1 if registro.get('error') else 0
+        fase['reintentos'] += registro.get('reintentos', 0)
+        if registro['fase'] in fases_transferencia and not registro.get('error'):
+            nodo = nodos.setdefault(registro.get('nodo', 'desconocido'), {'bytes': 0, 'segundos': 0.0})
+            nodo['bytes'] += registro.get('bytes', 0)
+            nodo['segundos'] += registro['segundos']
+
+    reporte = {'fases': {}, 'nodos': {}}
+    for nombre, fase in fases.items():
+        reporte['fases'][nombre] = {
+            'cantidad': len(fase['segundos']),
+            'errores': fase['errores'],
+            'reintentos': fase['reintentos'],
+            'p50_s': percentil(fase['segundos'], 50),
+            'p95_s': percentil(fase['segundos'], 95),
+            'total_s': sum(fase['segundos']),
+        }
+    for nombre, nodo in nodos.items():
+        reporte['nodos'][nombre] = {
+            'megabytes': nodo['bytes'] / 1e6,
+            'mb_por_segundo': nodo['bytes'] / 1e6 / nodo['segundos'] if nodo['segundos'] > 0 else 0.0,
+        }
+
+    print(f"{'Fase':<16}{'Cantidad':>9}{'Errores':>9}{'Reintentos':>12}{'p50 s':>10}{'p95 s':>10}{'Total s':>10}")
+    for nombre, fase in reporte['fases'].items():
+        print(f"{nombre:<16}{fase['cantidad']:>9}{fase['errores']:>9}{fase['reintentos']:>12}"
+              f"{fase['p50_s']:>10.3f}{fase['p95_s']:>10.3f}{fase['total_s']:>10.1f}")
+    for nombre, nodo in reporte['nodos'].items():
+        print("Nodo "+nombre+": "+f"{nodo['megabytes']:.1f}"+" MB transferidos a "+f"{nodo['mb_por_segundo']:.2f}"+" MB/s")
+    return reporte
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Uso: python metricasDescarga.py [archivo de métricas]")
+        sys.exit(1)
+    reporte_metricas(sys.argv[1])
@@ -0,0 +1,188 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo selecciona el nodo de búsqueda ESGF a utilizar. En lugar de probar
+los nodos uno por uno (esperando a que cada uno falle antes de pasar al
+siguiente), se consultan todos al mismo tiempo con un tiempo límite estricto
+y se elige el que responda primero.
+
+El resultado de cada consulta (latencia, fallos consecutivos, último éxito
+y último fallo) se guarda en un archivo de salud de los nodos, de modo que en
+las siguientes ejecuciones (mientras la información no haya vencido) los nodos
+que se sabe que están caídos se consultan solo si ninguno de los demás responde.
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as TiempoAgotado
+from metricasDescarga import medir
+from cacheMetadatos import carpeta_cache
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+# Archivo en el que se guarda la salud de los nodos, tiempo de vigencia de la
+# información guardada (en segundos) y tiempo límite de cada consulta (en segundos)
+archivo_salud = carpeta_cache() / 'salud_nodos.json'
+vigencia_salud = 6 * 3600
+tiempo_limite = 20
+
+_candado = threading.Lock()
+
+
+def leer_salud(archivo=None):
+    '''
+    Se lee el archivo de salud de los nodos. Si no existe o está dañado
+    se devuelve un diccionario vacío.
+    '''
+    archivo = Path(archivo or archivo_salud)
+    try:
+        with open(archivo, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def guardar_salud(salud, archivo=None):
+    '''
+    Se guarda el archivo de salud de los nodos (primero en un archivo temporal,
+    que luego se renombra, para no dejarlo a medio escribir).
+    '''
+    archivo = Path(archivo or archivo_salud)
+    archivo.parent.mkdir(parents=True, exist_ok=True)
+    temporal = archivo.with_name(archivo.name + '.' + str(os.getpid()) + '.tmp')
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(salud, f, indent=1, sort_keys=True)
+    os.replace(temporal, archivo)
+
+
+def registrar_resultado(nodo, latencia=None, error=None, archivo=None):
+    '''
+    Se actualiza la salud de un nodo: si la consulta fue exitosa se guarda su
+    latencia y se reinician los fallos; si no, se suma un fallo consecutivo.
+    '''
+    with _candado:
+        salud = leer_salud(archivo)
+        ahora = time.time()
+        registro = salud.get(nodo, {'fallos': 0})
+        if error is None:
+            registro['latencia'] = latencia
+            registro['fallos'] = 0
+            registro['ultimo_exito'] = ahora
+        else:
+            registro['fallos'] = registro.get('fallos', 0) + 1
+            registro['ultimo_fallo'] = ahora
+            registro['ultimo_error'] = error
+        registro['actualizado'] = ahora
+        salud[nodo] = registro
+        guardar_salud(salud, archivo)
+
+
+def ordenar_nodos(nodos, salud, vigencia=None):
+    '''
+    Se ordenan los nodos según la información de salud vigente: primero los
+    sanos de menor latencia, luego los que no tienen información, y al final
+    los que se sabe que están caídos. Se devuelven tres listas: (sanos, desconocidos, caidos).
+    '''
+    vigencia = vigencia_salud if vigencia is None else vigencia
+    ahora = time.time()
+    sanos, desconocidos, caidos = [], [], []
+    for nodo in nodos:
+        registro = salud.get(nodo)
+        if registro is None or (ahora - registro.get('actualizado', 0)) > vigencia:
+            desconocidos.append(nodo)
+        elif registro.get('fallos', 0) > 0:
+            caidos.append(nodo)
+        else:
+            sanos.append(nodo)
+    sanos.sort(key=lambda nodo: salud[nodo].get('latencia', float('inf')))
+    return sanos, desconocidos, caidos
+
+
+def sondear_nodo(nodo, parametros, limite=None):
+    '''
+    Se consulta un nodo con los parámetros de búsqueda dados y se devuelve
+    (contexto de búsqueda, latencia en segundos).
+    '''
+    from pyesgf.search import SearchConnection
+
+    limite = tiempo_limite if limite is None else limite
+    inicio = time.perf_counter()
+    with medir('sondeo_nodo', nodo=nodo):
+        conn = SearchConnection(nodo, distrib=True, timeout=limite)
+        ctx = conn.new_context(facets='*', **parametros)
+        ctx.hit_count  # esta línea dispara la consulta real al servidor
+    return ctx, time.perf_counter() - inicio
+
+
+def _sondear_varios(nodos, parametros, limite, archivo):
+    '''
+    Se consultan todos los nodos dados al mismo tiempo y se devuelve
+    (nodo, contexto de búsqueda) del primero que responda correctamente
+    (el más rápido), o (None, None).
+    '''
+    if not nodos:
+        return None, None
+    pool = ThreadPoolExecutor(max_workers=len(nodos))
+    tareas = {pool.submit(sondear_nodo, nodo, parametros, limite): nodo for nodo in nodos}
+    try:
+        for tarea in as_completed(tareas, timeout=limite):
+            nodo = tareas[tarea]
+            try:
+                ctx, latencia = tarea.result()
+            except Exception as e:
+                print("El nodo " + nodo + " no respondió correctamente (" + type(e).__name__ + "): " + str(e))
+                registrar_resultado(nodo, error=type(e).__name__ + ": " + str(e), archivo=archivo)
+                continue
+            registrar_resultado(nodo, latencia=latencia, archivo=archivo)
+            return nodo, ctx
+    except TiempoAgotado:
+        pass
+    finally:
+        # No se espera a los nodos que aún no han respondido
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    for tarea, nodo in tareas.items():
+        if not tarea.done():
+            print("El nodo " + nodo + " no respondió en " + str(limite) + " s")
+            registrar_resultado(nodo, error='Tiempo agotado (' + str(limite) + ' s)', archivo=archivo)
+    return None, None
+
+
+def seleccionar_nodo(nodos, parametros, limite=None, archivo=None, vigencia=None):
+    '''
+    Se selecciona el nodo a utilizar y se devuelve (nodo, contexto de búsqueda),
+    o (None, None) si ningún nodo respondió. Se consultan al mismo tiempo los
+    nodos sanos (empezando por el más rápido según el archivo de salud) y los
+    que no tienen información vigente, y se usa el primero que responda; solo
+    como último recurso se consultan los que se sabe que están caídos.
+    '''
+    limite = tiempo_limite if limite is None else limite
+    sanos, desconocidos, caidos = ordenar_nodos(nodos, leer_salud(archivo), vigencia)
+    if caidos:
+        print("Se dejan para el final los nodos caídos según el archivo de salud: " + ", ".join(caidos))
+    if sanos:
+        print("Nodo más rápido conocido: " + sanos[0])
+
+    for grupo in (sanos + desconocidos, caidos):
+        if grupo:
+            print("Intentando conectar al mismo tiempo a los nodos: " + ", ".join(grupo))
+            nodo, ctx = _sondear_varios(grupo, parametros, limite, archivo)
+            if ctx is not None:
+                return nodo, ctx
+    return None, None
@@ -0,0 +1,320 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo calcula productos derivados a medida que se descargan los datos,
+sin volver a leer los archivos descargados. Cada bloque de datos recortado a
+una zona actualiza los acumulados de la zona:
+- 'climatologia_mensual': media y varianza de cada punto para cada mes del
+  año (se combinan los acumulados de cada bloque, de modo que la memoria no
+  depende de la cantidad de años).
+- 'media_zona': serie de la media de la zona en cada tiempo, ponderando cada
+  punto por el coseno de su latitud (se omiten los puntos sin dato).
+- 'suma_anual': total de cada año en cada punto. Si la variable es una tasa
+  por segundo (por ejemplo la precipitación, en kg m-2 s-1), cada tiempo se
+  multiplica por su duración (un día, o los días del mes según el calendario
+  del modelo) y el total queda en las unidades acumuladas (kg m-2, es decir,
+  mm de precipitación en el año); si no, es la suma de los valores.
+
+Los datos de un año se acumulan aparte y se agregan a los productos solo
+cuando el año termina de descargarse, para que un año que falla a medias no
+quede contado. Al final los productos de cada zona se guardan en el archivo
+"[variable]_[temporalidad]_[escenario]_[modelo]_[añoinicial]-[añofinal]_[zona]_productos.nc",
+que guarda también los años incluidos; al reanudar una descarga se parte de
+ese archivo y solo se agregan los años que falten.
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+from pathlib import Path
+from manifiestoDescargas import escribir_atomico
+from recorteEspacial import coordenadas_malla
+from extraccionBloques import candado_netcdf
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+productos_disponibles = ('climatologia_mensual', 'media_zona', 'suma_anual')
+
+segundos_dia = 86400.0
+
+
+def nombre_productos(modelo, escenario, varclim, frecuencia, anyoini, anyofin, nombrezona):
+    '''
+    Se define el nombre del archivo de productos derivados de una zona.
+    '''
+    return (varclim+'_'+frecuencia+'_'+escenario+'_'+modelo+'_'+str(anyoini)+'-'+str(anyofin)+'_'+nombrezona
+            +'_productos.nc')
+
+
+def validar_productos(productos):
+    '''
+    Se revisa que los productos pedidos existan y se devuelve su lista.
+    '''
+    productos = list(productos)
+    desconocidos = [producto for producto in productos if producto not in productos_disponibles]
+    if desconocidos:
+        raise ValueError("Productos derivados no válidos ("+', '.join(desconocidos)+"): deben ser "
+                         +', '.join(productos_disponibles))
+    return productos
+
+
+def _unir_momentos(n_a, media_a, m2_a, n_b, media_b, m2_b):
+    '''
+    Se unen la cantidad, la media y la suma de los cuadrados de las desviaciones
+    de dos grupos de datos (fórmula de Chan et al.), punto a punto.
+    '''
+    import numpy as np
+
+    n = n_a + n_b
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = np.where(n_b > 0, media_b - np.where(n_a > 0, media_a, 0.0), 0.0)
+        peso = np.where(n > 0, n_b / n, 0.0)
+    media = np.where(n_a > 0, media_a, 0.0) + delta * peso
+    m2 = np.where(n_a > 0, m2_a, 0.0) + np.where(n_b > 0, m2_b, 0.0) + delta ** 2 * n_a * peso
+    return n, np.where(n > 0, media, np.nan), m2
+
+
+class _Acumulados:
+    '''
+    Acumulados de un grupo de datos: {mes: (cantidad, media, m2)} de cada punto,
+    la serie de la media de la zona y {año: suma} de cada punto.
+    '''
+
+    def __init__(self):
+        self.mensual = {}
+        self.tiempos = []
+        self.medias = []
+        self.anuales = {}
+
+    def unir(self, otro):
+        for mes, momentos in otro.mensual.items():
+            if mes in self.mensual:
+                self.mensual[mes] = _unir_momentos(*self.mensual[mes], *momentos)
+            else:
+                self.mensual[mes] = momentos
+        self.tiempos.extend(otro.tiempos)
+        self.medias.extend(otro.medias)
+        for anyo, suma in otro.anuales.items():
+            if anyo in self.anuales:
+                self.anuales[anyo] = _sumar(self.anuales[anyo], suma)
+            else:
+                self.anuales[anyo] = suma
+
+
+def segundos_por_tiempo(tiempos, frecuencia):
+    '''
+    Se calcula la duración en segundos de cada tiempo: un día en los datos
+    diarios y los días de su mes (según el calendario de los datos) en los mensuales.
+    '''
+    import numpy as np
+
+    if frecuencia == 'mon':
+        return np.asarray(tiempos.dt.days_in_month.values, dtype='float64') * segundos_dia
+    return np.full(tiempos.size, segundos_dia)
+
+
+def unidades_acumuladas(unidades):
+    '''
+    Si "unidades" son las de una tasa por segundo (por ejemplo 'kg m-2 s-1') se
+    devuelven las del total acumulado ('kg m-2'); si no, se devuelve None.
+    '''
+    partes = str(unidades or '').split()
+    if partes and partes[-1] == 's-1':
+        return ' '.join(partes[:-1]) or '1'
+    return None
+
+
+def _sumar(a, b):
+    '''
+    Se suman dos arreglos punto a punto, dejando sin dato solo los puntos que no tienen dato en ninguno.
+    '''
+    import numpy as np
+
+    return np.where(np.isnan(a), b, np.where(np.isnan(b), a, a + b))
+
+
+class AcumuladorProductos:
+    '''
+    Acumula los productos derivados de una zona a partir de los bloques de
+    datos que se van descargando (ver el inicio del módulo). "agregar" recibe
+    cada bloque ya recortado a la zona, "confirmar" y "descartar" cierran un
+    año, y "guardar" escribe los productos. "frecuencia" ('day' o 'mon') es
+    la de los datos, para calcular la duración de cada tiempo en 'suma_anual'.
+    '''
+
+    def __init__(self, productos, varclim, frecuencia):
+        self.productos = validar_productos(productos)
+        self.varclim = varclim
+        self.frecuencia = frecuencia
+        self.unidades = None
+        self.anyos = set()
+        self.plantilla = None
+        self.totales = _Acumulados()
+        self._por_anyo = {}
+
+    def _recordar_malla(self, datos):
+        if self.plantilla is None:
+            espacial = datos.isel(time=0, drop=True)
+            self.plantilla = espacial.drop_vars([nombre for nombre in espacial.coords
+                                                 if nombre not in espacial.dims and nombre not in coordenadas_malla(espacial)])
+
+    def agregar(self, datos):
+        '''
+        Se agrega un bloque de datos (un DataArray ya leído y recortado a la zona)
+        a los acumulados de su año.
+        '''
+        import numpy as np
+
+        self._recordar_malla(datos)
+        if self.unidades is None:
+            self.unidades = datos.attrs.get('units')
+        datos = datos.transpose('time', *self.plantilla.dims)
+        valores = np.asarray(datos.values, dtype='float64')
+        anyos = np.asarray(datos['time'].dt.year.values)
+        meses = np.asarray(datos['time'].dt.month.values)
+        validos = ~np.isnan(valores)
+        if 'media_zona' in self.productos:
+            nombre_lat, _ = coordenadas_malla(datos)
+            pesos = np.cos(np.deg2rad(datos[nombre_lat].broadcast_like(self.plantilla).transpose(*self.plantilla.dims).values))
+            ejes = tuple(range(1, valores.ndim))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                medias = np.nansum(valores * pesos, axis=ejes) / (validos * pesos).sum(axis=ejes)
+        for anyo in np.unique(anyos):
+            acumulados = self._por_anyo.setdefault(int(anyo), _Acumulados())
+            del_anyo = anyos == anyo
+            if 'climatologia_mensual' in self.productos:
+                for mes in np.unique(meses[del_anyo]):
+                    seleccion = del_anyo & (meses == mes)
+                    x = valores[seleccion]
+                    n = validos[seleccion].sum(axis=0)
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        media = np.nansum(x, axis=0) / n
+                    m2 = np.nansum((x - media) ** 2, axis=0)
+                    momentos = (n, np.where(n > 0, media, np.nan), m2)
+                    if int(mes) in acumulados.mensual:
+                        momentos = _unir_momentos(*acumulados.mensual[int(mes)], *momentos)
+                    acumulados.mensual[int(mes)] = momentos
+            if 'media_zona' in self.productos:
+                acumulados.tiempos.extend(datos['time'].values[del_anyo])
+                acumulados.medias.extend(medias[del_anyo])
+            if 'suma_anual' in self.productos:
+                x = valores[del_anyo]
+                if unidades_acumuladas(self.unidades) is not None:
+                    duracion = segundos_por_tiempo(datos['time'][del_anyo], self.frecuencia)
+                    x = x * duracion.reshape((-1,) + (1,) * (x.ndim - 1))
+                suma = np.where(validos[del_anyo].any(axis=0), np.nansum(x, axis=0), np.nan)
+                if int(anyo) in acumulados.anuales:
+                    suma = _sumar(acumulados.anuales[int(anyo)], suma)
+                acumulados.anuales[int(anyo)] = suma
+
+    def confirmar(self, anyo):
+        '''
+        Se agregan a los productos los acumulados de un año que terminó de
+        descargarse (si el año ya estaba incluido, no se vuelve a contar).
+        '''
+        acumulados = self._por_anyo.pop(anyo, None)
+        if acumulados is None or anyo in self.anyos:
+            return
+        self.totales.unir(acumulados)
+        self.anyos.add(anyo)
+
+    def descartar(self, anyo):
+        self._por_anyo.pop(anyo, None)
+
+    def conjunto(self):
+        '''
+        Se arma el Dataset con los productos acumulados.
+        '''
+        import numpy as np
+        import xarray as xr
+
+        dims = self.plantilla.dims
+        coords = {nombre: coordenada for nombre, coordenada in self.plantilla.coords.items()}
+        variables = {}
+        if 'climatologia_mensual' in self.productos and self.totales.mensual:
+            meses = sorted(self.totales.mensual)
+            n = np.stack([self.totales.mensual[mes][0] for mes in meses])
+            media = np.stack([self.totales.mensual[mes][1] for mes in meses])
+            m2 = np.stack([self.totales.mensual[mes][2] for mes in meses])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                varianza = np.where(n > 1, m2 / (n - 1), np.nan)
+            coords['mes'] = meses
+            variables[self.varclim+'_media_mensual'] = (('mes',) + dims, media)
+            variables[self.varclim+'_varianza_mensual'] = (('mes',) + dims, varianza)
+            variables[self.varclim+'_n_mensual'] = (('mes',) + dims, n.astype('int32'))
+        if 'media_zona' in self.productos and self.totales.tiempos:
+            orden = np.argsort(np.asarray(self.totales.tiempos), kind='stable')
+            coords['time'] = np.asarray(self.totales.tiempos)[orden]
+            variables[self.varclim+'_media_zona'] = (('time',), np.asarray(self.totales.medias)[orden])
+        if 'suma_anual' in self.productos and self.totales.anuales:
+            anyos = sorted(self.totales.anuales)
+            coords['anyo'] = anyos
+            acumuladas = unidades_acumuladas(self.unidades)
+            if acumuladas is not None:
+                atributos = {'units': acumuladas, 'descripcion': 'total del año: cada tiempo por su duración'}
+            else:
+                atributos = {'descripcion': 'suma de los valores del año'}
+                if self.unidades is not None:
+                    atributos['units'] = self.unidades
+            variables[self.varclim+'_suma_anual'] = (('anyo',) + dims, np.stack([self.totales.anuales[anyo] for anyo in anyos]),
+                                                     atributos)
+        ds = xr.Dataset(variables, coords=coords)
+        ds.attrs['anyos'] = ','.join(str(anyo) for anyo in sorted(self.anyos))
+        ds.attrs['productos'] = ','.join(self.productos)
+        ds.attrs['media_zona'] = 'media ponderada por el coseno de la latitud'
+        return ds
+
+    def guardar(self, ruta):
+        '''
+        Se escriben los productos en "ruta" (primero con un nombre temporal).
+        Si en esta ejecución no se agregó ningún dato no se escribe nada y se
+        devuelve None.
+        '''
+        if self.plantilla is None or not self.anyos:
+            return None
+        ds = self.conjunto()
+
+        def escribir(temporal):
+            with candado_netcdf:
+                ds.to_netcdf(temporal)
+
+        return escribir_atomico(ruta, escribir)
+
+    def cargar(self, ruta):
+        '''
+        Se parte de los productos guardados en "ruta" (si existe), para agregar
+        solo los años que falten.
+        '''
+        import numpy as np
+        import xarray as xr
+
+        if not Path(ruta).exists():
+            return
+        with candado_netcdf, xr.open_dataset(ruta) as ds:
+            ds = ds.load()
+        if not ds.attrs.get('anyos'):
+            return
+        self.anyos = {int(anyo) for anyo in str(ds.attrs['anyos']).split(',')}
+        nombre_media = self.varclim+'_media_mensual'
+        if nombre_media in ds:
+            n = ds[self.varclim+'_n_mensual'].values.astype('float64')
+            varianza = ds[self.varclim+'_varianza_mensual'].values
+            m2 = np.where(n > 1, varianza * (n - 1), 0.0)
+            for posicion, mes in enumerate(ds['mes'].values):
+                self.totales.mensual[int(mes)] = (n[posicion], ds[nombre_media].values[posicion], m2[posicion])
+        if self.varclim+'_media_zona' in ds:
+            self.totales.tiempos = list(ds['time'].values)
+            self.totales.medias = list(ds[self.varclim+'_media_zona'].values)
+        if self.varclim+'_suma_anual' in ds:
+            for posicion, anyo in enumerate(ds['anyo'].values):
+                self.totales.anuales[int(anyo)] = ds[self.varclim+'_suma_anual'].values[posicion]
@@ -0,0 +1,80 @@
+'''
+Configuración de las pruebas (se ejecutan con "python -m pytest pruebas").
+
+Las pruebas no usan los servidores del CMIP6: los datos se descargan de un
+nodo ESGF local con archivos sintéticos (ver "servidorESGFLocal.py"). Cada
+prueba usa su propio caché, para que los listados, la salud de los nodos y
+las ventanas guardados por una prueba no los vea la siguiente.
+'''
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+carpeta_codigo = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(carpeta_codigo))
+
+# Las carpetas del caché se definen al importar los módulos; así ninguna
+# prueba escribe en el caché del usuario
+os.environ.setdefault('DESCARGACMIP6_CACHE', tempfile.mkdtemp(prefix='cache_pruebas_descargaCMIP6_'))
+os.environ.pop('DESCARGACMIP6_METRICAS', None)
+os.environ.pop('DESCARGACMIP6_SIN_CONEXION', None)
+
+from servidorESGFLocal import ServidorESGFLocal, generar_datos  # noqa: E402
+
+# Conjuntos de datos sintéticos de las pruebas (mallas gruesas para que sean rápidas)
+conjuntos_prueba = [
+    {'modelo': 'PRUEBA-MON', 'escenario': 'ssp245', 'variable': 'tas', 'frecuencia': 'mon', 'calendario': 'noleap',
+     'resolucion': 5.0, 'anyoini': 2015, 'anyofin': 2024, 'anyos_por_archivo': 5},
+    {'modelo': 'PRUEBA-DAY', 'escenario': 'ssp245', 'variable': 'pr', 'frecuencia': 'day', 'calendario': '360_day',
+     'resolucion': 10.0, 'anyoini': 2015, 'anyofin': 2018, 'anyos_por_archivo': 2},
+]
+
+
+@pytest.fixture(scope='session')
+def datos_sinteticos(tmp_path_factory):
+    carpeta = tmp_path_factory.mktemp('datos_sinteticos')
+    generar_datos(carpeta, conjuntos_prueba)
+    return carpeta
+
+
+@pytest.fixture(autouse=True)
+def cache_vacio(tmp_path, monkeypatch):
+    '''
+    Cada prueba usa un caché vacío y empieza sin errores registrados en los nodos de datos.
+    '''
+    import cacheMetadatos
+    import descargaHTTP
+    import nodosESGF
+    import recorteEspacial
+    import regrillado
+    import replicasESGF
+    import extraccionBloques
+
+    cache = tmp_path / 'cache'
+    monkeypatch.setenv('DESCARGACMIP6_CACHE', str(cache))
+    monkeypatch.setattr(cacheMetadatos, 'sin_conexion', False)
+    monkeypatch.setattr(descargaHTTP, 'carpeta_archivos', cache / 'archivos')
+    monkeypatch.setattr(nodosESGF, 'archivo_salud', cache / 'salud_nodos.json')
+    monkeypatch.setattr(recorteEspacial, 'archivo_ventanas', cache / 'ventanas_mallas.json')
+    monkeypatch.setattr(recorteEspacial, '_ventanas', {})
+    monkeypatch.setattr(regrillado, 'carpeta_pesos', cache / 'pesos_regrillado')
+    monkeypatch.setattr(replicasESGF, '_estado_nodos', {})
+    # Los reintentos no esperan segundos entre un intento y otro
+    monkeypatch.setattr(extraccionBloques, 'espera_reintento', 0.01)
+    return cache
+
+
+@pytest.fixture
+def nodo_local(datos_sinteticos, monkeypatch):
+    '''
+    Nodo ESGF local en marcha, y la descarga configurada para buscar en él.
+    '''
+    import descargaCMIP6
+
+    with ServidorESGFLocal(datos_sinteticos) as servidor:
+        monkeypatch.setattr(descargaCMIP6, 'nodos_esgf', [servidor.url_busqueda])
+        yield servidor
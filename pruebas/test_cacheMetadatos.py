@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+import cacheMetadatos
+import descargaCMIP6
+from cacheMetadatos import clave_busqueda, leer_registro, guardar_registro, registro_vigente
+from descargaCMIP6 import listar_archivos, ErrorDescargaCMIP6
+
+clave = clave_busqueda('CMIP6', 'PRUEBA-MON', 'ssp245', 'tas', 'mon', 'r1i1p1f1')
+
+
+@pytest.fixture
+def listados(monkeypatch):
+    '''
+    Se cuentan los listados completos de archivos (cada uno termina guardando un registro nuevo).
+    '''
+    guardados = []
+    guardar = descargaCMIP6.guardar_registro
+
+    def contar(*argumentos, **opciones):
+        guardados.append(argumentos[0])
+        return guardar(*argumentos, **opciones)
+
+    monkeypatch.setattr(descargaCMIP6, 'guardar_registro', contar)
+    return guardados
+
+
+def _vencer(version=None):
+    registro = leer_registro(clave)
+    guardar_registro(clave, registro['dataset_id'], version or registro['version'], registro['archivos'],
+                     guardado=time.time() - cacheMetadatos.vigencia_metadatos - 60)
+
+
+def test_carpeta_del_cache_al_usarla(cache_vacio, tmp_path, monkeypatch):
+    guardar_registro(clave, 'conjunto', '1', [])
+    assert (cache_vacio / 'metadatos' / (clave + '.json')).exists()
+    monkeypatch.setenv('DESCARGACMIP6_CACHE', str(tmp_path / 'otro'))
+    assert leer_registro(clave) is None
+    guardar_registro(clave, 'conjunto', '1', [])
+    assert (tmp_path / 'otro' / 'metadatos' / (clave + '.json')).exists()
+
+
+def test_registro_vigente_no_consulta_los_nodos(nodo_local, listados):
+    archivos = listar_archivos('PRUEBA-MON', 'ssp245', 'tas', 'mon')
+    assert [archivo.anyoini for archivo in archivos] == [2015, 2020]
+    assert listados == [clave]
+    peticiones = nodo_local.contadores['peticiones']
+
+    assert listar_archivos('PRUEBA-MON', 'ssp245', 'tas', 'mon') == archivos
+    assert nodo_local.contadores['peticiones'] == peticiones
+    assert listados == [clave]
+
+
+def test_registro_vencido_con_la_misma_version(nodo_local, listados):
+    archivos = listar_archivos('PRUEBA-MON', 'ssp245', 'tas', 'mon')
+    _vencer()
+    assert not registro_vigente(leer_registro(clave))
+
+    # Se consulta el conjunto de datos, pero no se vuelven a listar sus archivos
+    peticiones = nodo_local.contadores['peticiones']
+    assert listar_archivos('PRUEBA-MON', 'ssp245', 'tas', 'mon') == archivos
+    assert nodo_local.contadores['peticiones'] > peticiones
+    assert listados == [clave]
+    assert registro_vigente(leer_registro(clave))
+
+
+def test_version_nueva_vuelve_a_listar(nodo_local, listados):
+    listar_archivos('PRUEBA-MON', 'ssp245', 'tas', 'mon')
+    _vencer(version='20190101')
+    archivos = listar_archivos('PRUEBA-MON', 'ssp245', 'tas', 'mon')
+    assert listados == [clave, clave]
+    registro = leer_registro(clave)
+    assert registro['version'] == '20200101'
+    assert registro['archivos'] == archivos
+
+
+def test_sin_conexion(nodo_local, monkeypatch):
+    monkeypatch.setattr(cacheMetadatos, 'sin_conexion', True)
+    with pytest.raises(ErrorDescargaCMIP6, match='sin conexión'):
+        listar_archivos('PRUEBA-MON', 'ssp245', 'tas', 'mon')
+    assert nodo_local.contadores['peticiones'] == 0
+
+    monkeypatch.setattr(cacheMetadatos, 'sin_conexion', False)
+    archivos = listar_archivos('PRUEBA-MON', 'ssp245', 'tas', 'mon')
+    _vencer()
+    peticiones = nodo_local.contadores['peticiones']
+
+    # Sin conexión se usa el registro guardado aunque haya vencido
+    monkeypatch.setattr(cacheMetadatos, 'sin_conexion', True)
+    assert listar_archivos('PRUEBA-MON', 'ssp245', 'tas', 'mon') == archivos
+    assert nodo_local.contadores['peticiones'] == peticiones
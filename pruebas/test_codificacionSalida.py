@@ -0,0 +1,92 @@
+import netCDF4
+import numpy as np
+import pytest
+import xarray as xr
+
+import codificacionSalida
+from codificacionSalida import escribir_netcdf, forma_fragmentos, parametros_empaquetado, codificacion_salida
+
+
+def _datos(tiempos=24, semilla=0):
+    generador = np.random.default_rng(semilla)
+    valores = 280.0 + 30.0 * generador.random((tiempos, 40, 50))
+    valores[3, 5, 7] = np.nan
+    return xr.DataArray(valores, dims=('time', 'lat', 'lon'), name='tas',
+                        coords={'time': np.arange(tiempos), 'lat': np.linspace(-20, 20, 40),
+                                'lon': np.linspace(280, 330, 50)})
+
+
+def test_forma_fragmentos():
+    da = _datos()
+    assert forma_fragmentos(da, 'serie') == (24, 16, 16)
+    assert forma_fragmentos(da, 'mapa') == (1, 40, 50)
+    assert forma_fragmentos(da, {'time': 6, 'lon': 100}) == (6, 40, 50)
+    assert forma_fragmentos(da.isel(lat=slice(0, 3)), 'serie') == (24, 3, 16)
+    assert forma_fragmentos(da, None) is None
+    with pytest.raises(ValueError):
+        forma_fragmentos(da, 'cubo')
+
+
+@pytest.mark.parametrize('fragmentos, forma', [('serie', [24, 16, 16]), ('mapa', [1, 40, 50]),
+                                               ({'time': 6}, [6, 40, 50])])
+def test_fragmentos_y_compresion_en_el_archivo(tmp_path, fragmentos, forma):
+    da = _datos()
+    ruta = tmp_path / 'salida.nc'
+    escribir_netcdf(da, ruta, {'fragmentos': fragmentos, 'nivel': 6, 'shuffle': False})
+    with netCDF4.Dataset(ruta) as nc:
+        variable = nc['tas']
+        assert variable.chunking() == forma
+        filtros = variable.filters()
+        assert filtros['zlib'] and filtros['complevel'] == 6 and not filtros['shuffle']
+        assert variable.dtype == np.float32
+    with xr.open_dataset(ruta) as ds:
+        np.testing.assert_allclose(ds['tas'].values, da.values.astype('float32'))
+
+
+def test_sin_compresion(tmp_path):
+    ruta = tmp_path / 'salida.nc'
+    escribir_netcdf(_datos(), ruta, {'compresion': None, 'fragmentos': None})
+    with netCDF4.Dataset(ruta) as nc:
+        assert not nc['tas'].filters()['zlib']
+        assert nc['tas'].chunking() == 'contiguous'
+
+
+def test_empaquetado_en_enteros(tmp_path):
+    da = _datos()
+    ruta = tmp_path / 'salida.nc'
+    escribir_netcdf(da, ruta, {'empaquetar': True, 'nivel': 4})
+    with netCDF4.Dataset(ruta) as nc:
+        variable = nc['tas']
+        assert variable.dtype == np.int16
+        escala, desplazamiento = variable.scale_factor, variable.add_offset
+        assert variable._FillValue == -32768
+        variable.set_auto_maskandscale(False)
+        enteros = variable[:]
+        assert enteros.min() == -32768 and enteros[np.isfinite(da.values)].min() >= -32767
+    minimo, maximo = np.nanmin(da.values), np.nanmax(da.values)
+    assert escala == pytest.approx((maximo - minimo) / (2**16 - 2))
+    assert desplazamiento == pytest.approx((maximo + minimo) / 2)
+    with xr.open_dataset(ruta) as ds:
+        leidos = ds['tas'].values
+    # El error de empaquetar es a lo sumo media unidad de la escala
+    assert np.isnan(leidos[3, 5, 7])
+    assert np.nanmax(np.abs(leidos - da.values)) <= escala / 2 * 1.001
+
+
+def test_parametros_empaquetado_por_bloques(tmp_path, monkeypatch):
+    da = _datos(tiempos=23)
+    da[17, 0, 0] = 400.0
+    da[2, 1, 1] = 200.0
+    da.to_netcdf(tmp_path / 'datos.nc')
+    monkeypatch.setattr(codificacionSalida, 'tiempos_bloque_empaquetado', 5)
+    with xr.open_dataset(tmp_path / 'datos.nc') as ds:
+        escala, desplazamiento = parametros_empaquetado(ds['tas'])
+        # Para armar la codificación no se cargan todos los datos en memoria
+        codificacion = codificacion_salida(ds['tas'], empaquetar=True)['tas']
+        assert not ds['tas'].variable._in_memory
+        assert codificacion['scale_factor'] == escala
+    assert desplazamiento == pytest.approx(300.0)
+    assert escala == pytest.approx(200.0 / (2**16 - 2))
+
+    sin_datos = xr.full_like(da, np.nan)
+    assert parametros_empaquetado(sin_datos) == (1.0, 0.0)
@@ -0,0 +1,125 @@
+import os
+
+import pytest
+
+import descargaCMIP6
+from servidorESGFLocal import ServidorESGFLocal
+from descargaCMIP6 import (descargar_anyos_zonas, nombre_archivo_salida, validar_parametros, validar_anyos,
+                          ErrorDescargaCMIP6)
+from productosDerivados import nombre_productos
+
+
+def test_validar_parametros():
+    validar_parametros(-90, -30, -60, 20, 2015, 2020)
+    validar_parametros(170, 200, -10, 10)
+    with pytest.raises(ErrorDescargaCMIP6):
+        validar_parametros(-30, -90, -60, 20)
+    with pytest.raises(ErrorDescargaCMIP6):
+        validar_parametros(-90, -30, 20, -60)
+    with pytest.raises(ErrorDescargaCMIP6):
+        validar_parametros(-180, 200, -60, 20)
+    with pytest.raises(ErrorDescargaCMIP6):
+        validar_parametros(-90, -30, -60, 20, 2020, 2015)
+    validar_anyos(2015, 2015)
+    with pytest.raises(ErrorDescargaCMIP6, match='año inicial'):
+        validar_anyos(2020, 2015)
+
+
+def test_acceso_no_valido_antes_de_buscar(tmp_path, monkeypatch):
+    def buscar(*argumentos):
+        raise AssertionError("no se debía consultar a los nodos ESGF")
+
+    monkeypatch.setattr(descargaCMIP6, 'conectar_nodo', buscar)
+    with pytest.raises(ErrorDescargaCMIP6, match='acceso'):
+        descargar_anyos_zonas('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2015, 2016, {'A': (-90, -30, -60, 20)},
+                              tmp_path, acceso='ftp')
+
+
+def _salida(carpeta, anyo, modelo='PRUEBA-MON', varclim='tas', frecuencia='mon', nombrezona='A'):
+    return str(carpeta / nombre_archivo_salida(modelo, 'ssp245', varclim, frecuencia, anyo, nombrezona))
+
+
+def _archivos_conjunto(servidor, modelo):
+    return [archivo['filename'] for conjunto in servidor.catalogo['conjuntos'] if conjunto['modelo'] == modelo
+            for archivo in conjunto['archivos']]
+
+
+def test_archivo_que_no_abre_no_detiene_los_demas(nodo_local, tmp_path):
+    # PRUEBA-MON tiene un archivo para 2015-2019 y otro para 2020-2024
+    nodo_local.archivos_caidos.add(_archivos_conjunto(nodo_local, 'PRUEBA-MON')[0])
+    zonas = {'A': (-90, -30, -60, 20)}
+    productos = str(tmp_path / nombre_productos('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2015, 2024, 'A'))
+    generados = descargar_anyos_zonas('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2015, 2024, zonas, tmp_path,
+                                      productos=['climatologia_mensual'])
+    assert sorted(generados) == sorted([_salida(tmp_path, anyo) for anyo in range(2020, 2025)] + [productos])
+    assert not list(tmp_path.glob('.*.tmp'))
+
+    # Al reanudar con el archivo ya disponible se descargan solo los años que faltaban
+    nodo_local.archivos_caidos.clear()
+    generados = descargar_anyos_zonas('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2015, 2024, zonas, tmp_path,
+                                      reanudar=True, productos=['climatologia_mensual'])
+    assert sorted(generados) == sorted([_salida(tmp_path, anyo) for anyo in range(2015, 2020)] + [productos])
+
+
+@pytest.fixture
+def nodos_con_replica(datos_sinteticos, monkeypatch):
+    '''
+    Dos nodos de datos con los mismos archivos: el de búsqueda ('127.0.0.1') y
+    una réplica ('localhost').
+    '''
+    with ServidorESGFLocal(datos_sinteticos, nodo='localhost') as replica:
+        with ServidorESGFLocal(datos_sinteticos, replicas=[replica]) as principal:
+            monkeypatch.setattr(descargaCMIP6, 'nodos_esgf', [principal.url_busqueda])
+            yield principal, replica
+
+
+def test_cambio_a_otra_replica(nodos_con_replica, tmp_path):
+    principal, replica = nodos_con_replica
+    principal.archivos_caidos.update(_archivos_conjunto(principal, 'PRUEBA-MON'))
+    generados = descargar_anyos_zonas('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2018, 2021, {'A': (-90, -30, -60, 20)},
+                                      tmp_path, tiempos_por_bloque=6)
+    assert generados == [_salida(tmp_path, anyo) for anyo in range(2018, 2022)]
+    assert principal.contadores['fallos_simulados'] > 0
+    assert replica.contadores['peticiones'] > 0
+
+
+def test_fallan_todas_las_replicas_al_leer(nodos_con_replica, tmp_path, monkeypatch):
+    import extraccionBloques
+
+    # Los archivos se abren bien, pero desde la mitad de 2016 (cuando ya se escribió
+    # el primer bloque del año) la lectura falla en todos los nodos hasta 2019
+    leer_bloque = extraccionBloques.leer_bloque
+
+    def leer_bloque_con_fallos(da, **opciones):
+        primero = da['time'].values[0]
+        if (2016, 7) <= (primero.year, primero.month) and primero.year <= 2019:
+            raise OSError("Fallo simulado de la lectura")
+        return leer_bloque(da, **opciones)
+
+    monkeypatch.setattr(extraccionBloques, 'leer_bloque', leer_bloque_con_fallos)
+    generados = descargar_anyos_zonas('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2015, 2021, {'A': (-90, -30, -60, 20)},
+                                      tmp_path, tiempos_por_bloque=6)
+    assert generados == [_salida(tmp_path, anyo) for anyo in (2015, 2020, 2021)]
+    assert not list(tmp_path.glob('.*.tmp'))
+
+
+def test_salida_zarr_consolidada_por_bloques(nodo_local, tmp_path):
+    import xarray as xr
+    from manifiestoDescargas import leer_manifiesto
+
+    zonas = {'A': (-90, -30, -60, 20), 'B': (0, 60, -40, 40)}
+    generados = descargar_anyos_zonas('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2017, 2021, zonas, tmp_path,
+                                      consolidar='zarr', tiempos_por_bloque=5)
+    assert len(generados) == 2
+    manifiesto = leer_manifiesto(tmp_path)
+    for ruta in generados:
+        # Cada año registra la cantidad de tiempos de la salida al terminarlo
+        registros = sorted(registro['registros'] for registro in manifiesto.values()
+                           if registro['archivo'] == os.path.basename(ruta))
+        assert registros == [12, 24, 36, 48, 60]
+        with xr.open_zarr(ruta) as ds:
+            assert ds['time'].dt.year.values.tolist() == [anyo for anyo in range(2017, 2022) for _ in range(12)]
+
+    # Al reanudar (sin nada pendiente) no se agrega nada
+    assert descargar_anyos_zonas('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2017, 2021, zonas, tmp_path,
+                                 consolidar='zarr', tiempos_por_bloque=5, reanudar=True) == []
@@ -0,0 +1,123 @@
+import os
+
+import pytest
+
+import descargaHTTP
+from cacheMetadatos import ArchivoESGF
+from servidorESGFLocal import ServidorESGFLocal
+from descargaCMIP6 import descargar_anyos_zonas
+from descargaHTTP import (obtener_archivo, descargar_por_rangos, liberar_espacio, archivo_en_cache, reservar_archivo,
+                          soltar_archivo, ErrorSumaVerificacion)
+
+
+def _archivo(servidor, numero=0, **cambios):
+    '''
+    Se arma el "ArchivoESGF" de uno de los archivos sintéticos del servidor.
+    '''
+    archivo = [archivo for conjunto in servidor.catalogo['conjuntos'] for archivo in conjunto['archivos']][numero]
+    datos = dict(filename=archivo['filename'], size=archivo['size'], checksum=archivo['checksum'],
+                 checksum_type='SHA256',
+                 download_url=servidor.direccion+'/thredds/fileServer/'+archivo['filename'])
+    datos.update(cambios)
+    return ArchivoESGF(**datos)
+
+
+def test_partes_en_paralelo_se_arman_en_orden(nodo_local, monkeypatch):
+    monkeypatch.setattr(descargaHTTP, 'tamanyo_parte', 4096)
+    monkeypatch.setattr(descargaHTTP, 'tamanyo_pedazo', 1000)
+    archivo = _archivo(nodo_local)
+    ruta = obtener_archivo(archivo)
+    assert ruta.read_bytes() == nodo_local.ruta_archivo(archivo.filename).read_bytes()
+    partes = -(-archivo.size // 4096)
+    assert partes > descargaHTTP.partes_paralelas
+    assert nodo_local.contadores['peticiones'] == partes + 1
+    soltar_archivo(ruta)
+
+    # La segunda vez se usa el archivo del caché, sin conexión
+    assert obtener_archivo(archivo) == ruta
+    assert nodo_local.contadores['peticiones'] == partes + 1
+    soltar_archivo(ruta)
+    assert not descargaHTTP._en_uso
+
+
+def test_suma_que_no_coincide_borra_el_archivo(nodo_local, monkeypatch):
+    monkeypatch.setattr(descargaHTTP, 'tamanyo_parte', 4096)
+    archivo = _archivo(nodo_local, checksum='0' * 64)
+    with pytest.raises(ErrorSumaVerificacion):
+        obtener_archivo(archivo)
+    assert not list(descargaHTTP.carpeta_archivos.iterdir())
+    assert not descargaHTTP._en_uso
+
+
+@pytest.mark.parametrize('con_suma', [True, False])
+def test_servidor_sin_rangos(datos_sinteticos, tmp_path, con_suma):
+    with ServidorESGFLocal(datos_sinteticos, rangos=False) as servidor:
+        archivo = _archivo(servidor, checksum=None if not con_suma else _archivo(servidor).checksum)
+        destino = tmp_path / archivo.filename
+        tamanyo = descargar_por_rangos(archivo.download_url, destino, archivo.size, archivo.checksum_type,
+                                       archivo.checksum)
+        assert tamanyo == archivo.size
+        assert destino.read_bytes() == servidor.ruta_archivo(archivo.filename).read_bytes()
+        # Una consulta del tamaño y una sola petición del archivo completo
+        assert servidor.contadores['peticiones'] == 2
+
+        with pytest.raises(ErrorSumaVerificacion):
+            descargar_por_rangos(archivo.download_url, destino, archivo.size, 'SHA256', '0' * 64)
+        assert not destino.exists()
+
+
+def _archivos_en_cache(carpeta, tamanyos):
+    carpeta.mkdir(parents=True, exist_ok=True)
+    rutas = []
+    for numero, tamanyo in enumerate(tamanyos):
+        ruta = carpeta / ('archivo'+str(numero)+'.nc')
+        ruta.write_bytes(b'x' * tamanyo)
+        os.utime(ruta, (1000 + numero, 1000 + numero))
+        rutas.append(ruta)
+    return rutas
+
+
+def test_liberar_espacio_hasta_el_limite(tmp_path):
+    carpeta = tmp_path / 'archivos'
+    rutas = _archivos_en_cache(carpeta, [100, 100, 100, 100])
+    (carpeta / '.temporal.tmp').write_bytes(b'x' * 100)
+    liberar_espacio(150, carpeta, limite=400)
+    # Se borran los dos usados hace más tiempo (los temporales no se cuentan)
+    assert [ruta.exists() for ruta in rutas] == [False, False, True, True]
+    liberar_espacio(0, carpeta, limite=400)
+    assert rutas[2].exists()
+
+
+def test_archivos_en_uso_no_se_borran(tmp_path):
+    carpeta = tmp_path / 'archivos'
+    rutas = _archivos_en_cache(carpeta, [100, 100, 100])
+    reservar_archivo(rutas[0])
+    try:
+        liberar_espacio(100, carpeta, limite=300)
+        assert [ruta.exists() for ruta in rutas] == [True, False, True]
+    finally:
+        soltar_archivo(rutas[0])
+    # Al soltarlo queda como el usado más recientemente
+    liberar_espacio(100, carpeta, limite=250)
+    assert [ruta.exists() for ruta in rutas] == [True, False, False]
+
+
+def test_usar_un_archivo_lo_marca_como_reciente(tmp_path):
+    carpeta = tmp_path / 'archivos'
+    rutas = _archivos_en_cache(carpeta, [100, 100])
+    archivo = ArchivoESGF(filename=rutas[0].name)
+    assert archivo_en_cache(archivo, carpeta) == rutas[0]
+    soltar_archivo(rutas[0])
+    assert archivo_en_cache(ArchivoESGF(filename='otro.nc'), carpeta) is None
+    liberar_espacio(100, carpeta, limite=200)
+    assert [ruta.exists() for ruta in rutas] == [True, False]
+    assert not descargaHTTP._en_uso
+
+
+def test_descarga_por_http_suelta_los_archivos(nodo_local, tmp_path):
+    zonas = {'A': (-90, -30, -60, 20)}
+    generados = descargar_anyos_zonas('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2018, 2021, zonas, tmp_path,
+                                      acceso='http')
+    assert len(generados) == 4
+    assert len(list(descargaHTTP.carpeta_archivos.glob('*.nc'))) == 2
+    assert not descargaHTTP._en_uso
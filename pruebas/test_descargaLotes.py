@@ -0,0 +1,88 @@
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import pytest
+import xarray as xr
+
+from descargaLotes import LimitadorNodos, unidades_trabajo, descargar_lote
+
+
+def _leer_con_limite(limitador, nodo, intervalos):
+    limitador.adquirir(nodo)
+    inicio = time.time()
+    time.sleep(0.05)
+    intervalos.append((inicio, time.time()))
+    limitador.liberar(nodo)
+
+
+def test_limitador_respeta_el_limite_de_cada_nodo():
+    limitador = LimitadorNodos(2)
+    en_uso = {'a': 0, 'b': 0}
+    maximo = {'a': 0, 'b': 0}
+    candado = threading.Lock()
+
+    def leer(nodo):
+        limitador.adquirir(nodo)
+        with candado:
+            en_uso[nodo] += 1
+            maximo[nodo] = max(maximo[nodo], en_uso[nodo])
+        time.sleep(0.02)
+        with candado:
+            en_uso[nodo] -= 1
+        limitador.liberar(nodo)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(leer, ['a', 'b'] * 8))
+    assert maximo == {'a': 2, 'b': 2}
+    assert limitador.contadores == {'a': 0, 'b': 0}
+
+
+def test_limitador_despierta_al_liberar():
+    limitador = LimitadorNodos(1)
+    limitador.adquirir('a')
+    esperando = threading.Thread(target=limitador.adquirir, args=('a',))
+    esperando.start()
+    time.sleep(0.1)
+    assert esperando.is_alive()
+    limitador.liberar('a')
+    esperando.join(timeout=2)
+    assert not esperando.is_alive()
+    assert limitador.contadores['a'] == 1
+
+
+def test_limitador_entre_procesos():
+    with multiprocessing.Manager() as gestor:
+        limitador = LimitadorNodos(1, gestor.dict(), gestor.Condition())
+        intervalos = gestor.list()
+        with ProcessPoolExecutor(max_workers=3) as pool:
+            for tarea in [pool.submit(_leer_con_limite, limitador, 'a', intervalos) for _ in range(4)]:
+                tarea.result()
+        intervalos = sorted(intervalos)
+    assert len(intervalos) == 4
+    assert all(anterior[1] <= siguiente[0] for anterior, siguiente in zip(intervalos, intervalos[1:]))
+
+
+def test_unidades_trabajo_por_bloques_de_anyos():
+    unidades = unidades_trabajo(['M'], ['historical', 'ssp245'], ['tas'], ['mon'],
+                                {'historical': (2011, 2014), 'ssp245': (2015, 2019)}, anyos_por_unidad=3)
+    assert unidades == [('M', 'historical', 'tas', 'mon', 2011, 2013), ('M', 'historical', 'tas', 'mon', 2014, 2014),
+                        ('M', 'ssp245', 'tas', 'mon', 2015, 2017), ('M', 'ssp245', 'tas', 'mon', 2018, 2019)]
+
+
+@pytest.mark.parametrize('consolidar', [None, 'netcdf'])
+def test_lote_con_hilos_y_bloques(nodo_local, tmp_path, consolidar):
+    unidades = (unidades_trabajo(['PRUEBA-DAY'], ['ssp245'], ['pr'], ['day'], (2015, 2018), anyos_por_unidad=1)
+                + unidades_trabajo(['PRUEBA-MON'], ['ssp245'], ['tas'], ['mon'], (2015, 2018), anyos_por_unidad=1))
+    zonas = {'A': (-90, -30, -60, 20), 'B': (-80, -66, -5, 13), 'C': (0, 60, -40, 40)}
+    resumen = descargar_lote(unidades, zonas, str(tmp_path), trabajadores=8, tipo_pool='hilos',
+                             limite_por_nodo=8, codificacion={}, tiempos_por_bloque=30,
+                             consolidar=consolidar)
+    assert resumen['unidades_con_error'] == 0
+    archivos = sorted(tmp_path.rglob('*.nc'))
+    assert len(archivos) == 2 * 4 * len(zonas)
+    assert not list(tmp_path.rglob('.*.tmp'))
+    for archivo in archivos:
+        with xr.open_dataset(archivo, decode_times=False) as ds:
+            assert ds.sizes['time'] == (360 if '_day_' in archivo.name else 12)
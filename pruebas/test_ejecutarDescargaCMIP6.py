@@ -0,0 +1,48 @@
+import re
+
+from conftest import carpeta_codigo
+from ejecutarDescargaCMIP6 import argumentos, leer_configuracion, parametros_ejecucion, principal
+
+configuracion_ejemplo = carpeta_codigo / 'configuracionEjemplo.toml'
+
+
+def test_configuracion_de_ejemplo():
+    parametros = parametros_ejecucion(argumentos().parse_args(['--config', str(configuracion_ejemplo)]))
+    assert parametros['modelos'] == ['MPI-ESM1-2-HR']
+    assert parametros['anyos'] == [2041, 2060]
+    assert parametros['zonas'] == {'Colombia': (-79.5, -66.5, -4.5, 13.5), 'Peru': (-81.5, -68.5, -18.5, 0.5)}
+    assert parametros['codificacion'] is None
+    assert parametros['regrillado'] is None
+
+
+def test_opciones_comentadas_del_ejemplo(tmp_path):
+    # Al activar las opciones comentadas, cada una queda en su lugar (los
+    # parámetros no quedan dentro de una tabla anterior)
+    texto = re.sub(r'^# (\w+ = .*|\[\w+\])$', r'\1', configuracion_ejemplo.read_text(encoding='utf-8'), flags=re.M)
+    ruta = tmp_path / 'configuracion.toml'
+    ruta.write_text(texto, encoding='utf-8')
+    configuracion = leer_configuracion(ruta)
+    assert configuracion['vista_previa_png'] == 'zonas.png'
+    assert configuracion['metricas'] == 'salidasCMIP6/metricas_descarga.jsonl'
+    assert configuracion['consolidar'] == 'zarr'
+    assert configuracion['productos'] == ['climatologia_mensual', 'media_zona', 'suma_anual']
+    assert configuracion['regrillado'] == {'metodo': 'conservativo', 'resolucion': 1.0}
+    assert set(configuracion['codificacion']) == {'compresion', 'nivel', 'shuffle', 'fragmentos', 'empaquetar'}
+    assert set(configuracion['zonas']) == {'Colombia', 'Peru'}
+
+
+def test_medir_arranque(capsys):
+    assert principal(['--config', str(configuracion_ejemplo), '--medir-arranque']) == 0
+    salida = capsys.readouterr().out
+    assert 'Arranque:' in salida
+    assert 'Se descargarían 2 unidades de trabajo' in salida
+
+    # La línea de comandos reemplaza a la configuración
+    assert principal(['--config', str(configuracion_ejemplo), '--variable', 'tas', '--anyos', '2041-2050',
+                      '--regrillado', 'bilineal:2.5', '--medir-arranque']) == 0
+    assert 'Se descargarían 1 unidades de trabajo' in capsys.readouterr().out
+
+
+def test_parametros_no_validos(capsys):
+    assert principal(['--config', str(configuracion_ejemplo), '--anyos', '2060-2041', '--medir-arranque']) == 1
+    assert 'año inicial' in capsys.readouterr().out
@@ -0,0 +1,98 @@
+import pytest
+import xarray as xr
+
+from cacheMetadatos import ArchivoESGF
+from conftest import conjuntos_prueba
+from servidorESGFLocal import escribir_archivo_sintetico, nombre_archivo_cmip6
+from indiceArchivos import indice_archivos, resumen_tiempos, tramos_conocidos, planes_lectura, ultimo_tramo
+
+
+def _archivo(ruta, inicio, fin, conocido=True):
+    '''
+    Se arma el "ArchivoESGF" de un archivo local, con el resumen de su
+    coordenada de tiempo si "conocido".
+    '''
+    anyos_tiempo = None
+    if conocido:
+        with xr.open_dataset(ruta) as ds:
+            anyos_tiempo = resumen_tiempos(ds.indexes['time'])
+    return ArchivoESGF(filename=ruta.name, inicio=inicio, fin=fin, anyoini=int(inicio[:4]), anyofin=int(fin[:4]),
+                       anyos_tiempo=anyos_tiempo)
+
+
+def _tiempos_tramo(ruta, tiempoini, tiempofin):
+    with xr.open_dataset(ruta) as ds:
+        return ds.indexes['time'][tiempoini:tiempofin]
+
+
+@pytest.mark.parametrize('frecuencia, calendario, por_anyo', [
+    ('mon', 'noleap', [12, 12]),
+    ('day', '360_day', [360, 360]),
+    ('day', 'noleap', [365, 365]),
+    ('day', 'standard', [366, 365]),
+])
+def test_resumen_tiempos_por_calendario(tmp_path, frecuencia, calendario, por_anyo):
+    conjunto = dict(conjuntos_prueba[1], frecuencia=frecuencia, calendario=calendario, resolucion=30.0)
+    ruta = tmp_path / nombre_archivo_cmip6(conjunto, 2016, 2017)
+    escribir_archivo_sintetico(ruta, conjunto, 2016, 2017)
+    with xr.open_dataset(ruta) as ds:
+        resumen = resumen_tiempos(ds.indexes['time'])
+    assert resumen == [[2016, por_anyo[0]], [2017, por_anyo[1]]]
+    assert tramos_conocidos(resumen, [2017, 2018]) == [(2017, por_anyo[0], sum(por_anyo))]
+
+
+def test_anyo_repartido_entre_dos_archivos(datos_sinteticos, tmp_path):
+    # El primer archivo diario (360_day, 2015-2016) se parte a mitad de 2016
+    conjunto = conjuntos_prueba[1]
+    with xr.open_dataset(datos_sinteticos / nombre_archivo_cmip6(conjunto, 2015, 2016)) as ds:
+        primero, segundo = tmp_path / 'pr_2015_2016a.nc', tmp_path / 'pr_2016b.nc'
+        ds.isel(time=slice(0, 500)).to_netcdf(primero)
+        ds.isel(time=slice(500, None)).to_netcdf(segundo)
+    tercero = datos_sinteticos / nombre_archivo_cmip6(conjunto, 2017, 2018)
+    archivos = [_archivo(tercero, '20170101', '20181230'), _archivo(segundo, '20160621', '20161230'),
+                _archivo(primero, '20150101', '20160620')]
+
+    planes = planes_lectura(indice_archivos(archivos), range(2015, 2019))
+    assert [(archivo.filename, tramos) for archivo, tramos in planes] == [
+        (primero.name, [(2015, 0, 360), (2016, 360, 500)]),
+        (segundo.name, [(2016, 0, 220)]),
+        (tercero.name, [(2017, 0, 360), (2018, 360, 720)]),
+    ]
+    assert ultimo_tramo(planes) == {2015: 0, 2016: 1, 2017: 2, 2018: 2}
+
+    # Los dos tramos de 2016 tienen todo el año, sin tiempos de otros años
+    tiempos = [_tiempos_tramo(primero, 360, 500), _tiempos_tramo(segundo, 0, 220)]
+    assert all((tramo.year == 2016).all() for tramo in tiempos)
+    assert sum(len(tramo) for tramo in tiempos) == 360
+    assert tiempos[0][-1] < tiempos[1][0]
+
+    # Si aún no se conoce la coordenada de tiempo, el año se busca en los dos
+    archivos = [_archivo(primero, '20150101', '20160620', conocido=False),
+                _archivo(segundo, '20160621', '20161230', conocido=False)]
+    planes = planes_lectura(indice_archivos(archivos), [2016])
+    assert [tramos for _, tramos in planes] == [[(2016, None, None)], [(2016, None, None)]]
+
+
+def test_anyo_faltante_dentro_del_rango(datos_sinteticos, tmp_path):
+    # El archivo mensual (noleap) 2015-2019 sin los datos de 2017
+    conjunto = conjuntos_prueba[0]
+    with xr.open_dataset(datos_sinteticos / nombre_archivo_cmip6(conjunto, 2015, 2019)) as ds:
+        incompleto = tmp_path / 'tas_sin_2017.nc'
+        ds.sel(time=ds['time'].dt.year != 2017).to_netcdf(incompleto)
+    archivo = _archivo(incompleto, '201501', '201912')
+    assert archivo.anyos_tiempo == [[2015, 12], [2016, 12], [2018, 12], [2019, 12]]
+
+    planes = planes_lectura(indice_archivos([archivo]), range(2016, 2020))
+    assert planes[0][1] == [(2016, 12, 24), (2018, 24, 36), (2019, 36, 48)]
+    assert (_tiempos_tramo(incompleto, 24, 36).year == 2018).all()
+
+    # Si solo se busca el año que falta, el archivo no se abre
+    assert planes_lectura(indice_archivos([archivo]), [2017]) == []
+
+
+def test_anyo_sin_archivo():
+    archivos = [ArchivoESGF(filename='a.nc', inicio='201501', fin='201912', anyoini=2015, anyofin=2019),
+                ArchivoESGF(filename='b.nc', inicio='202101', fin='202412', anyoini=2021, anyofin=2024)]
+    planes = planes_lectura(indice_archivos(archivos), range(2019, 2023))
+    assert [(archivo.filename, [anyo for anyo, _, _ in tramos]) for archivo, tramos in planes] == [
+        ('a.nc', [2019]), ('b.nc', [2021, 2022])]
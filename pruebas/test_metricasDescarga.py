@@ -0,0 +1,64 @@
+import pytest
+
+import metricasDescarga
+from metricasDescarga import medir, registrar_metrica, leer_metricas, percentil, reporte_metricas
+
+
+@pytest.fixture
+def archivo_metricas(tmp_path, monkeypatch):
+    ruta = tmp_path / 'metricas.jsonl'
+    monkeypatch.setattr(metricasDescarga, 'archivo_metricas', str(ruta))
+    return ruta
+
+
+def test_percentil():
+    assert percentil([], 50) == 0.0
+    assert percentil([3.0], 95) == 3.0
+    assert percentil([4.0, 1.0, 3.0, 2.0], 50) == 2.5
+    assert percentil(list(range(1, 101)), 95) == pytest.approx(95.05)
+
+
+def test_medir_registra_errores(archivo_metricas):
+    with medir('apertura', archivo='a.nc') as metrica:
+        metrica['nodo'] = 'nodo1'
+    with pytest.raises(OSError):
+        with medir('apertura', archivo='b.nc'):
+            raise OSError("caído")
+    registros = leer_metricas()
+    assert [registro['archivo'] for registro in registros] == ['a.nc', 'b.nc']
+    assert registros[0]['nodo'] == 'nodo1' and 'error' not in registros[0]
+    assert registros[1]['error'] == 'OSError: caído'
+
+
+def test_reporte_por_fase_y_por_nodo(archivo_metricas, capsys):
+    with open(archivo_metricas, 'w', encoding='utf-8') as f:
+        f.write('línea dañada\n')
+    for segundos in range(1, 21):
+        registrar_metrica('lectura', float(segundos), nodo='nodo1', bytes=10**6, reintentos=1 if segundos == 20 else 0)
+    registrar_metrica('lectura', 5.0, nodo='nodo1', bytes=10**9, error='OSError: caído')
+    registrar_metrica('descarga_http', 2.0, nodo='nodo1', bytes=40 * 10**6)
+    registrar_metrica('descarga_http', 4.0, nodo='nodo2', bytes=10 * 10**6)
+    registrar_metrica('apertura', 0.5, nodo='nodo2')
+
+    reporte = reporte_metricas()
+    lectura = reporte['fases']['lectura']
+    assert lectura['cantidad'] == 21
+    assert lectura['errores'] == 1
+    assert lectura['reintentos'] == 1
+    assert lectura['p50_s'] == pytest.approx(10.0)
+    assert lectura['p95_s'] == pytest.approx(19.0)
+    assert lectura['total_s'] == pytest.approx(215.0)
+    assert reporte['fases']['descarga_http']['p50_s'] == pytest.approx(3.0)
+    assert reporte['fases']['descarga_http']['p95_s'] == pytest.approx(3.9)
+
+    # Las lecturas con error y las fases sin transferencia no cuentan para los MB/s
+    assert reporte['nodos']['nodo1']['megabytes'] == pytest.approx(60.0)
+    assert reporte['nodos']['nodo1']['mb_por_segundo'] == pytest.approx(60.0 / 212.0)
+    assert reporte['nodos']['nodo2']['mb_por_segundo'] == pytest.approx(2.5)
+    assert 'Nodo nodo2: 10.0 MB transferidos a 2.50 MB/s' in capsys.readouterr().out
+
+
+def test_reporte_desde(archivo_metricas):
+    registrar_metrica('lectura', 1.0, nodo='nodo1', bytes=10**6)
+    desde = leer_metricas()[0]['fin'] + 1
+    assert reporte_metricas(desde=desde) == {'fases': {}, 'nodos': {}}
@@ -0,0 +1,72 @@
+import time
+
+import nodosESGF
+from servidorESGFLocal import ServidorESGFLocal
+from nodosESGF import ordenar_nodos, seleccionar_nodo, registrar_resultado, leer_salud
+
+parametros = {'project': 'CMIP6', 'source_id': 'PRUEBA-MON', 'experiment_id': 'ssp245', 'variable': 'tas',
+              'frequency': 'mon', 'variant_label': 'r1i1p1f1'}
+
+
+def test_ordenar_nodos_segun_salud_vigente():
+    ahora = time.time()
+    salud = {
+        'lento': {'fallos': 0, 'latencia': 2.0, 'actualizado': ahora},
+        'rapido': {'fallos': 0, 'latencia': 0.1, 'actualizado': ahora - 60},
+        'vencido': {'fallos': 0, 'latencia': 0.01, 'actualizado': ahora - 7200},
+        'caido': {'fallos': 2, 'actualizado': ahora},
+        'caido_vencido': {'fallos': 5, 'actualizado': ahora - 7200},
+    }
+    nodos = ['caido', 'nuevo', 'vencido', 'lento', 'caido_vencido', 'rapido']
+    sanos, desconocidos, caidos = ordenar_nodos(nodos, salud, vigencia=3600)
+    assert sanos == ['rapido', 'lento']
+    assert desconocidos == ['nuevo', 'vencido', 'caido_vencido']
+    assert caidos == ['caido']
+
+
+def test_nodo_conocido_no_retrasa_a_los_demas(monkeypatch):
+    # El nodo más rápido según la salud guardada hoy no responde: no se le
+    # espera todo el tiempo límite antes de consultar a los demás
+    def sondear(nodo, parametros, limite=None):
+        if nodo == 'conocido':
+            time.sleep(1.0)
+            raise OSError("sin respuesta")
+        return 'contexto de '+nodo, 0.01
+
+    registrar_resultado('conocido', latencia=0.01)
+    monkeypatch.setattr(nodosESGF, 'sondear_nodo', sondear)
+    inicio = time.perf_counter()
+    assert seleccionar_nodo(['otro', 'conocido'], parametros, limite=5) == ('otro', 'contexto de otro')
+    assert time.perf_counter() - inicio < 0.5
+
+
+def test_nodo_caido_se_consulta_al_final(datos_sinteticos, monkeypatch):
+    consultados = []
+    sondear_nodo = nodosESGF.sondear_nodo
+
+    def sondear(nodo, parametros, limite=None):
+        consultados.append(nodo)
+        return sondear_nodo(nodo, parametros, limite)
+
+    monkeypatch.setattr(nodosESGF, 'sondear_nodo', sondear)
+    with ServidorESGFLocal(datos_sinteticos) as vivo, ServidorESGFLocal(datos_sinteticos) as caido:
+        # El nodo que falla queda al final y no se consulta si otro responde
+        registrar_resultado(caido.url_busqueda, error='OSError: sin respuesta')
+        nodo, ctx = seleccionar_nodo([caido.url_busqueda, vivo.url_busqueda], parametros, limite=5)
+        assert nodo == vivo.url_busqueda
+        assert ctx.hit_count == 1
+        assert consultados == [vivo.url_busqueda]
+        assert leer_salud()[vivo.url_busqueda]['fallos'] == 0
+
+        # Si ninguno de los demás responde, se consulta como último recurso
+        consultados.clear()
+        vivo.fraccion_fallos_busqueda = 1.0
+        nodo, _ = seleccionar_nodo([caido.url_busqueda, vivo.url_busqueda], parametros, limite=5)
+        assert nodo == caido.url_busqueda
+        assert consultados == [vivo.url_busqueda, caido.url_busqueda]
+        salud = leer_salud()
+        assert salud[vivo.url_busqueda]['fallos'] == 1
+        assert salud[caido.url_busqueda]['fallos'] == 0
+
+        # En la siguiente ejecución el nodo que falló es el que queda al final
+        assert ordenar_nodos([vivo.url_busqueda, caido.url_busqueda], salud)[2] == [vivo.url_busqueda]
@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+import cftime
+import numpy as np
+import pytest
+import xarray as xr
+
+from productosDerivados import AcumuladorProductos, unidades_acumuladas
+
+
+def _datos(anyo, frecuencia, calendario, valor, unidades, varclim='pr'):
+    if frecuencia == 'mon':
+        tiempos = [cftime.datetime(anyo, mes, 15, calendar=calendario) for mes in range(1, 13)]
+    else:
+        dias = 360 if calendario == '360_day' else 365
+        inicio = cftime.datetime(anyo, 1, 1, 12, calendar=calendario)
+        tiempos = [inicio + timedelta(days=dia) for dia in range(dias)]
+    lat = np.array([-5.0, 5.0])
+    lon = np.array([280.0, 290.0, 300.0])
+    return xr.DataArray(np.full((len(tiempos), 2, 3), valor), dims=('time', 'lat', 'lon'), name=varclim,
+                        coords={'time': tiempos, 'lat': lat, 'lon': lon}, attrs={'units': unidades})
+
+
+def test_unidades_acumuladas():
+    assert unidades_acumuladas('kg m-2 s-1') == 'kg m-2'
+    assert unidades_acumuladas('s-1') == '1'
+    assert unidades_acumuladas('K') is None
+    assert unidades_acumuladas(None) is None
+
+
+@pytest.mark.parametrize('frecuencia, calendario, dias', [('mon', 'noleap', 365), ('mon', '360_day', 360),
+                                                          ('mon', 'standard', 366), ('day', '360_day', 360),
+                                                          ('day', 'noleap', 365)])
+def test_suma_anual_de_una_tasa(frecuencia, calendario, dias):
+    acumulador = AcumuladorProductos(['suma_anual'], 'pr', frecuencia)
+    datos = _datos(2016, frecuencia, calendario, 1e-5, 'kg m-2 s-1')
+    # El año llega en dos bloques
+    acumulador.agregar(datos.isel(time=slice(0, 5)))
+    acumulador.agregar(datos.isel(time=slice(5, None)))
+    acumulador.confirmar(2016)
+    suma = acumulador.conjunto()['pr_suma_anual']
+    assert suma.attrs['units'] == 'kg m-2'
+    np.testing.assert_allclose(suma.values, 1e-5 * 86400 * dias)
+
+
+def test_suma_anual_sin_tasa():
+    acumulador = AcumuladorProductos(['suma_anual'], 'tas', 'mon')
+    acumulador.agregar(_datos(2015, 'mon', 'noleap', 290.0, 'K', 'tas'))
+    acumulador.confirmar(2015)
+    suma = acumulador.conjunto()['tas_suma_anual']
+    assert suma.attrs['units'] == 'K'
+    np.testing.assert_allclose(suma.values, 290.0 * 12)
+
+
+def test_anyo_descartado_no_se_cuenta(tmp_path):
+    acumulador = AcumuladorProductos(['suma_anual', 'climatologia_mensual'], 'pr', 'mon')
+    acumulador.agregar(_datos(2015, 'mon', 'noleap', 1e-5, 'kg m-2 s-1'))
+    acumulador.confirmar(2015)
+    acumulador.agregar(_datos(2016, 'mon', 'noleap', 2e-5, 'kg m-2 s-1').isel(time=slice(0, 6)))
+    acumulador.descartar(2016)
+    ruta = acumulador.guardar(tmp_path / 'productos.nc')
+
+    # Al reanudar se parte de lo guardado y se agrega el año que faltaba
+    reanudado = AcumuladorProductos(['suma_anual', 'climatologia_mensual'], 'pr', 'mon')
+    reanudado.cargar(ruta)
+    assert reanudado.anyos == {2015}
+    reanudado.agregar(_datos(2016, 'mon', 'noleap', 2e-5, 'kg m-2 s-1'))
+    reanudado.confirmar(2016)
+    ds = reanudado.conjunto()
+    np.testing.assert_allclose(ds['pr_suma_anual'].sel(anyo=2016).values, 2e-5 * 86400 * 365)
+    np.testing.assert_allclose(ds['pr_media_mensual'].values, 1.5e-5)
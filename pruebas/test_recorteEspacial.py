@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+import recorteEspacial
+from recorteEspacial import recortar, LecturaPorPartes
+from descargaCMIP6 import descargar_anyos_zonas, nombre_archivo_salida
+
+
+def _malla(lonini, resolucion=10.0, lat_al_norte=True):
+    lat = np.arange(-90 + resolucion / 2, 90, resolucion)
+    if not lat_al_norte:
+        lat = lat[::-1]
+    lon = np.arange(lonini + resolucion / 2, lonini + 360, resolucion)
+    valores = lat[:, None] * 1000 + (lon[None, :] % 360)
+    return xr.DataArray(valores[None], dims=('time', 'lat', 'lon'), name='tas',
+                        coords={'time': [0], 'lat': lat, 'lon': lon})
+
+
+def _leer(recorte, zona):
+    # Lo leído en varias ventanas se vuelve a recortar para ordenar sus longitudes
+    # (como en "descargaCMIP6.recortar_zona")
+    if isinstance(recorte, LecturaPorPartes):
+        return recortar(recorte.load(), zona)
+    return recorte
+
+
+@pytest.mark.parametrize('lonini', [-180, 0])
+@pytest.mark.parametrize('zona', [(160, 200, -20, 20), (-200, -160, -20, 20), (-20, 20, -20, 20), (340, 380, -20, 20)])
+def test_recorte_en_cualquier_formato_de_longitud(lonini, zona):
+    da = _malla(lonini)
+    recorte = _leer(recortar(da, zona), zona)
+    lon = recorte['lon'].values
+    assert np.all(np.diff(lon) > 0)
+    assert lon.size == 4
+    assert np.all((lon - zona[0]) % 360 <= zona[1] - zona[0])
+    # Los valores son los de la malla original en cada punto
+    np.testing.assert_array_equal(recorte.values[0] % 1000, np.broadcast_to(lon % 360, (4, 4)))
+    assert recorte['lat'].values.tolist() == [-15.0, -5.0, 5.0, 15.0]
+
+
+def test_recorte_latitudes_de_norte_a_sur():
+    recorte = recortar(_malla(0, lat_al_norte=False), (10, 40, -20, 20))
+    assert recorte['lat'].values.tolist() == [15.0, 5.0, -5.0, -15.0]
+    assert recorte['lon'].values.tolist() == [15.0, 25.0, 35.0]
+
+
+def test_recorte_malla_curvilinea_en_el_antimeridiano():
+    y, x = np.arange(18), np.arange(36)
+    lat2d = np.broadcast_to((-85.0 + 10 * y)[:, None], (18, 36))
+    lon2d = np.broadcast_to((-175.0 + 10 * x)[None, :], (18, 36))
+    da = xr.DataArray(np.arange(18 * 36, dtype=float).reshape(1, 18, 36), dims=('time', 'y', 'x'), name='tas',
+                      coords={'time': [0], 'nav_lat': (('y', 'x'), lat2d), 'nav_lon': (('y', 'x'), lon2d)})
+    recorte = recortar(da, (160, 200, -20, 20))
+    assert isinstance(recorte, LecturaPorPartes)
+    leido = recorte.load()
+    assert sorted(leido['nav_lon'].values[0] % 360) == [165.0, 175.0, 185.0, 195.0]
+    assert leido.sizes['y'] == 4
+
+
+def test_zona_fuera_de_la_malla():
+    with pytest.raises(ValueError):
+        recortar(_malla(0), (10, 40, 91, 95))
+
+
+def test_ventanas_guardadas_en_disco(cache_vacio, monkeypatch):
+    da = _malla(0)
+    zona = (-20, 20, -20, 20)
+    recorte = recortar(da, zona, clave_malla='PRUEBA_gn_18x36').load()
+    assert recorteEspacial.archivo_ventanas.exists()
+
+    # En otra ejecución (sin las ventanas en memoria) no se vuelven a calcular
+    def calcular(*argumentos):
+        raise AssertionError("no se debían volver a calcular las ventanas")
+
+    monkeypatch.setattr(recorteEspacial, '_ventanas', {})
+    monkeypatch.setattr(recorteEspacial, 'calcular_ventanas', calcular)
+    xr.testing.assert_identical(recortar(da, zona, clave_malla='PRUEBA_gn_18x36').load(), recorte)
+
+
+def test_descarga_de_zonas_que_cruzan_el_borde_de_la_malla(nodo_local, tmp_path):
+    # La malla de los datos sintéticos va de 0 a 360
+    zonas = {'G': (-20, 20, -10, 10), 'P': (160, 200, -10, 10)}
+    (tmp_path / 'juntas').mkdir()
+    (tmp_path / 'sola').mkdir()
+    descargar_anyos_zonas('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2015, 2015, zonas, tmp_path / 'juntas')
+    descargar_anyos_zonas('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2015, 2015, {'G': zonas['G']}, tmp_path / 'sola')
+    for carpeta, nombrezona in (('juntas', 'G'), ('juntas', 'P'), ('sola', 'G')):
+        ruta = tmp_path / carpeta / nombre_archivo_salida('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2015, nombrezona)
+        with xr.open_dataset(ruta) as ds:
+            lon = ds['lon'].values
+            assert np.all(np.diff(lon) > 0)
+            assert lon[0] >= zonas[nombrezona][0] and lon[-1] <= zonas[nombrezona][1]
+            assert ds.sizes['time'] == 12
+    with xr.open_dataset(tmp_path / 'juntas' / nombre_archivo_salida('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2015, 'G')) as juntas, \
+            xr.open_dataset(tmp_path / 'sola' / nombre_archivo_salida('PRUEBA-MON', 'ssp245', 'tas', 'mon', 2015, 'G')) as sola:
+        xr.testing.assert_identical(juntas['tas'], sola['tas'])
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+import regrillado
+from regrillado import regrillar, pesos_regrillado, malla_destino, validar_regrillado
+
+zona = (0, 20, -10, 10)
+
+
+def _datos(valores=None, resolucion=2.0, lonini=0.0):
+    lat = np.arange(-10 + resolucion / 2, 10, resolucion)
+    lon = np.arange(lonini + resolucion / 2, lonini + 20, resolucion)
+    if valores is None:
+        valores = np.full((2, lat.size, lon.size), 3.0)
+    return xr.DataArray(valores, dims=('time', 'lat', 'lon'), name='tas', attrs={'units': 'K'},
+                        coords={'time': [0, 1], 'lat': lat, 'lon': lon})
+
+
+@pytest.fixture(autouse=True)
+def pesos_en_memoria_vacios(monkeypatch):
+    monkeypatch.setattr(regrillado, '_pesos', {})
+
+
+@pytest.mark.parametrize('metodo', ['bilineal', 'conservativo'])
+def test_filas_suman_uno(metodo):
+    datos = _datos()
+    lat_d, lon_d = malla_destino(zona, {'resolucion': 5.0})
+    matriz = pesos_regrillado(datos['lat'].values, datos['lon'].values, lat_d, lon_d, metodo, 5.0)
+    assert matriz.shape == (lat_d.size * lon_d.size, datos['lat'].size * datos['lon'].size)
+    np.testing.assert_allclose(np.asarray(matriz.sum(axis=1)).ravel(), 1.0)
+    assert (matriz.data >= 0).all()
+
+
+@pytest.mark.parametrize('metodo', ['bilineal', 'conservativo'])
+def test_campo_constante_sigue_constante(metodo):
+    resultado = regrillar(_datos(), zona, {'metodo': metodo, 'resolucion': 5.0})
+    assert resultado['lat'].values.tolist() == [-7.5, -2.5, 2.5, 7.5]
+    assert resultado['lon'].values.tolist() == [2.5, 7.5, 12.5, 17.5]
+    np.testing.assert_allclose(resultado.values, 3.0)
+    assert resultado.attrs['regrillado'] == metodo
+    assert resultado.attrs['units'] == 'K'
+
+
+def test_conservativo_conserva_el_promedio_de_area():
+    generador = np.random.default_rng(0)
+    datos = _datos(generador.random((2, 10, 10)))
+    resultado = regrillar(datos, zona, {'metodo': 'conservativo', 'resolucion': 10.0})
+    pesos = np.cos(np.deg2rad(datos['lat']))
+    np.testing.assert_allclose(resultado.weighted(np.cos(np.deg2rad(resultado['lat']))).mean(('lat', 'lon')),
+                               datos.weighted(pesos).mean(('lat', 'lon')), rtol=1e-3)
+
+
+@pytest.mark.parametrize('metodo', ['bilineal', 'conservativo'])
+def test_pesos_se_reparten_sin_los_puntos_sin_dato(metodo):
+    valores = np.full((2, 10, 10), 3.0)
+    valores[:, 0, 0] = np.nan
+    valores[1, :3, :3] = np.nan
+    resultado = regrillar(_datos(valores), zona, {'metodo': metodo, 'resolucion': 5.0})
+    # El primer tiempo no se diluye por el punto sin dato
+    np.testing.assert_allclose(resultado.values[0], 3.0)
+    # En el segundo, la celda de destino sin ningún punto con dato queda sin dato
+    assert np.isnan(resultado.values[1, 0, 0])
+    np.testing.assert_allclose(resultado.values[1][~np.isnan(resultado.values[1])], 3.0)
+
+
+def test_longitudes_en_otro_formato():
+    # Datos de 340 a 360 y zona de -20 a 0
+    resultado = regrillar(_datos(lonini=340.0), (-20, 0, -10, 10), {'metodo': 'bilineal', 'resolucion': 5.0})
+    assert resultado['lon'].values.tolist() == [-17.5, -12.5, -7.5, -2.5]
+    np.testing.assert_allclose(resultado.values, 3.0)
+
+
+def test_pesos_guardados_en_disco(monkeypatch):
+    datos = _datos()
+    opciones = {'metodo': 'bilineal', 'resolucion': 5.0}
+    esperado = regrillar(datos, zona, opciones)
+    archivos = list(regrillado.carpeta_pesos.glob('*.npz'))
+    assert len(archivos) == 1
+
+    # En otra ejecución (sin los pesos en memoria) se leen del disco sin calcularlos
+    def calcular(*argumentos):
+        raise AssertionError("no se debían volver a calcular los pesos")
+
+    pesos_lineales = regrillado._pesos_lineales
+    monkeypatch.setattr(regrillado, '_pesos', {})
+    monkeypatch.setattr(regrillado, '_pesos_lineales', calcular)
+    xr.testing.assert_identical(regrillar(datos, zona, opciones), esperado)
+    monkeypatch.setattr(regrillado, '_pesos_lineales', pesos_lineales)
+
+    # Si cambia la malla del modelo se calculan y se guardan otros pesos
+    regrillar(_datos(np.full((2, 20, 20), 3.0), resolucion=1.0), zona, opciones)
+    assert len(list(regrillado.carpeta_pesos.glob('*.npz'))) == 2
+
+
+def test_malla_curvilinea_no_se_regrilla():
+    lat2d, lon2d = np.meshgrid(np.arange(-9.0, 10, 2), np.arange(1.0, 20, 2), indexing='ij')
+    datos = xr.DataArray(np.ones((1, 10, 10)), dims=('time', 'y', 'x'), name='tas',
+                         coords={'time': [0], 'nav_lat': (('y', 'x'), lat2d), 'nav_lon': (('y', 'x'), lon2d)})
+    with pytest.raises(ValueError, match='regulares'):
+        regrillar(datos, zona, {'metodo': 'bilineal', 'resolucion': 5.0})
+
+
+def test_validar_regrillado():
+    assert validar_regrillado({'resolucion': 1.0})['metodo'] == 'bilineal'
+    for opciones in ({'metodo': 'cubico', 'resolucion': 1.0}, {'resolucion': 0}, {'metodo': 'bilineal'}):
+        with pytest.raises(ValueError):
+            validar_regrillado(opciones)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+import zarr
+
+from salidaConsolidada import agregar_tiempos, tiempos_en_salida, recortar_salida
+
+
+def _bloque(inicio, tiempos):
+    fechas = pd.date_range(str(inicio), periods=tiempos, freq='D')
+    return xr.DataArray(np.random.default_rng(inicio).random((tiempos, 4, 6)), name='tas',
+                        dims=('time', 'lat', 'lon'),
+                        coords={'time': fechas, 'lat': np.arange(4.0), 'lon': np.arange(6.0)})
+
+
+def test_agregar_tiempos_netcdf(tmp_path):
+    ruta = tmp_path / 'salida.nc'
+    assert agregar_tiempos(_bloque(2015, 30), ruta, 'netcdf', {}) == 30
+    assert agregar_tiempos(_bloque(2016, 20), ruta, 'netcdf', {}) == 50
+    with xr.open_dataset(ruta) as ds:
+        assert ds['time'].dt.year.values.tolist() == [2015] * 30 + [2016] * 20
+    recortar_salida(ruta, 'netcdf', 30)
+    assert tiempos_en_salida(ruta, 'netcdf') == 30
+
+
+def test_agregar_tiempos_zarr_con_codificacion(tmp_path):
+    ruta = tmp_path / 'salida.zarr'
+    agregar_tiempos(_bloque(2015, 30), ruta, 'zarr', {'compresion': 'zstd', 'nivel': 3, 'empaquetar': True})
+    assert agregar_tiempos(_bloque(2016, 30), ruta, 'zarr', {'compresion': 'zstd', 'nivel': 3}) == 60
+    arreglo = zarr.open_array(str(ruta / 'tas'), mode='r')
+    assert arreglo.dtype == np.float32
+    assert 'zstd' in str(arreglo.compressors if hasattr(arreglo, 'compressors') else arreglo.compressor)
+    with xr.open_zarr(ruta) as ds:
+        np.testing.assert_allclose(ds['tas'].isel(time=slice(30, 60)).values, _bloque(2016, 30).values, rtol=1e-6)
+
+
+def test_agregar_tiempos_zarr_sin_reabrir(tmp_path, monkeypatch):
+    import salidaConsolidada
+
+    ruta = tmp_path / 'salida.zarr'
+    assert agregar_tiempos(_bloque(2015, 30), ruta, 'zarr') == 30
+    assert agregar_tiempos(_bloque(2016, 20), ruta, 'zarr') == 50
+
+    # Si quien escribe lleva la cuenta de los tiempos, la salida no se abre para contarlos
+    def contar(*argumentos):
+        raise AssertionError("no se debía abrir la salida para contar sus tiempos")
+
+    monkeypatch.setattr(salidaConsolidada, 'tiempos_en_salida', contar)
+    tiempos = 50
+    for anyo in (2017, 2018):
+        tiempos = agregar_tiempos(_bloque(anyo, 10), ruta, 'zarr', tiempos=tiempos)
+    assert tiempos == 70
+    monkeypatch.undo()
+    assert tiempos_en_salida(ruta, 'zarr') == 70
@@ -0,0 +1,276 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo recorta los datos de una malla a una zona (lonmin, lonmax, latmin,
+latmax). La zona y la malla pueden tener las longitudes en cualquiera de los
+dos formatos (-180 a 180 o 0 a 360), y la zona puede cruzar el meridiano de
+Greenwich o el antimeridiano (por ejemplo, de 170 a 190 o de -10 a 10). Las
+latitudes de la malla pueden ir de sur a norte o de norte a sur, y la malla
+puede ser curvilínea (latitud y longitud en dos dimensiones).
+
+El recorte se expresa como ventanas de posiciones en cada dimensión de la
+malla. Cuando la zona cruza el borde de la malla (por ejemplo, -10 a 10 en una
+malla de 0 a 360) los datos quedan en dos ventanas, que se leen por separado
+y se unen en memoria. Las longitudes de la malla se conservan, salvo cuando
+en el recorte no quedan en orden creciente (la zona cruza el borde de la
+malla): entonces se expresan de forma continua desde "lonmin" (por ejemplo,
+de -10 a 10). Así las longitudes de una zona no dependen de si se leyó sola o
+junto con otras zonas.
+
+Las ventanas se calculan una sola vez por malla y zona y se guardan en
+memoria; si se da la clave de la malla (modelo, etiqueta y tamaño de la malla)
+también se guardan en disco, de modo que en mallas curvilíneas no se vuelven
+a pedir las coordenadas al servidor en las siguientes ejecuciones.
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import os
+import json
+import threading
+from cacheMetadatos import carpeta_cache
+from extraccionBloques import candado_netcdf
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+# Archivo en el que se guardan las ventanas de las mallas con clave
+archivo_ventanas = carpeta_cache() / 'ventanas_mallas.json'
+
+# Nombres con los que aparecen las coordenadas de latitud y longitud en los modelos
+nombres_latitud = ('lat', 'latitude', 'nav_lat')
+nombres_longitud = ('lon', 'longitude', 'nav_lon')
+
+_ventanas = {}
+_candado = threading.Lock()
+
+
+class LecturaPorPartes:
+    '''
+    Datos de una zona que en el archivo quedan en varias ventanas de una misma
+    dimensión. Se comporta como el DataArray perezoso que se lee por bloques
+    (ver "extraccionBloques.py"): "isel" se aplica a cada parte y "load" lee
+    cada parte por separado y las une en memoria, con las longitudes de la
+    malla (al recortar el bloque leído con "recortar" quedan en orden).
+    '''
+
+    def __init__(self, partes, dim):
+        self.partes = partes
+        self.dim = dim
+
+    @property
+    def sizes(self):
+        tamanyos = dict(self.partes[0].sizes)
+        tamanyos[self.dim] = sum(parte.sizes[self.dim] for parte in self.partes)
+        return tamanyos
+
+    @property
+    def name(self):
+        return self.partes[0].name
+
+    def isel(self, indexers=None, **indices):
+        indices = dict(indexers or {}, **indices)
+        return LecturaPorPartes([parte.isel(**indices) for parte in self.partes], self.dim)
+
+    def load(self):
+        import xarray as xr
+
+        return xr.concat([parte.load() for parte in self.partes], dim=self.dim)
+
+
+def longitud_continua(lon, referencia):
+    '''
+    Se expresan las longitudes de forma continua desde "referencia" (es decir,
+    entre "referencia" y "referencia" + 360).
+    '''
+    return referencia + (lon - referencia) % 360
+
+
+def longitudes_en_orden(da, lonmin):
+    '''
+    Si la longitud de "da" es de una dimensión y no está en orden creciente
+    (la zona cruza el borde de la malla), se expresa de forma continua desde "lonmin".
+    '''
+    import numpy as np
+
+    _, nombre_lon = coordenadas_malla(da)
+    lon = da[nombre_lon]
+    if lon.ndim != 1 or lon.size < 2 or bool(np.all(np.diff(lon.values) > 0)):
+        return da
+    return da.assign_coords({nombre_lon: longitud_continua(lon, lonmin)})
+
+
+def coordenadas_malla(da):
+    '''
+    Se devuelven los nombres de las coordenadas de latitud y longitud de "da".
+    '''
+    lat = next((nombre for nombre in nombres_latitud if nombre in da.coords), None)
+    lon = next((nombre for nombre in nombres_longitud if nombre in da.coords), None)
+    if lat is None or lon is None:
+        raise ValueError("No se encontraron las coordenadas de latitud y longitud de los datos")
+    return lat, lon
+
+
+def _tramos(posiciones, tamanyo, orden=None):
+    '''
+    Se agrupan las posiciones seleccionadas (ordenadas) en tramos contiguos
+    [(inicio, fin), ...]. Si hay dos tramos que tocan los dos bordes de la
+    dimensión (la zona da la vuelta) se ordenan según "orden" (la distancia
+    desde el borde oeste de la zona de la primera posición de cada tramo);
+    si hay más tramos se toma un solo tramo del primero al último.
+    '''
+    import numpy as np
+
+    cortes = np.flatnonzero(np.diff(posiciones) != 1) + 1
+    grupos = np.split(posiciones, cortes)
+    tramos = [(int(grupo[0]), int(grupo[-1]) + 1) for grupo in grupos]
+    if len(tramos) == 2 and tramos[0][0] == 0 and tramos[1][1] == tamanyo:
+        if orden is not None and orden[tramos[1][0]] < orden[tramos[0][0]]:
+            tramos = [tramos[1], tramos[0]]
+        return tramos
+    return [(tramos[0][0], tramos[-1][1])]
+
+
+def calcular_ventanas(da, zona):
+    '''
+    Se calculan las ventanas de "da" que cubren la zona: un diccionario con
+    los tramos de posiciones de cada dimensión de la malla, {dim: [(ini, fin), ...]}.
+    '''
+    import numpy as np
+
+    lonmin, lonmax, latmin, latmax = zona
+    nombre_lat, nombre_lon = coordenadas_malla(da)
+    lat = da[nombre_lat]
+    lon = da[nombre_lon]
+    ancho = lonmax - lonmin
+    # Las coordenadas de una malla curvilínea se leen del archivo al pedirlas
+    with candado_netcdf:
+        valores_lat = np.asarray(lat.values, dtype=float)
+        valores_lon = np.asarray(lon.values, dtype=float)
+    distancia = (valores_lon - lonmin) % 360
+    dentro_lon = distancia <= ancho if ancho < 360 else np.ones(distancia.shape, dtype=bool)
+    dentro_lat = (valores_lat >= latmin) & (valores_lat <= latmax)
+
+    tramos = {}
+    if lat.ndim == 1 and lon.ndim == 1:
+        # Malla regular: cada coordenada tiene su propia dimensión
+        for dim, dentro in ((lat.dims[0], dentro_lat), (lon.dims[0], dentro_lon)):
+            posiciones = np.flatnonzero(dentro)
+            if posiciones.size == 0:
+                raise ValueError("La zona "+str(tuple(zona))+" no tiene puntos de la malla de los datos")
+            tramos[dim] = _tramos(posiciones, dentro.size, distancia if dim == lon.dims[0] else None)
+    else:
+        # Malla curvilínea: se toma la ventana de filas y columnas que contiene los puntos de la zona
+        dentro = dentro_lat & dentro_lon
+        if not dentro.any():
+            raise ValueError("La zona "+str(tuple(zona))+" no tiene puntos de la malla de los datos")
+        dim_y, dim_x = lat.dims
+        tramos[dim_y] = _tramos(np.flatnonzero(dentro.any(axis=1)), dentro.shape[0])
+        columnas = np.flatnonzero(dentro.any(axis=0))
+        tramos[dim_x] = _tramos(columnas, dentro.shape[1], np.where(dentro, distancia, 360.0).min(axis=0))
+    return {'tramos': tramos}
+
+
+def firma_malla(da):
+    '''
+    Se arma una firma de la malla de "da" a partir de sus coordenadas de una
+    dimensión (que ya están en memoria al abrir el archivo), o de su tamaño si
+    es curvilínea.
+    '''
+    nombre_lat, nombre_lon = coordenadas_malla(da)
+    firma = []
+    for nombre in (nombre_lat, nombre_lon):
+        coordenada = da[nombre]
+        firma.append((nombre, coordenada.dims, coordenada.shape))
+        if coordenada.ndim == 1:
+            valores = coordenada.values
+            firma.append((float(valores[0]), float(valores[-1])))
+    return tuple(firma)
+
+
+def _leer_ventanas_guardadas():
+    try:
+        with open(archivo_ventanas, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _guardar_ventanas(clave, ventanas):
+    with _candado:
+        guardadas = _leer_ventanas_guardadas()
+        guardadas[clave] = ventanas
+        archivo_ventanas.parent.mkdir(parents=True, exist_ok=True)
+        temporal = archivo_ventanas.with_name(archivo_ventanas.name + '.' + str(os.getpid()) + '.'
+                                              + str(threading.get_ident()) + '.tmp')
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(guardadas, f)
+        os.replace(temporal, archivo_ventanas)
+
+
+def ventanas_zona(da, zona, clave_malla=None):
+    '''
+    Se devuelven las ventanas de la zona en la malla de "da", calculándolas
+    solo la primera vez para cada malla y zona. Si se da "clave_malla", las
+    ventanas también se buscan y se guardan en disco.
+    '''
+    zona = tuple(float(valor) for valor in zona)
+    if clave_malla is not None:
+        clave = clave_malla + '|' + ','.join(str(valor) for valor in zona)
+    else:
+        clave = (firma_malla(da), zona)
+    with _candado:
+        ventanas = _ventanas.get(clave)
+    if ventanas is None and clave_malla is not None:
+        ventanas = _leer_ventanas_guardadas().get(clave)
+    if ventanas is None:
+        ventanas = calcular_ventanas(da, zona)
+        if clave_malla is not None:
+            _guardar_ventanas(clave, ventanas)
+    with _candado:
+        _ventanas[clave] = ventanas
+    return ventanas
+
+
+def recortar(da, zona, clave_malla=None):
+    '''
+    Se recortan los datos de "da" a la zona (lonmin, lonmax, latmin, latmax).
+    Se devuelve un DataArray, o un objeto "LecturaPorPartes" si la zona queda
+    en dos ventanas de la malla (se lee con "load", y lo leído se vuelve a
+    recortar para ordenar sus longitudes).
+    '''
+    ventanas = ventanas_zona(da, zona, clave_malla)
+    partida = None
+    for dim, tramos in ventanas['tramos'].items():
+        if len(tramos) == 1:
+            da = da.isel({dim: slice(*tramos[0])})
+        else:
+            partida = (dim, tramos)
+    if partida is None:
+        return longitudes_en_orden(da, zona[0])
+    dim, tramos = partida
+    return LecturaPorPartes([da.isel({dim: slice(*tramo)}) for tramo in tramos], dim)
+
+
+def clave_malla_archivo(nombre_archivo, da):
+    '''
+    Se arma la clave de la malla de un archivo del CMIP6 a partir de su nombre
+    ("[variable]_[tabla]_[modelo]_[escenario]_[miembro]_[malla]_[fechas].nc")
+    y del tamaño de sus dimensiones espaciales. Si el nombre no tiene esa
+    forma se devuelve None.
+    '''
+    partes = nombre_archivo.split('_')
+    if len(partes) < 7:
+        return None
+    tamanyos = 'x'.join(str(tamanyo) for dim, tamanyo in da.sizes.items() if dim != 'time')
+    return '_'.join([partes[2], partes[5], tamanyos])
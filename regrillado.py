@@ -0,0 +1,256 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo lleva los datos recortados de cada zona a una malla común de
+latitud y longitud, para que las salidas de los distintos modelos (cada uno
+con su propia malla) tengan la misma forma. Las opciones se dan como un
+diccionario:
+- 'metodo': 'bilineal' (interpolación entre los cuatro puntos vecinos) o
+  'conservativo' (promedio de las celdas del modelo ponderado por el área que
+  comparten con cada celda de destino).
+- 'resolucion': tamaño en grados de las celdas de destino; la malla se arma
+  dentro de cada zona, alineada a múltiplos de la resolución (así zonas y
+  modelos distintos comparten los mismos puntos).
+- o bien 'lat' y 'lon': los centros de la malla de destino.
+
+Los pesos de cada malla del modelo, malla de destino y zona se calculan una
+sola vez y se guardan como una matriz dispersa en el caché (carpeta
+"pesos_regrillado"); los demás años y variables se regrillan con una sola
+multiplicación por esa matriz. Los puntos sin dato no se cuentan (los pesos de
+los demás se reparten), y los puntos de destino fuera de la malla del modelo
+quedan sin dato. Solo se regrillan mallas regulares (latitud y longitud de una
+dimensión).
+
+NOTA: se requiere la librería scipy (conda install -c conda-forge scipy).
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import hashlib
+import threading
+from pathlib import Path
+from manifiestoDescargas import escribir_atomico
+from recorteEspacial import coordenadas_malla
+from cacheMetadatos import carpeta_cache
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+# Carpeta en la que se guardan las matrices de pesos
+carpeta_pesos = carpeta_cache() / 'pesos_regrillado'
+
+metodos_regrillado = ('bilineal', 'conservativo')
+
+_pesos = {}
+_candado = threading.Lock()
+
+
+def validar_regrillado(opciones):
+    '''
+    Se revisan las opciones de regrillado y se devuelven como diccionario.
+    '''
+    opciones = dict(opciones)
+    metodo = opciones.setdefault('metodo', 'bilineal')
+    if metodo not in metodos_regrillado:
+        raise ValueError("Método de regrillado no válido ("+str(metodo)+"): debe ser "+' o '.join(metodos_regrillado))
+    if 'resolucion' in opciones:
+        if float(opciones['resolucion']) <= 0:
+            raise ValueError("La resolución del regrillado debe ser mayor que cero")
+    elif 'lat' not in opciones or 'lon' not in opciones:
+        raise ValueError("Para el regrillado se debe dar la 'resolucion' o los centros 'lat' y 'lon' de la malla de destino")
+    return opciones
+
+
+def _centros(inicio, fin, resolucion):
+    import numpy as np
+
+    primero = np.ceil(round(inicio / resolucion - 0.5, 9))
+    ultimo = np.floor(round(fin / resolucion - 0.5, 9))
+    return np.round((np.arange(primero, ultimo + 1) + 0.5) * resolucion, 9)
+
+
+def malla_destino(zona, opciones):
+    '''
+    Se devuelven los centros (lat, lon) de la malla de destino de una zona.
+    '''
+    import numpy as np
+
+    if 'resolucion' not in opciones:
+        return np.asarray(opciones['lat'], dtype=float), np.asarray(opciones['lon'], dtype=float)
+    lonmin, lonmax, latmin, latmax = zona
+    resolucion = float(opciones['resolucion'])
+    lat = _centros(max(latmin, -90.0), min(latmax, 90.0), resolucion)
+    lon = _centros(lonmin, lonmax, resolucion)
+    if lat.size == 0 or lon.size == 0:
+        raise ValueError("La zona "+str(tuple(zona))+" es más pequeña que la resolución del regrillado ("+str(resolucion)+")")
+    return lat, lon
+
+
+def _limites(centros, resolucion=None):
+    '''
+    Se calculan los bordes de las celdas a partir de sus centros (ordenados):
+    a media resolución si se da, o en los puntos medios entre centros.
+    '''
+    import numpy as np
+
+    if resolucion is not None:
+        return centros - resolucion / 2, centros + resolucion / 2
+    if centros.size == 1:
+        return centros - 0.5, centros + 0.5
+    medios = (centros[:-1] + centros[1:]) / 2
+    inferiores = np.concatenate(([centros[0] - (medios[0] - centros[0])], medios))
+    superiores = np.concatenate((medios, [centros[-1] + (centros[-1] - medios[-1])]))
+    return inferiores, superiores
+
+
+def _pesos_lineales(origen, destino):
+    '''
+    Se arma la matriz (destino x origen) de interpolación lineal en una dimensión.
+    Los puntos de destino que están a menos de media celda fuera de los puntos
+    de origen (entre el borde de la zona y el primer punto del modelo) toman el
+    valor del punto de origen más cercano.
+    '''
+    import numpy as np
+    from scipy import sparse
+
+    orden = np.argsort(origen)
+    ordenado = origen[orden]
+    inferiores, superiores = _limites(ordenado)
+    filas = np.flatnonzero((destino >= inferiores[0]) & (destino <= superiores[-1]))
+    if ordenado.size == 1:
+        return sparse.csr_matrix((np.ones(filas.size), (filas, np.zeros(filas.size, dtype=int))),
+                                 shape=(destino.size, origen.size))
+    posiciones = np.clip(np.searchsorted(ordenado, destino[filas], side='right') - 1, 0, ordenado.size - 2)
+    fraccion = (destino[filas] - ordenado[posiciones]) / (ordenado[posiciones + 1] - ordenado[posiciones])
+    fraccion = np.clip(fraccion, 0.0, 1.0)
+    return sparse.csr_matrix((np.concatenate((1 - fraccion, fraccion)),
+                              (np.concatenate((filas, filas)), np.concatenate((orden[posiciones], orden[posiciones + 1])))),
+                             shape=(destino.size, origen.size))
+
+
+def _pesos_conservativos(origen, destino, resolucion=None, latitud=False):
+    '''
+    Se arma la matriz (destino x origen) con la fracción de cada celda de
+    destino que cubre cada celda de origen en una dimensión (en latitud, en
+    seno de la latitud, que es proporcional al área sobre la esfera).
+    '''
+    import numpy as np
+    from scipy import sparse
+
+    orden = np.argsort(origen)
+    inferiores_o, superiores_o = _limites(origen[orden])
+    inferiores_d, superiores_d = _limites(destino, resolucion)
+    if latitud:
+        inferiores_o, superiores_o, inferiores_d, superiores_d = (
+            np.sin(np.deg2rad(np.clip(limite, -90.0, 90.0)))
+            for limite in (inferiores_o, superiores_o, inferiores_d, superiores_d))
+    cruce = (np.minimum(superiores_d[:, None], superiores_o[None, :])
+             - np.maximum(inferiores_d[:, None], inferiores_o[None, :]))
+    cruce = np.clip(cruce, 0.0, None) / (superiores_d - inferiores_d)[:, None]
+    filas, columnas = np.nonzero(cruce)
+    return sparse.csr_matrix((cruce[filas, columnas], (filas, orden[columnas])), shape=(destino.size, origen.size))
+
+
+def _clave_pesos(metodo, resolucion, lat_o, lon_o, lat_d, lon_d):
+    import numpy as np
+
+    suma = hashlib.sha1((metodo + '|' + str(resolucion) + '|').encode())
+    for valores in (lat_o, lon_o, lat_d, lon_d):
+        suma.update(np.ascontiguousarray(valores, dtype='float64').tobytes())
+        suma.update(b'|')
+    return suma.hexdigest()
+
+
+def _guardar_matriz(ruta, matriz):
+    from scipy import sparse
+
+    def escribir(temporal):
+        with open(temporal, 'wb') as f:
+            sparse.save_npz(f, matriz)
+
+    escribir_atomico(ruta, escribir)
+
+
+def pesos_regrillado(lat_o, lon_o, lat_d, lon_d, metodo, resolucion=None, carpeta=None):
+    '''
+    Se devuelve la matriz dispersa de pesos (puntos de destino x puntos de
+    origen, en el orden lat, lon) para pasar de la malla de origen a la de
+    destino. Se busca primero en memoria y luego en el caché en disco; si no
+    está, se calcula y se guarda.
+    '''
+    from scipy import sparse
+
+    clave = _clave_pesos(metodo, resolucion, lat_o, lon_o, lat_d, lon_d)
+    with _candado:
+        matriz = _pesos.get(clave)
+    if matriz is not None:
+        return matriz
+    ruta = Path(carpeta or carpeta_pesos) / (clave + '.npz')
+    try:
+        matriz = sparse.load_npz(ruta).tocsr()
+    except (OSError, ValueError):
+        if metodo == 'bilineal':
+            matriz = sparse.kron(_pesos_lineales(lat_o, lat_d), _pesos_lineales(lon_o, lon_d), format='csr')
+        else:
+            matriz = sparse.kron(_pesos_conservativos(lat_o, lat_d, resolucion, latitud=True),
+                                 _pesos_conservativos(lon_o, lon_d, resolucion), format='csr')
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        _guardar_matriz(ruta, matriz)
+    with _candado:
+        _pesos[clave] = matriz
+    return matriz
+
+
+def regrillar(datos, zona, opciones):
+    '''
+    Se llevan los datos de una zona (un DataArray ya leído y recortado) a la
+    malla de destino definida por "opciones" (ver el inicio del módulo).
+    '''
+    import numpy as np
+    import xarray as xr
+
+    nombre_lat, nombre_lon = coordenadas_malla(datos)
+    lat, lon = datos[nombre_lat], datos[nombre_lon]
+    if lat.ndim != 1 or lon.ndim != 1:
+        raise ValueError("Solo se pueden regrillar mallas regulares (latitud y longitud de una dimensión)")
+    metodo = opciones['metodo']
+    lat_d, lon_d = malla_destino(zona, opciones)
+    lat_o = np.asarray(lat.values, dtype=float)
+    lon_o = np.asarray(lon.values, dtype=float)
+
+    # Las longitudes de destino se expresan en el mismo formato que las de los datos
+    referencia = (lon_o.min() + lon_o.max()) / 2 - 180
+    lon_comparable = referencia + (lon_d - referencia) % 360
+    matriz = pesos_regrillado(lat_o, lon_o, lat_d, lon_comparable, metodo, opciones.get('resolucion'))
+
+    otras = [dim for dim in datos.dims if dim not in (lat.dims[0], lon.dims[0])]
+    datos = datos.transpose(*otras, lat.dims[0], lon.dims[0])
+    forma = [datos.sizes[dim] for dim in otras]
+    valores = np.asarray(datos.values, dtype='float64').reshape(-1, lat_o.size * lon_o.size).T
+    validos = ~np.isnan(valores)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if validos.all():
+            cobertura = np.asarray(matriz.sum(axis=1))
+            resultado = (matriz @ valores) / cobertura
+        else:
+            cobertura = matriz @ validos.astype('float64')
+            resultado = (matriz @ np.where(validos, valores, 0.0)) / cobertura
+    resultado = np.where(cobertura > 0, resultado, np.nan)
+    resultado = resultado.T.reshape(forma + [lat_d.size, lon_d.size]).astype(datos.dtype if datos.dtype.kind == 'f' else 'float64')
+
+    coords = {dim: datos[dim] for dim in otras if dim in datos.coords}
+    coords['lat'] = ('lat', lat_d, {'units': 'degrees_north', 'standard_name': 'latitude'})
+    coords['lon'] = ('lon', lon_d, {'units': 'degrees_east', 'standard_name': 'longitude'})
+    atributos = dict(datos.attrs)
+    atributos['regrillado'] = metodo
+    return xr.DataArray(resultado, dims=otras + ['lat', 'lon'], coords=coords, attrs=atributos, name=datos.name)
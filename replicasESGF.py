@@ -0,0 +1,191 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo permite leer un archivo remoto desde cualquiera de sus réplicas.
+ESGF publica el mismo archivo en varios nodos de datos; el listado de archivos
+guarda todas sus réplicas (ver "cacheMetadatos.py"), y si la apertura o la
+lectura de un archivo falla en un nodo, después de reintentar con esperas
+crecientes se cambia a la siguiente réplica y se continúa desde donde iba.
+
+Las réplicas se ordenan poniendo primero los nodos que han respondido más
+rápido en esta ejecución. Cada nodo tiene un presupuesto de errores: cuando
+un nodo acumula "presupuesto_errores" fallas, pasa al final de la lista para
+el resto de la ejecución (solo se usa si las demás réplicas también fallan).
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import time
+import threading
+from urllib.parse import urlparse
+from extraccionBloques import espera_con_variacion, candado_netcdf
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+# Cantidad de reintentos de la apertura de un archivo en cada réplica, y
+# cantidad de fallas tras las cuales un nodo de datos pasa al final de la lista
+reintentos_apertura = 2
+presupuesto_errores = 3
+
+# Estado de los nodos de datos en esta ejecución: {nodo: {'errores', 'latencia'}}
+_estado_nodos = {}
+_candado = threading.Lock()
+
+
+def nodo_url(url):
+    '''
+    Se devuelve el nombre del nodo de datos de una dirección ('local' si es un archivo local).
+    '''
+    return urlparse(url).hostname or 'local'
+
+
+def direcciones_archivo(archivo, tipo='opendap_url'):
+    '''
+    Se devuelven las direcciones de todas las réplicas de un archivo
+    ("tipo" es 'opendap_url' o 'download_url'), empezando por la principal
+    y sin repetir nodos.
+    '''
+    direcciones = []
+    nodos = set()
+    for replica in [{tipo: getattr(archivo, tipo, None)}] + list(getattr(archivo, 'replicas', None) or []):
+        url = replica.get(tipo)
+        if url and nodo_url(url) not in nodos:
+            nodos.add(nodo_url(url))
+            direcciones.append(url)
+    return direcciones
+
+
+def registrar_error(nodo):
+    with _candado:
+        _estado_nodos.setdefault(nodo, {'errores': 0, 'latencia': None})['errores'] += 1
+
+
+def registrar_latencia(nodo, segundos):
+    '''
+    Se actualiza la latencia del nodo como un promedio móvil de sus respuestas.
+    '''
+    with _candado:
+        estado = _estado_nodos.setdefault(nodo, {'errores': 0, 'latencia': None})
+        estado['latencia'] = segundos if estado['latencia'] is None else 0.7 * estado['latencia'] + 0.3 * segundos
+
+
+def ordenar_replicas(direcciones):
+    '''
+    Se ordenan las direcciones: primero los nodos dentro de su presupuesto de
+    errores con latencia conocida (de más rápido a más lento), luego los que
+    aún no se han usado (en el orden del listado), y al final los que agotaron
+    su presupuesto de errores.
+    '''
+    with _candado:
+        estados = {url: dict(_estado_nodos.get(nodo_url(url), {'errores': 0, 'latencia': None})) for url in direcciones}
+
+    def orden(posicion_url):
+        posicion, url = posicion_url
+        estado = estados[url]
+        agotado = estado['errores'] >= presupuesto_errores
+        desconocido = estado['latencia'] is None
+        return (agotado, desconocido, estado['latencia'] or 0.0, posicion)
+
+    return [url for _, url in sorted(enumerate(direcciones), key=orden)]
+
+
+class LectorReplicas:
+    '''
+    Abre un archivo remoto desde la mejor de sus réplicas y permite cambiar a
+    la siguiente si la actual falla. Si se da un "limitador" (ver
+    "descargaLotes.py"), se respeta el límite de lecturas simultáneas del nodo
+    de la réplica en uso. Si se da "al_cerrar", se llama (una sola vez) al
+    cerrar el archivo, por ejemplo para soltar un archivo del caché
+    local (ver "descargaHTTP.py").
+    '''
+
+    def __init__(self, archivo, limitador=None, abrir=None, al_cerrar=None):
+        self.nombre = getattr(archivo, 'filename', str(archivo))
+        self.pendientes = ordenar_replicas(direcciones_archivo(archivo))
+        self.limitador = limitador
+        self.abrir_url = abrir
+        self.al_cerrar = al_cerrar
+        self.ds = None
+        self.url = None
+        self.nodo = None
+
+    def _abrir_url(self, url):
+        if self.abrir_url is not None:
+            return self.abrir_url(url)
+        import xarray as xr
+        return xr.open_dataset(url)
+
+    def abrir(self):
+        '''
+        Se abre el archivo desde la siguiente réplica disponible, reintentando
+        en cada una con esperas crecientes. Si ninguna réplica responde se
+        lanza el último error.
+        '''
+        error = None
+        self.pendientes = ordenar_replicas(self.pendientes)
+        while self.pendientes:
+            url = self.pendientes.pop(0)
+            nodo = nodo_url(url)
+            if self.limitador is not None:
+                self.limitador.adquirir(nodo)
+            for intento in range(reintentos_apertura + 1):
+                inicio = time.perf_counter()
+                try:
+                    with candado_netcdf:
+                        self.ds = self._abrir_url(url)
+                except Exception as e:
+                    error = e
+                    registrar_error(nodo)
+                    if intento < reintentos_apertura:
+                        pausa = espera_con_variacion(intento)
+                        print("Falló la apertura de "+self.nombre+" en "+nodo+" ("+type(e).__name__+": "+str(e)
+                              +"), se reintenta en "+f"{pausa:.1f}"+" s")
+                        time.sleep(pausa)
+                    continue
+                registrar_latencia(nodo, time.perf_counter() - inicio)
+                self.url = url
+                self.nodo = nodo
+                return self.ds
+            if self.limitador is not None:
+                self.limitador.liberar(nodo)
+            if self.pendientes:
+                print("No se pudo abrir "+self.nombre+" en "+nodo+", se intenta con otra réplica")
+        if error is None:
+            error = OSError("El archivo "+self.nombre+" no tiene direcciones disponibles")
+        raise error
+
+    def cambiar_replica(self, error):
+        '''
+        Se registra el error de la réplica en uso, se cierra y se abre la
+        siguiente. Si no quedan réplicas se lanza el error recibido.
+        '''
+        nodo = self.nodo
+        registrar_error(nodo)
+        self.cerrar()
+        if not self.pendientes:
+            raise error
+        print("Falló la lectura de "+self.nombre+" en "+str(nodo)+" ("+type(error).__name__+": "+str(error)
+              +"), se cambia de réplica")
+        return self.abrir()
+
+    def cerrar(self):
+        if self.ds is not None:
+            with candado_netcdf:
+                self.ds.close()
+            self.ds = None
+            if self.limitador is not None:
+                self.limitador.liberar(self.nodo)
+        if self.al_cerrar is not None:
+            al_cerrar, self.al_cerrar = self.al_cerrar, None
+            al_cerrar()
@@ -0,0 +1,180 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo permite guardar todo un rango de años en una sola salida (un
+almacén Zarr fragmentado por año -o por bloque de tiempos-, o un solo archivo NetCDF con la dimensión
+del tiempo ilimitada), en lugar de un archivo por año. Cada año descargado se
+agrega al final de la dimensión del tiempo, de modo que una descarga parcial
+ya se puede usar, y al reanudar solo se agregan los años que faltan.
+
+Cada año agregado se registra en el manifiesto de descargas (ver
+"manifiestoDescargas.py") junto con la cantidad de tiempos que tenía la salida
+al terminar de agregarlo. Si una ejecución se interrumpe a mitad de un año,
+al reanudar se recorta la salida hasta el último año registrado.
+
+El nombre de la salida consolidada es:
+  "[variable]_[temporalidad]_[escenario]_[modelo]_[año inicial]-[año final]_[zona].zarr"
+(o ".nc" si se guarda en un solo archivo NetCDF)
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import os
+import shutil
+from pathlib import Path
+from codificacionSalida import escribir_netcdf, codificacion_zarr, opciones_por_defecto
+from extraccionBloques import candado_netcdf
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+formatos_consolidados = {'zarr': '.zarr', 'netcdf': '.nc'}
+
+
+def nombre_salida_consolidada(modelo, escenario, varclim, frecuencia, anyoini, anyofin, nombrezona, formato):
+    '''
+    Se define el nombre de la salida consolidada de un rango de años.
+    '''
+    if formato not in formatos_consolidados:
+        raise ValueError("Formato de salida consolidada no válido ("+str(formato)+"): debe ser 'zarr' o 'netcdf'")
+    return (varclim+'_'+frecuencia+'_'+escenario+'_'+modelo+'_'+str(anyoini)+'-'+str(anyofin)+'_'+nombrezona
+            +formatos_consolidados[formato])
+
+
+def clave_consolidada(clave, ruta):
+    '''
+    Se arma la clave del manifiesto de un año guardado en una salida consolidada
+    (para no confundirla con la del archivo de ese mismo año por separado).
+    '''
+    return clave + '@' + Path(ruta).name
+
+
+def _abrir(ruta, formato):
+    import xarray as xr
+
+    if formato == 'zarr':
+        return xr.open_zarr(ruta, decode_times=False)
+    return xr.open_dataset(ruta, decode_times=False)
+
+
+def tiempos_en_salida(ruta, formato):
+    '''
+    Se devuelve la cantidad de tiempos que tiene la salida (0 si no existe).
+    '''
+    if not Path(ruta).exists():
+        return 0
+    with candado_netcdf, _abrir(ruta, formato) as ds:
+        return ds.sizes.get('time', 0)
+
+
+def tamanyo_salida(ruta):
+    '''
+    Se devuelve el tamaño en bytes de una salida (un archivo o un directorio Zarr).
+    '''
+    ruta = Path(ruta)
+    if ruta.is_dir():
+        return sum(parte.stat().st_size for parte in ruta.rglob('*') if parte.is_file())
+    return ruta.stat().st_size if ruta.exists() else 0
+
+
+def borrar_salida(ruta):
+    '''
+    Se borra una salida consolidada (un directorio Zarr o un archivo NetCDF).
+    '''
+    ruta = Path(ruta)
+    if ruta.is_dir():
+        shutil.rmtree(ruta)
+    elif ruta.exists():
+        ruta.unlink()
+
+
+def recortar_salida(ruta, formato, registros):
+    '''
+    Se recorta la salida a sus primeros "registros" tiempos (se usa cuando una
+    ejecución se interrumpió a mitad de agregar un año). Si no quedan registros
+    se borra la salida.
+    '''
+    ruta = Path(ruta)
+    if registros <= 0:
+        borrar_salida(ruta)
+        return
+    print("Se recorta la salida "+ruta.name+" hasta el último año completo ("+str(registros)+" tiempos)")
+    temporal = ruta.with_name('.' + ruta.name + '.' + str(os.getpid()) + '.tmp')
+    borrar_salida(temporal)
+    with candado_netcdf, _abrir(ruta, formato) as ds:
+        recortado = ds.isel(time=slice(0, registros))
+        for nombre in recortado.variables:
+            recortado[nombre].encoding.pop('chunks', None)
+            recortado[nombre].encoding.pop('preferred_chunks', None)
+        if formato == 'zarr':
+            recortado.to_zarr(temporal, mode='w')
+        else:
+            recortado.to_netcdf(temporal, unlimited_dims=['time'])
+    borrar_salida(ruta)
+    os.replace(temporal, ruta)
+
+
+def agregar_tiempos(da, ruta, formato, codificacion=None, tiempos=None):
+    '''
+    Se agregan los datos de "da" (un año o un bloque de tiempos) al final de la
+    dimensión del tiempo de la salida, creándola si no existe con las opciones de
+    "codificacion" (ver "codificacionSalida.py"). En Zarr cada llamada queda en
+    su propio fragmento de tiempo. Se devuelve la cantidad de tiempos que tiene
+    la salida al terminar. Si se da "tiempos" (la cantidad que ya tenía la
+    salida, que lleva quien la escribe), en Zarr no se vuelve a abrir la salida
+    para contarlos.
+    '''
+    ruta = Path(ruta)
+    # El empaquetado en enteros se calcula con los primeros datos, y los que
+    # se agreguen después podrían salirse de ese rango, por eso no se usa aquí
+    if not ruta.exists() and codificacion is not None and codificacion.get('empaquetar'):
+        print("Al agregar datos por partes a una salida no se empaquetan en enteros de 16 bits")
+        codificacion = dict(codificacion, empaquetar=False)
+
+    if formato == 'zarr':
+        ds = da.to_dataset()
+        for nombre in ds.variables:
+            ds[nombre].encoding.pop('chunks', None)
+            ds[nombre].encoding.pop('preferred_chunks', None)
+        if not ruta.exists():
+            if codificacion is None:
+                opciones_zarr = {da.name: {'chunks': tuple(da.sizes[dim] for dim in da.dims)}}
+            else:
+                opciones_zarr = codificacion_zarr(da, **dict(opciones_por_defecto, **codificacion))
+            ds.to_zarr(ruta, mode='w', encoding=opciones_zarr)
+            return da.sizes['time']
+        if tiempos is None:
+            tiempos = tiempos_en_salida(ruta, formato)
+        ds.to_zarr(ruta, append_dim='time')
+        return tiempos + da.sizes['time']
+
+    if not ruta.exists():
+        escribir_netcdf(da, str(ruta), codificacion, dims_ilimitadas=['time'])
+        return da.sizes['time']
+
+    import netCDF4
+    from xarray.coding.times import encode_cf_datetime
+
+    # Las librerías HDF5 y netCDF-C no admiten llamadas simultáneas desde varios
+    # hilos (ver "candado_netcdf" en "extraccionBloques.py")
+    datos = da.transpose('time', ...).values
+    tiempos = da['time'].values
+    with candado_netcdf:
+        with netCDF4.Dataset(ruta, 'a') as nc:
+            tiempo = nc.variables['time']
+            inicio = len(nc.dimensions['time'])
+            fin = inicio + len(tiempos)
+            valores, _, _ = encode_cf_datetime(tiempos, tiempo.units, getattr(tiempo, 'calendar', 'standard'))
+            nc.variables[da.name][inicio:fin] = datos
+            tiempo[inicio:fin] = valores
+    return fin
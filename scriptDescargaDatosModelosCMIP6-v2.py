@@ -45,8 +45,10 @@ volver a hacerlos -a excepción del paso 2-). Los pasos son los siguientes:
 # descargar los datos que requiera. Se indican los posibles valores de éstos,
 # los cuales se deben escribir tal cual se muestran allí.
 # NOTAS IMPORTANTES:
-#   1. Este script es invocado por otro llamado "descargarVariosAnyosDatosModelosCMIP6-v1.py",
-#      por lo tanto, ambos scripts se deben tener en la misma carpeta para que funcione
+#   1. Este script descarga un solo año desde la línea de comandos. La lógica de la
+#      descarga está en el módulo "descargaCMIP6.py", el cual también es utilizado por
+#      el script "descargarVariosAnyosDatosModelosCMIP6-v1.py" (que ya no invoca a este
+#      script año por año), por lo tanto, todos se deben tener en la misma carpeta
 #   2. Esta versión del script funciona únicamente para descargar los datos
 #      de sólo un año, de sólo un escenario, de sólo una variable, 
 #      de sólo una temporalidad -diaria o mensual- y de un sólo modelo.
@@ -82,14 +84,8 @@ volver a hacerlos -a excepción del paso 2-). Los pasos son los siguientes:
 #       en la descripción del código al inicio
 
 # ---NO MODIFICAR ESTAS LÍNEAS---
-import pyesgf
-import xarray as xr
-from pathlib import Path
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cf
-from pyesgf.search import SearchConnection
 import sys
+from descargaCMIP6 import descargar_anyos, ErrorDescargaCMIP6
 # ---FIN LIBRERÍAS NECESARIAS---
 
 modelo=sys.argv[1]
@@ -106,140 +102,14 @@ rutasalidas=sys.argv[11]
 
 #----NO MODIFICAR EL SCRIPT DE AQUÍ EN ADELANTE----
 
-# Aquí se define la variable con el nombre del archivo de salida
-nomarchsalida=varclim+'_'+frecuencia+'_'+escenario+'_'+modelo+'_'+str(anyobuscado)+'_'+nombrezona+'.nc'
-
-# Primero se validan las coordenadas de longitud y latitud
-# (es decir, que la coordenada oeste de longitud de la zona 
-# no sea mayor que la coordenada este, y que la coordenada 
-# de latitud sur no sea mayor que la coordenada norte)
-
-if( (lonmin>=lonmax) or (latmin>=latmax) ):
-    print("Error con las coordenadas de la zona:")
-    if(lonmin>=lonmax):
-        print("La coordenada de longitud oeste ("+str(lonmin)+") es mayor o igual que la coordenada de longitud este ("+str(lonmax)+")")
-    if(latmin>=latmax):
-        print("La coordenada de latitud sur ("+str(latmin)+") es mayor o igual que la coordenada de latitud norte ("+str(latmax)+")")
-    exit(1)
-else:
-    
-    # Inicia el proceso de descarga de los datos como tal 
-    # Se define la página de la cual se buscarán y descargarán los datos
-    #https://esgf.github.io/nodes.html
-    # NOTA: esta lista refleja los nodos que respondieron correctamente
-    # en las pruebas más recientes (DKRZ, NCI y CEDA). La disponibilidad
-    # de los nodos ESGF puede cambiar con el tiempo.
-    nodos_esgf = [
-        'https://esgf-data.dkrz.de/esg-search',
-        'https://esgf.nci.org.au/esg-search',
-        'https://esgf.ceda.ac.uk/esg-search',
-    ]
-    
-    ctx = None
-    
-    for nodo in nodos_esgf:
-        try:
-            print("Intentando conectar al nodo: " + nodo)
-            conn_intento = SearchConnection(nodo, distrib=True)
-            ctx_intento = conn_intento.new_context(
-                project='CMIP6',
-                source_id=modelo,
-                experiment_id=escenario,
-                variable=varclim,
-                frequency=frecuencia,
-                variant_label='r1i1p1f1',
-                #data_node='esgf.ceda.ac.uk',
-                facets='*')
-            ctx_intento.hit_count  # esta línea dispara la consulta real al servidor
-    
-            ctx = ctx_intento
-            print("Conexión exitosa con: " + nodo)
-            break
-    
-        except Exception as e:
-            print("El nodo " + nodo + " no respondió correctamente (" + type(e).__name__ + "): " + str(e))
-            continue
-    
-    if ctx is None:
-        print("No fue posible conectar con ningún nodo ESGF de la lista.")
-        print("Los servidores del CMIP6 suelen fallar en ocasiones; por favor intente más tarde (dar un día de espera al menos).")
-        sys.exit(1)
-    
-    result = ctx.search()[0]
-
-    # Y se obtiene el listado de archivos disponibles
-    files = result.file_context().search()
-
-    # Acá se establece la cantidad de tiempos que debem traerse del año buscado,
-    # según la temporalidad definida (si son datos diarios se traen 365 o 366 días,
-    # si son mensuales se traen los 12 meses) 
-    if(frecuencia=='day'):
-        temporalidad1=365
-        temporalidad2=366
-        restemp='diarios'
-    else:
-        temporalidad1=12
-        temporalidad2=12
-        restemp='mensuales'
-
-    # Se muestran en pantalla los parámetros establecidos para la búsqueda y descarga
-    # del archivo a buscar
-    print("Realizando la búsqueda y descarga de los datos "+restemp+" de "+varclim+",")
-    print("del modelo "+modelo+" del escenario "+escenario+", para el año "+str(anyobuscado)+",")
-    print("para la zona de "+nombrezona) 
-
-    # Inicia la búsqueda como tal en el listado de archivos disponibles generados
-    # en la consulta a la página web. Para cada uno de estos archivos...
-    for file in files:
-
-        # ...primero se trae el nombre del archivo,
-        archivo=file.opendap_url
-    
-        # luego se obtienen el año inicial y final que tiene el mismo,
-        partsarchivo = archivo.split("_")
-        fechas00=partsarchivo[(len(partsarchivo)-1)]
-        fechas0=fechas00.split(".")
-        fechas=fechas0[0].split("-")
-        anyoiniarch = fechas[0][:4]
-        anyofinarch = fechas[1][:4]
-    
-        # después se revisa si el año buscado de los datos está en el rango de años del archivo
-        if (int(anyofinarch) >= (anyobuscado)) and (int(anyoiniarch) <= (anyobuscado)):
-    
-            # Si el archivo tiene el año buscado, se muestra la dirección en la que se puede
-            # descargar el archivo completo
-            #print("URL del archivo que contiene los datos del año buscado:")
-            #print(archivo)
-        
-            # Y como tal se inicia la extracción de los datos para el año buscado y la zona definida
-            anyoini=anyobuscado
-            ds = xr.open_dataset(archivo)
-            tiemposarch=ds.sizes["time"]
-            tiempo_arch=0
-            for anyo in range(int(anyoiniarch),(int(anyofinarch)+1)):
-                if(anyo==anyobuscado):
-                    tiempoini=tiempo_arch
-                    if(anyo==int(anyofinarch)):
-                        tiempofin=tiemposarch
-                    else:
-                        if((anyo % 4) == 0):
-                            tiempofin=tiempo_arch+temporalidad2
-                        else:
-                            tiempofin=tiempo_arch+temporalidad1
-                    da = ds[varclim]
-                    da = da.isel(time=slice(tiempoini, tiempofin))
-                    da = da.sel(lat=slice(latmin, latmax), lon=slice((lonmin+360), (lonmax+360)))
-                
-                    archivonetcdf = rutasalidas+"/"+nomarchsalida
-                    da.to_netcdf(archivonetcdf)
-                
-                    # Una vez realizado el proceso de extracción de los datos del año buscado y de la zona definida,
-                    # se muestra el nombre del archivo generado
-                    print('Se ha generado el archivo "'+str(archivonetcdf)+'" con los datos del año buscado')
-                
-                if(anyo % 4 == 0 and anyo % 100 == 0 and anyo % 400 == 0):
-                    tiempo_arch=tiempo_arch+temporalidad2
-                else:
-                    tiempo_arch=tiempo_arch+temporalidad1
+# La descarga como tal se realiza en el módulo "descargaCMIP6.py"
+# (la validación de las coordenadas, la consulta a los nodos ESGF y la
+# extracción de los datos del año buscado para la zona definida)
+try:
+    descargar_anyos(modelo, escenario, varclim, frecuencia, anyobuscado, anyobuscado,
+                    lonmin, lonmax, latmin, latmax, nombrezona, rutasalidas)
+except ErrorDescargaCMIP6 as e:
+    print(str(e))
+    sys.exit(1)
 
 #----FIN----
@@ -0,0 +1,655 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo levanta en la propia máquina un reemplazo de un nodo ESGF, para
+probar y medir la descarga sin depender de los servidores del CMIP6 (ver
+"benchmarkDescargaCMIP6.py"). Un solo servidor HTTP atiende:
+- '/esg-search/search': la búsqueda de conjuntos de datos y de archivos, con
+  respuestas JSON como las del índice ESGF (las que lee pyesgf).
+- '/thredds/dodsC/...': los archivos por OPeNDAP (protocolo DAP2: '.dds',
+  '.das' y '.dods' con recortes por posiciones), que es lo que pide la
+  librería netCDF al abrir la dirección con xarray.
+- '/thredds/fileServer/...': los archivos completos por HTTP, con peticiones
+  por rango.
+
+Los archivos son sintéticos, con la forma de los del CMIP6 (nombre, variable,
+coordenadas y calendario), y se generan con "generar_datos" a partir de una
+lista de conjuntos de datos (modelo, escenario, variable, temporalidad,
+calendario, resolución de la malla y años por archivo). Se pueden simular la
+latencia del servidor, el ancho de banda de cada conexión y fallos al azar en
+una fracción de las peticiones.
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import re
+import json
+import time
+import random
+import threading
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse, parse_qs, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from manifiestoDescargas import suma_archivo, escribir_atomico
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+# Nombre del archivo con el catálogo de los datos sintéticos generados
+nombre_catalogo = 'catalogo.json'
+
+# Tamaño de los pedazos en que se envían las respuestas (en bytes); con
+# ancho de banda limitado se espera después de cada pedazo
+tamanyo_envio = 64 * 1024
+
+# Tipos de datos de DAP2 y su codificación en la respuesta binaria (XDR)
+tipos_dap = {
+    'f4': ('Float32', '>f4'),
+    'f8': ('Float64', '>f8'),
+    'i4': ('Int32', '>i4'),
+    'i2': ('Int16', '>i4'),
+    'u4': ('UInt32', '>u4'),
+    'u2': ('UInt16', '>u4'),
+}
+
+# Unidades y valores de las variables sintéticas: (unidades, media, amplitud)
+variables_sinteticas = {
+    'tas': ('K', 288.0, 15.0),
+    'tasmax': ('K', 294.0, 15.0),
+    'tasmin': ('K', 282.0, 15.0),
+    'pr': ('kg m-2 s-1', 3.0e-5, 2.5e-5),
+}
+
+tablas = {'mon': 'Amon', 'day': 'day'}
+
+
+
+def nombre_archivo_cmip6(conjunto, anyoini, anyofin):
+    '''
+    Se arma el nombre de un archivo sintético como los del CMIP6:
+    "[variable]_[tabla]_[modelo]_[escenario]_r1i1p1f1_gn_[fechas].nc".
+    '''
+    if conjunto['frecuencia'] == 'mon':
+        fechas = str(anyoini)+'01-'+str(anyofin)+'12'
+    else:
+        ultimo_dia = '1230' if conjunto['calendario'] == '360_day' else '1231'
+        fechas = str(anyoini)+'0101-'+str(anyofin)+ultimo_dia
+    return '_'.join([conjunto['variable'], tablas[conjunto['frecuencia']], conjunto['modelo'], conjunto['escenario'],
+                     'r1i1p1f1', 'gn', fechas]) + '.nc'
+
+
+def id_conjunto(conjunto):
+    '''
+    Se arma el identificador ESGF (sin el nodo de datos) de un conjunto de datos sintético.
+    '''
+    return '.'.join(['CMIP6', 'ScenarioMIP', 'CIIFEN', conjunto['modelo'], conjunto['escenario'], 'r1i1p1f1',
+                     tablas[conjunto['frecuencia']], conjunto['variable'], 'gn', 'v20200101'])
+
+
+def _tiempos_anyo(anyo, frecuencia, calendario, unidades):
+    '''
+    Se devuelven los valores de la coordenada de tiempo de un año (mitad de
+    cada mes o de cada día) en las unidades y el calendario dados.
+    '''
+    import cftime
+    import numpy as np
+
+    if frecuencia == 'mon':
+        fechas = [cftime.datetime(anyo, mes, 15, 12, calendar=calendario) for mes in range(1, 13)]
+        return np.asarray(cftime.date2num(fechas, unidades, calendar=calendario), dtype='float64')
+    inicio, fin = cftime.date2num([cftime.datetime(anyo, 1, 1, calendar=calendario),
+                                   cftime.datetime(anyo + 1, 1, 1, calendar=calendario)], unidades, calendar=calendario)
+    return inicio + 0.5 + np.arange(int(round(fin - inicio)), dtype='float64')
+
+
+def escribir_archivo_sintetico(ruta, conjunto, anyoini, anyofin, semilla=0):
+    '''
+    Se escribe un archivo sintético con los años dados de un conjunto de
+    datos. Los datos se escriben año por año, de modo que la memoria no
+    depende de la cantidad de años del archivo.
+    '''
+    import numpy as np
+    import netCDF4
+
+    resolucion = float(conjunto['resolucion'])
+    lat = np.arange(-90 + resolucion / 2, 90, resolucion)
+    lon = np.arange(resolucion / 2, 360, resolucion)
+    unidades_tiempo = 'days since 1850-01-01'
+    unidades, media, amplitud = variables_sinteticas.get(conjunto['variable'], ('1', 0.0, 1.0))
+    base = (media + amplitud * np.cos(np.deg2rad(lat))[:, None] * np.cos(np.deg2rad(2 * lon))[None, :]).astype('float32')
+    generador = np.random.default_rng(semilla)
+
+    with netCDF4.Dataset(ruta, 'w', format='NETCDF4') as nc:
+        nc.setncatts({'source_id': conjunto['modelo'], 'experiment_id': conjunto['escenario'],
+                      'variable_id': conjunto['variable'], 'frequency': conjunto['frecuencia'],
+                      'table_id': tablas[conjunto['frecuencia']], 'grid_label': 'gn', 'variant_label': 'r1i1p1f1',
+                      'title': 'Datos sintéticos para pruebas de descarga'})
+        nc.createDimension('time', None)
+        nc.createDimension('lat', lat.size)
+        nc.createDimension('lon', lon.size)
+        tiempo = nc.createVariable('time', 'f8', ('time',))
+        tiempo.setncatts({'units': unidades_tiempo, 'calendar': conjunto['calendario'], 'axis': 'T',
+                          'standard_name': 'time'})
+        for nombre, valores, atributos in (('lat', lat, {'units': 'degrees_north', 'standard_name': 'latitude', 'axis': 'Y'}),
+                                           ('lon', lon, {'units': 'degrees_east', 'standard_name': 'longitude', 'axis': 'X'})):
+            coordenada = nc.createVariable(nombre, 'f8', (nombre,))
+            coordenada.setncatts(atributos)
+            coordenada[:] = valores
+        variable = nc.createVariable(conjunto['variable'], 'f4', ('time', 'lat', 'lon'), fill_value=np.float32(1e20),
+                                     chunksizes=(1, lat.size, lon.size))
+        variable.setncatts({'units': unidades, 'missing_value': np.float32(1e20)})
+
+        posicion = 0
+        for anyo in range(anyoini, anyofin + 1):
+            tiempos = _tiempos_anyo(anyo, conjunto['frecuencia'], conjunto['calendario'], unidades_tiempo)
+            ciclo = np.sin(2 * np.pi * np.arange(tiempos.size) / tiempos.size).astype('float32')
+            valores = base[None] * (1 + 0.05 * ciclo[:, None, None])
+            valores += (0.01 * amplitud * generador.standard_normal(valores.shape)).astype('float32')
+            tiempo[posicion:posicion + tiempos.size] = tiempos
+            variable[posicion:posicion + tiempos.size] = np.abs(valores) if conjunto['variable'] == 'pr' else valores
+            posicion += tiempos.size
+
+
+def generar_datos(carpeta, conjuntos, semilla=0):
+    '''
+    Se generan en "carpeta" los archivos sintéticos de los conjuntos de datos
+    dados (cada uno un diccionario con 'modelo', 'escenario', 'variable',
+    'frecuencia', 'calendario', 'resolucion', 'anyoini', 'anyofin' y
+    'anyos_por_archivo') y se guarda su catálogo. Si la carpeta ya tiene el
+    catálogo de los mismos conjuntos, no se vuelven a generar. Se devuelve el
+    catálogo.
+    '''
+    carpeta = Path(carpeta)
+    ruta_catalogo = carpeta / nombre_catalogo
+    pedidos = json.loads(json.dumps(conjuntos))
+    try:
+        with open(ruta_catalogo, encoding='utf-8') as f:
+            catalogo = json.load(f)
+        if (catalogo.get('pedidos') == pedidos and catalogo.get('semilla') == semilla
+                and all((carpeta / archivo['filename']).exists()
+                        for conjunto in catalogo['conjuntos'] for archivo in conjunto['archivos'])):
+            return catalogo
+    except (OSError, ValueError, KeyError):
+        pass
+
+    carpeta.mkdir(parents=True, exist_ok=True)
+    catalogo = {'pedidos': pedidos, 'semilla': semilla, 'conjuntos': []}
+    for posicion, conjunto in enumerate(pedidos):
+        archivos = []
+        for anyoini in range(conjunto['anyoini'], conjunto['anyofin'] + 1, conjunto['anyos_por_archivo']):
+            anyofin = min(anyoini + conjunto['anyos_por_archivo'] - 1, conjunto['anyofin'])
+            nombre = nombre_archivo_cmip6(conjunto, anyoini, anyofin)
+            print("Se genera el archivo sintético "+nombre)
+            escribir_atomico(carpeta / nombre,
+                             lambda temporal: escribir_archivo_sintetico(temporal, conjunto, anyoini, anyofin,
+                                                                         semilla + posicion * 1000 + anyoini))
+            archivos.append({'filename': nombre, 'size': (carpeta / nombre).stat().st_size,
+                             'checksum': suma_archivo(carpeta / nombre)})
+        catalogo['conjuntos'].append(dict(conjunto, dataset_id=id_conjunto(conjunto), archivos=archivos))
+
+    def escribir(temporal):
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(catalogo, f, indent=1)
+
+    escribir_atomico(ruta_catalogo, escribir)
+    return catalogo
+
+
+def _leer_restriccion(restriccion):
+    '''
+    Se interpreta la restricción de una petición DAP2 (por ejemplo
+    "tas[0:1:11][10:1:20][5:1:30],time[0:1:11]") y se devuelve
+    {variable: [slice, ...]} (una lista vacía si se pide la variable completa).
+    '''
+    pedidas = {}
+    for parte in filter(None, restriccion.split('&')[0].split(',')):
+        encontrado = re.match(r'^([^\[\]]+)((?:\[[0-9:]*\])*)$', parte.strip())
+        if encontrado is None:
+            raise ValueError("Restricción no válida: "+parte)
+        cortes = []
+        for indice in re.findall(r'\[([0-9:]*)\]', encontrado.group(2)):
+            numeros = [int(numero) for numero in indice.split(':')]
+            if len(numeros) == 1:
+                numeros = [numeros[0], 1, numeros[0]]
+            elif len(numeros) == 2:
+                numeros = [numeros[0], 1, numeros[1]]
+            cortes.append(slice(numeros[0], numeros[2] + 1, numeros[1]))
+        pedidas[encontrado.group(1).split('.')[-1]] = cortes
+    return pedidas
+
+
+def _tipo_dap(variable):
+    clave = getattr(variable.dtype, 'str', '')[1:]
+    return tipos_dap.get(clave)
+
+
+def _variables_pedidas(nc, restriccion):
+    '''
+    Se devuelve la lista de (nombre, variable, cortes, forma) de las
+    variables pedidas en la restricción (todas si no hay restricción).
+    '''
+    pedidas = _leer_restriccion(restriccion) if restriccion else None
+    if pedidas is not None:
+        desconocidas = [nombre for nombre in pedidas if nombre not in nc.variables]
+        if desconocidas:
+            raise KeyError(', '.join(desconocidas))
+    seleccion = []
+    for nombre, variable in nc.variables.items():
+        if _tipo_dap(variable) is None or (pedidas is not None and nombre not in pedidas):
+            continue
+        cortes = (pedidas or {}).get(nombre) or [slice(None)] * variable.ndim
+        if len(cortes) != variable.ndim:
+            raise ValueError("La restricción de "+nombre+" no tiene "+str(variable.ndim)+" dimensiones")
+        forma = [len(range(tamanyo)[corte]) for tamanyo, corte in zip(variable.shape, cortes)]
+        seleccion.append((nombre, variable, cortes, forma))
+    return seleccion
+
+
+def dds(nc, nombre_archivo, restriccion=''):
+    '''
+    Se arma la descripción de la estructura (DDS) de un archivo abierto, o de
+    la parte pedida en la restricción.
+    '''
+    lineas = ['Dataset {\n']
+    for nombre, variable, _, forma in _variables_pedidas(nc, restriccion):
+        dimensiones = ''.join('['+dim+' = '+str(tamanyo)+']' for dim, tamanyo in zip(variable.dimensions, forma))
+        lineas.append('    '+_tipo_dap(variable)[0]+' '+nombre+dimensiones+';\n')
+    lineas.append('} '+nombre_archivo+';\n')
+    return ''.join(lineas)
+
+
+def _atributo_das(nombre, valor):
+    import numpy as np
+
+    if isinstance(valor, str):
+        return 'String '+nombre+' "'+valor.replace('\\', '\\\\').replace('"', '\\"')+'";'
+    valores = np.atleast_1d(valor)
+    tipo = tipos_dap.get(valores.dtype.str[1:])
+    if tipo is None:
+        return _atributo_das(nombre, str(valor))
+    formato = '.9g' if valores.dtype.str[1:] == 'f4' else '.17g'
+    textos = [format(x, formato) if valores.dtype.kind == 'f' else str(int(x)) for x in valores]
+    return tipo[0]+' '+nombre+' '+', '.join(textos)+';'
+
+
+def das(nc):
+    '''
+    Se arma la descripción de los atributos (DAS) de un archivo abierto.
+    '''
+    lineas = ['Attributes {\n']
+    grupos = [(nombre, variable, variable.ncattrs()) for nombre, variable in nc.variables.items()
+              if _tipo_dap(variable) is not None]
+    grupos.append(('NC_GLOBAL', nc, nc.ncattrs()))
+    for nombre, objeto, atributos in grupos:
+        lineas.append('    '+nombre+' {\n')
+        for atributo in atributos:
+            lineas.append('        '+_atributo_das(atributo, objeto.getncattr(atributo))+'\n')
+        lineas.append('    }\n')
+    ilimitadas = [nombre for nombre, dimension in nc.dimensions.items() if dimension.isunlimited()]
+    if ilimitadas:
+        lineas.append('    DODS_EXTRA {\n        String Unlimited_Dimension "'+ilimitadas[0]+'";\n    }\n')
+    lineas.append('}\n')
+    return ''.join(lineas)
+
+
+def respuesta_opendap(ruta, nombre_archivo, sufijo, restriccion=''):
+    '''
+    Se arma la respuesta OPeNDAP ('das', 'dds' o 'dods') de un archivo.
+    '''
+    import netCDF4
+
+    with netCDF4.Dataset(ruta) as nc:
+        nc.set_auto_maskandscale(False)
+        if sufijo == 'das':
+            return das(nc).encode('utf-8')
+        if sufijo == 'dds':
+            return dds(nc, nombre_archivo, restriccion).encode('utf-8')
+        return datos_dods(nc, nombre_archivo, restriccion)
+
+
+def datos_dods(nc, nombre_archivo, restriccion=''):
+    '''
+    Se arma la respuesta de datos (DODS) de la parte pedida de un archivo
+    abierto: su DDS seguida de los valores en formato XDR.
+    '''
+    import numpy as np
+
+    partes = [dds(nc, nombre_archivo, restriccion).encode('utf-8'), b'Data:\n']
+    for _, variable, cortes, forma in _variables_pedidas(nc, restriccion):
+        valores = np.ascontiguousarray(variable[tuple(cortes)], dtype=_tipo_dap(variable)[1])
+        if forma:
+            partes.append(np.array([valores.size, valores.size], dtype='>u4').tobytes())
+        partes.append(valores.tobytes())
+    return b''.join(partes)
+
+
+class ServidorESGFLocal:
+    '''
+    Servidor local que reemplaza a un nodo ESGF (ver el inicio del módulo)
+    con los datos sintéticos de "carpeta" (ver "generar_datos"). Las
+    condiciones simuladas se pueden cambiar con el servidor en marcha:
+    "latencia" (segundos de espera antes de cada respuesta), "ancho_banda"
+    (bytes por segundo de cada conexión, None sin límite), "fraccion_fallos"
+    (fracción de las peticiones de datos que responden con el error 503) y
+    "fraccion_fallos_busqueda" (lo mismo para las búsquedas) y
+    "archivos_caidos" (nombres de los archivos cuyas peticiones de datos
+    fallan siempre). En "contadores" se llevan las peticiones, los bytes
+    enviados y los fallos simulados.
+    "nodo" es el nombre con el que el servidor aparece en las direcciones
+    (por ejemplo 'localhost', para simular un segundo nodo de datos en la
+    misma máquina), y las búsquedas incluyen también, como réplicas, los
+    conjuntos de datos de los servidores de "replicas". Con "rangos" en False
+    el servidor no acepta peticiones por rango de los archivos completos
+    (responde siempre el archivo entero).
+    Las lecturas de los archivos (librería netCDF) se hacen de a una en un
+    proceso aparte: la librería no admite usarse desde varios hilos a la vez,
+    y los clientes del mismo proceso leen y escriben sus archivos NetCDF con
+    xarray (con sus propios candados, que tienen tomados mientras esperan la
+    respuesta del servidor).
+    '''
+
+    def __init__(self, carpeta, puerto=0, latencia=0.0, ancho_banda=None, fraccion_fallos=0.0,
+                 fraccion_fallos_busqueda=0.0, semilla=0, archivos_caidos=None, nodo='127.0.0.1', replicas=None,
+                 rangos=True):
+        self.carpeta = Path(carpeta)
+        with open(self.carpeta / nombre_catalogo, encoding='utf-8') as f:
+            self.catalogo = json.load(f)
+        self.latencia = latencia
+        self.ancho_banda = ancho_banda
+        self.fraccion_fallos = fraccion_fallos
+        self.fraccion_fallos_busqueda = fraccion_fallos_busqueda
+        self.semilla = semilla
+        self.archivos_caidos = set(archivos_caidos or [])
+        self.replicas = list(replicas or [])
+        self.rangos = rangos
+        self._candado = threading.Lock()
+        self.reiniciar_contadores()
+        self._servidor = ThreadingHTTPServer(('127.0.0.1', puerto), _ManejadorESGF)
+        self._servidor.daemon_threads = True
+        self._servidor.esgf = self
+        self.nodo = nodo
+        self.direccion = 'http://'+self.nodo+':'+str(self._servidor.server_address[1])
+        self._hilo = None
+        self._lector = None
+
+    @property
+    def url_busqueda(self):
+        '''
+        Dirección del nodo de búsqueda (la que se pone en "nodos_esgf").
+        '''
+        return self.direccion+'/esg-search'
+
+    def iniciar(self):
+        self._lector = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+        self._lector.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *error):
+        self.detener()
+
+    def reiniciar_contadores(self):
+        '''
+        Se ponen en cero los contadores y se reinicia la secuencia de fallos
+        simulados (así los mismos pedidos fallan en cada medición).
+        '''
+        with self._candado:
+            self._azar = random.Random(self.semilla)
+            self.contadores = {'peticiones': 0, 'bytes_enviados': 0, 'fallos_simulados': 0}
+
+    def contar(self, clave, cantidad=1):
+        with self._candado:
+            self.contadores[clave] += cantidad
+
+    def falla(self, busqueda=False, nombre=None):
+        '''
+        Se decide si la petición actual (del archivo "nombre", si es una
+        petición de datos) debe fallar: siempre si el archivo está caído, y
+        si no al azar.
+        '''
+        fraccion = self.fraccion_fallos_busqueda if busqueda else self.fraccion_fallos
+        with self._candado:
+            fallo = nombre in self.archivos_caidos or (fraccion > 0 and self._azar.random() < fraccion)
+        if fallo:
+            self.contar('fallos_simulados')
+        return fallo
+
+    def ruta_archivo(self, nombre):
+        '''
+        Se devuelve la ruta de un archivo del catálogo (KeyError si no existe).
+        '''
+        for conjunto in self.catalogo['conjuntos']:
+            for archivo in conjunto['archivos']:
+                if archivo['filename'] == nombre:
+                    return self.carpeta / nombre
+        raise KeyError(nombre)
+
+    def _documento_conjunto(self, conjunto, replica=False):
+        return {
+            'id': conjunto['dataset_id']+'|'+self.nodo,
+            'instance_id': conjunto['dataset_id'],
+            'master_id': conjunto['dataset_id'].rsplit('.', 1)[0],
+            'version': '20200101',
+            'replica': replica,
+            'latest': True,
+            'type': 'Dataset',
+            'project': ['CMIP6'],
+            'source_id': [conjunto['modelo']],
+            'experiment_id': [conjunto['escenario']],
+            'variable': [conjunto['variable']],
+            'frequency': [conjunto['frecuencia']],
+            'variant_label': ['r1i1p1f1'],
+            'number_of_files': len(conjunto['archivos']),
+            'size': sum(archivo['size'] for archivo in conjunto['archivos']),
+            'data_node': self.nodo,
+            'index_node': self.nodo,
+        }
+
+    def _documento_archivo(self, conjunto, archivo, replica=False):
+        nombre = archivo['filename']
+        return {
+            'id': conjunto['dataset_id']+'.'+nombre+'|'+self.nodo,
+            'dataset_id': conjunto['dataset_id']+'|'+self.nodo,
+            'title': nombre,
+            'type': 'File',
+            'size': archivo['size'],
+            'checksum': [archivo['checksum']],
+            'checksum_type': ['SHA256'],
+            'version': '20200101',
+            'replica': replica,
+            'data_node': self.nodo,
+            'index_node': self.nodo,
+            'url': [self.direccion+'/thredds/fileServer/'+nombre+'|application/netcdf|HTTPServer',
+                    self.direccion+'/thredds/dodsC/'+nombre+'.html|application/opendap-html|OPENDAP'],
+        }
+
+    def buscar(self, consulta):
+        '''
+        Se responde una búsqueda del índice ESGF ("consulta" es el diccionario
+        de parámetros de la petición, con una lista de valores por parámetro).
+        '''
+        valores = {
+            'project': lambda conjunto: 'CMIP6',
+            'source_id': lambda conjunto: conjunto['modelo'],
+            'experiment_id': lambda conjunto: conjunto['escenario'],
+            'variable': lambda conjunto: conjunto['variable'],
+            'variable_id': lambda conjunto: conjunto['variable'],
+            'frequency': lambda conjunto: conjunto['frecuencia'],
+            'variant_label': lambda conjunto: 'r1i1p1f1',
+        }
+        tipo = consulta.get('type', ['Dataset'])[0]
+        limite = int(consulta.get('limit', ['10'])[0])
+        desplazamiento = int(consulta.get('offset', ['0'])[0])
+        pedidos = set(consulta.get('dataset_id', []))
+
+        def filtrar(servidor):
+            return [conjunto for conjunto in servidor.catalogo['conjuntos']
+                    if all(valor(conjunto) in consulta[clave] for clave, valor in valores.items() if clave in consulta)]
+
+        # Los conjuntos de los servidores de "replicas" se responden como réplicas
+        # (cada uno con su nodo de datos), después de los de este servidor
+        documentos = []
+        for servidor in [self] + self.replicas:
+            replica = servidor is not self
+            if tipo == 'File':
+                documentos += [servidor._documento_archivo(conjunto, archivo, replica) for conjunto in filtrar(servidor)
+                               if not pedidos or conjunto['dataset_id']+'|'+servidor.nodo in pedidos
+                               or (not replica and conjunto['dataset_id'] in pedidos)
+                               for archivo in conjunto['archivos']]
+            else:
+                documentos += [servidor._documento_conjunto(conjunto, replica) for conjunto in filtrar(servidor)]
+        conjuntos = filtrar(self)
+
+        facetas = {}
+        for clave in ('source_id', 'experiment_id', 'variable', 'frequency'):
+            cuentas = {}
+            for conjunto in conjuntos:
+                cuentas[valores[clave](conjunto)] = cuentas.get(valores[clave](conjunto), 0) + 1
+            facetas[clave] = [elemento for par in cuentas.items() for elemento in par]
+        puerto = str(self._servidor.server_address[1])
+        return {
+            'responseHeader': {'status': 0, 'params': {'shards': self.nodo+':'+puerto+'/solr', 'type': tipo}},
+            'response': {'numFound': len(documentos), 'start': desplazamiento,
+                         'docs': documentos[desplazamiento:desplazamiento + limite]},
+            'facet_counts': {'facet_fields': facetas},
+        }
+
+
+class _ManejadorESGF(BaseHTTPRequestHandler):
+    '''
+    Atiende las peticiones del servidor local (ver "ServidorESGFLocal").
+    '''
+
+    protocol_version = 'HTTP/1.1'
+    prefijo_opendap = '/thredds/dodsC/'
+    prefijo_http = '/thredds/fileServer/'
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self._atender(cuerpo=False)
+
+    def do_GET(self):
+        self._atender(cuerpo=True)
+
+    def _atender(self, cuerpo):
+        esgf = self.server.esgf
+        partes = urlparse(self.path)
+        ruta = unquote(partes.path)
+        esgf.contar('peticiones')
+        if esgf.latencia:
+            time.sleep(esgf.latencia)
+        try:
+            if ruta.rstrip('/') == '/esg-search/search':
+                if esgf.falla(busqueda=True):
+                    return self._error(503, "Fallo simulado del nodo de búsqueda")
+                respuesta = esgf.buscar(parse_qs(partes.query, keep_blank_values=True))
+                return self._responder(200, json.dumps(respuesta).encode('utf-8'), 'application/json', cuerpo)
+            if ruta.startswith(self.prefijo_opendap):
+                if esgf.falla(nombre=ruta[len(self.prefijo_opendap):].rpartition('.')[0]):
+                    return self._error(503, "Fallo simulado del servidor OPeNDAP")
+                return self._opendap(ruta[len(self.prefijo_opendap):], unquote(partes.query), cuerpo)
+            if ruta.startswith(self.prefijo_http):
+                if esgf.falla(nombre=ruta[len(self.prefijo_http):]):
+                    return self._error(503, "Fallo simulado del servidor HTTP")
+                return self._archivo(esgf.ruta_archivo(ruta[len(self.prefijo_http):]), cuerpo)
+            return self._error(404, "No existe "+ruta)
+        except KeyError as e:
+            return self._error(404, "No existe "+str(e))
+        except ValueError as e:
+            return self._error(400, str(e))
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _opendap(self, relativa, restriccion, cuerpo):
+        nombre, _, sufijo = relativa.rpartition('.')
+        if sufijo not in ('dds', 'das', 'dods'):
+            return self._error(404, "Respuesta OPeNDAP no disponible: "+relativa)
+        esgf = self.server.esgf
+        contenido = esgf._lector.submit(respuesta_opendap, esgf.ruta_archivo(nombre), nombre, sufijo,
+                                        restriccion).result()
+        tipo = 'application/octet-stream' if sufijo == 'dods' else 'text/plain'
+        descripcion = {'das': 'dods_das', 'dds': 'dods_dds', 'dods': 'dods_data'}[sufijo]
+        return self._responder(200, contenido, tipo, cuerpo, {'Content-Description': descripcion,
+                                                              'XDODS-Server': 'dods/3.2'})
+
+    def _archivo(self, ruta, cuerpo):
+        tamanyo = ruta.stat().st_size
+        inicio, fin, estado = 0, tamanyo - 1, 200
+        rango = self.headers.get('Range') if self.server.esgf.rangos else None
+        if rango:
+            encontrado = re.match(r'^bytes=(\d*)-(\d*)$', rango.strip())
+            if encontrado is None or not (encontrado.group(1) or encontrado.group(2)):
+                return self._error(416, "Rango no válido: "+rango)
+            if encontrado.group(1):
+                inicio = int(encontrado.group(1))
+                fin = min(int(encontrado.group(2)), tamanyo - 1) if encontrado.group(2) else tamanyo - 1
+            else:
+                inicio = max(tamanyo - int(encontrado.group(2)), 0)
+            if inicio > fin:
+                return self._error(416, "Rango fuera del archivo: "+rango)
+            estado = 206
+        cabeceras = {'Accept-Ranges': 'bytes' if self.server.esgf.rangos else 'none'}
+        if estado == 206:
+            cabeceras['Content-Range'] = 'bytes '+str(inicio)+'-'+str(fin)+'/'+str(tamanyo)
+        with open(ruta, 'rb') as f:
+            f.seek(inicio)
+            self._responder(estado, f, 'application/x-netcdf', cuerpo, cabeceras, fin - inicio + 1)
+
+    def _error(self, estado, mensaje):
+        self._responder(estado, mensaje.encode('utf-8'), 'text/plain; charset=utf-8', self.command != 'HEAD')
+
+    def _responder(self, estado, contenido, tipo, cuerpo, cabeceras=None, tamanyo=None):
+        '''
+        Se envía la respuesta ("contenido" son bytes o un archivo abierto del
+        que se leen "tamanyo" bytes), en pedazos y respetando el ancho de
+        banda simulado.
+        '''
+        esgf = self.server.esgf
+        tamanyo = len(contenido) if tamanyo is None else tamanyo
+        self.send_response(estado)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(tamanyo))
+        for clave, valor in (cabeceras or {}).items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        if not cuerpo:
+            return
+        enviados = 0
+        while enviados < tamanyo:
+            cantidad = min(tamanyo_envio, tamanyo - enviados)
+            if isinstance(contenido, bytes):
+                pedazo = contenido[enviados:enviados + cantidad]
+            else:
+                pedazo = contenido.read(cantidad)
+                if not pedazo:
+                    break
+            inicio = time.perf_counter()
+            self.wfile.write(pedazo)
+            enviados += len(pedazo)
+            esgf.contar('bytes_enviados', len(pedazo))
+            if esgf.ancho_banda:
+                espera = len(pedazo) / esgf.ancho_banda - (time.perf_counter() - inicio)
+                if espera > 0:
+                    time.sleep(espera)
@@ -0,0 +1,97 @@
+'''
+El siguiente código fuente forma parte de los desarrollos realizados
+por el "Centro Internacional para la Investigación del Fenómeno de El Niño
+(CIIFEN)" dentro del Proyecto ENANDES “Mejora de la capacidad de adaptación
+de las comunidades andinas a través de los servicios climáticos”
+
+La reproducción, publicación, divulgación, copia o traspaso de parte
+del mismo o su totalidad está totalmente prohibida y restringida.
+Para ello se debe tener autorización formal previa de parte
+de las instituciones participantes del proyecto:
+- Centro Internacional para la Investigación del Fenómeno de El Niño (CIIFEN)
+- Instituto de Hidrología, Meteorología y Estudios Ambientales (IDEAM) - Colombia
+- Servicio Nacional de Meteorología e Hidrología del Perú (SENAMHI)
+- Dirección Meteorológica de Chile
+
+Este módulo dibuja el mapa de la zona (o las zonas) para la cual se descargarán
+los datos. El mapa se puede mostrar en una ventana (que detiene el proceso
+hasta que se cierra) o guardar en un archivo PNG, lo que permite revisar la
+zona cuando el script corre sin pantalla (por ejemplo, desde cron o en un
+servidor de cálculo).
+
+matplotlib y cartopy se importan solo al dibujar el mapa, de modo que las
+ejecuciones que no lo piden no pagan el tiempo de cargarlos.
+'''
+
+# ---NO MODIFICAR ESTAS LÍNEAS---
+import os
+from descargaCMIP6 import zona_union
+# ---FIN LIBRERÍAS NECESARIAS---
+
+
+def letra_coordenada(valor, negativa, positiva):
+    '''
+    Se devuelve la letra que acompaña una coordenada en el título del mapa
+    ('' si es 0, "negativa" si es menor que 0 y "positiva" si es mayor).
+    '''
+    if valor == 0:
+        return ''
+    return negativa if valor < 0 else positiva
+
+
+def titulo_zona(nombrezona, lonmin, lonmax, latmin, latmax):
+    '''
+    Se arma el título del mapa con el nombre y los límites de la zona.
+    '''
+    return ('Nombre Zona: '+nombrezona+' (Longitud: '+str(abs(lonmin))+letra_coordenada(lonmin, 'W', 'E')
+            +' a '+str(abs(lonmax))+letra_coordenada(lonmax, 'W', 'E')+', Latitud: '+str(abs(latmin))
+            +letra_coordenada(latmin, 'S', 'N')+' a '+str(abs(latmax))+letra_coordenada(latmax, 'S', 'N')+')\n')
+
+
+def hay_pantalla():
+    '''
+    Se revisa si hay una pantalla en la que mostrar una ventana.
+    '''
+    return os.name == 'nt' or bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+
+
+def dibujar_zonas(zonas, archivo_png=None, mostrar=True):
+    '''
+    Se dibuja el mapa de las zonas {nombrezona: (lonmin, lonmax, latmin, latmax)};
+    la primera es la zona principal y da el título del mapa. Si hay varias zonas
+    se dibuja el contorno de cada una.
+    Si se da "archivo_png" el mapa se guarda en ese archivo, y si "mostrar" es
+    True se muestra en una ventana (solo si hay pantalla; si no, se avisa y se sigue).
+    '''
+    mostrar = mostrar and hay_pantalla()
+    if not mostrar and archivo_png is None:
+        print("No hay pantalla para mostrar el mapa de la zona; se continúa sin mostrarlo")
+        return
+
+    import matplotlib
+    if not mostrar:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import cartopy.crs as ccrs
+    import cartopy.feature as cf
+
+    nombrezona, (lonmin, lonmax, latmin, latmax) = next(iter(zonas.items()))
+    figura = plt.figure()
+    ax = plt.axes(projection=ccrs.Mercator())
+    ax.set_extent(list(zona_union(zonas)))
+    if len(zonas) > 1:
+        for nombre, (zlonmin, zlonmax, zlatmin, zlatmax) in zonas.items():
+            ax.plot([zlonmin, zlonmax, zlonmax, zlonmin, zlonmin], [zlatmin, zlatmin, zlatmax, zlatmax, zlatmin], transform=ccrs.PlateCarree())
+            ax.text(zlonmin, zlatmax, nombre, transform=ccrs.PlateCarree(), va='bottom')
+    ax.gridlines(draw_labels=True, dms=True, x_inline=False, y_inline=False)
+    ax.add_feature(cf.COASTLINE)
+    ax.add_feature(cf.LAND)
+    ax.add_feature(cf.BORDERS)
+    plt.title(titulo_zona(nombrezona, lonmin, lonmax, latmin, latmax))
+    if archivo_png is not None:
+        figura.savefig(archivo_png, dpi=150, bbox_inches='tight')
+        print("Se guardó el mapa de la zona en "+str(archivo_png))
+    if mostrar:
+        plt.annotate('(Para continuar el proceso cierre esta ventana)', (0,0), (-20, -20), xycoords='axes fraction', textcoords='offset points', va='top')
+        plt.show()
+    plt.close(figura)